@@ -1,14 +1,19 @@
 from langchain_core.messages import AnyMessage, HumanMessage
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from langchain_core.tools import tool
 from utils.utils import llm
+from utils.handle import stream_graph_answer, create_batched_retrieval_node
+from utils.retrieval import retrieve_groups, collection_version
+from utils.semantic_cache import stream_with_cache
+from utils.context_packing import PackingConfig, record_llm_call
 from langchain_core.messages import SystemMessage
 import functools
-import chromadb
 import logging
+import asyncio
+import time
+import os
 
 from typing import Annotated
 from typing_extensions import TypedDict
@@ -16,25 +21,27 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+COLLECTION_PATH = r"Agent\AssistantTeacher\DBv"
+COLLECTION_NAME = "STAT_NON_PARAM_v"
+# contextes envoyés au LLM : sélectionnés parmi les candidats de la recherche dans un budget de tokens (réglable par variable d'environnement)
+CONTEXT_PACKING = PackingConfig("AssistantTeacher", token_budget=int(os.environ.get("TEACHER_CONTEXT_TOKENS", 800)))
+
 @tool
-def retrieve_context(query: str):
-    """Utilise les contextes les plus liés à la question de l'utilisateur pour y répondre. Ces contextes sont extraits des cours de l'université vectorisés."""
-    ef = SentenceTransformerEmbeddingFunction(model_name="intfloat/multilingual-e5-large")
-    collection_path = r"Agent\AssistantTeacher\DBv"
-    collection_name = "STAT_NON_PARAM_v"
-    client = chromadb.PersistentClient(path=collection_path)
-    collection = client.get_collection(name=collection_name, embedding_function=ef)
-    contexts = collection.query(
-            query_texts=[query],
-            n_results=1
-            )
-    # Ajoute les entêtes "Contexte 1:", etc.
-    context_list = contexts['documents'][0]
-    formatted_context = "\n\n".join(
-        f"Contexte {i + 1} :\n{doc}" for i, doc in enumerate(context_list)
-    )
-    logging.info(f"[CONTEXT] pour query='{query}' :\n{formatted_context}")
-    return formatted_context
+async def retrieve_context(queries: list[str]):
+    """Utilise les contextes les plus liés à la question de l'utilisateur pour y répondre. Ces contextes sont extraits des cours de l'université vectorisés. Passe la question dans `queries` ; si elle porte sur plusieurs points, passe une sous-question par point dans la même liste."""
+    # requête Chroma et encodage synchrones : exécutés dans un thread
+    return (await asyncio.to_thread(query_contexts_groups, [queries]))[0]
+
+
+def query_contexts_groups(groups: list[list[str]]) -> list[str]:
+    # recherche hybride dense (Chroma) + lexicale (BM25) de toutes les requêtes en un seul lot, modèle et collection partagés par le processus
+    contexts = retrieve_groups(COLLECTION_PATH, COLLECTION_NAME, groups, CONTEXT_PACKING)
+    logging.info(f"[CONTEXT] pour queries={groups} :\n" + "\n\n".join(contexts))
+    return contexts
+
+
+def query_contexts(query: str) -> str:
+    return query_contexts_groups([[query]])[0]
 
 
 # ---- State
@@ -44,7 +51,7 @@ class StateTeacher(TypedDict):
 # ---- Agent
 class AssistantTeacher():
 
-    def __init__(self):
+    def __init__(self, pre_retrieval: bool = False):
         
         self.system_prompt = r"""
         Tu es un assistant spécialisé dans l'enseignement des statistiques.
@@ -61,28 +68,76 @@ class AssistantTeacher():
             - Formulation claire et structurée de la réponse avec toutes les expressions mathématiques encadrées de $$ pour un rendu LaTeX.
         Ne reformule pas ou n'invente pas les concepts si tu ne les trouves pas dans les extraits retournés. Dis simplement que l'information est absente du contexte.
         """
+        self.pre_retrieval_prompt = r"""
+        Tu es un assistant spécialisé dans l'enseignement des statistiques.
+        Les extraits des cours liés à la question ont déjà été récupérés : ils figurent à la fin de ce message.
+        Utilise-les pour formuler une réponse pédagogique, précise, bien structurée et rigoureuse. Si ces extraits ne suffisent pas, appelle le tool retrieve_context avec une question plus précise.
+        Ces contextes peuvent contenir des formules mathématiques, écrites en LaTeX entre '$' ou '$$'. Lorsque tu cites ces formules garde ce format LaTeX.
+        Tu dois IMPÉRATIVEMENT écrire toutes les formules mathématiques et variables en LaTeX y compris les notations simples, comme par exemple $X_i$, $f(x)$, ou $$P(A \cap B) = P(A) \cdot P(B|A)$$.
+        Ne reformule pas ou n'invente pas les concepts si tu ne les trouves pas dans les extraits. Dis simplement que l'information est absente du contexte.
+        """
+        # mode pre-retrieval : les contextes sont récupérés directement sur la question, avant l'unique appel au LLM
+        self.pre_retrieval = pre_retrieval
+        if pre_retrieval:
+            self.system_prompt = self.pre_retrieval_prompt
         
         tools = [retrieve_context]
         self.tooled_llm = llm.bind_tools(tools)
         
         builder = StateGraph(StateTeacher)
         builder.add_node("tool_calling_llm", functools.partial(self.tool_calling_llm))
-        builder.add_node("tools", ToolNode(tools))
+        # les appels parallèles à retrieve_context sont regroupés en une seule recherche
+        builder.add_node("tools", create_batched_retrieval_node(query_contexts_groups))
 
-        builder.add_edge(START, "tool_calling_llm")
+        if pre_retrieval:
+            builder.add_node("pre_retrieve", self.pre_retrieve)
+            builder.add_edge(START, "pre_retrieve")
+            builder.add_edge("pre_retrieve", "tool_calling_llm")
+        else:
+            builder.add_edge(START, "tool_calling_llm")
         builder.add_conditional_edges("tool_calling_llm", tools_condition)
         builder.add_edge("tools", "tool_calling_llm")
 
         self.graph = builder.compile()
 
+    async def pre_retrieve(self, state: StateTeacher) -> StateTeacher:
+        # ajoute les contextes récupérés sur la question au message système (même id : le message est remplacé)
+        system, question = state["messages"][0], state["messages"][-1]
+        contexts = await asyncio.to_thread(query_contexts, question.content)
+        return {"messages": [SystemMessage(content=f"{system.content}\n\nExtraits récupérés :\n{contexts}", id=system.id)]}
+
     async def tool_calling_llm(self, state: StateTeacher) -> StateTeacher:
+        start = time.perf_counter()
         result = await self.tooled_llm.ainvoke(state["messages"])
+        record_llm_call("AssistantTeacher", result, time.perf_counter() - start)
         return {"messages": state["messages"] + [result]}
 
-    async def ask_AssistantTeacher(self, query: str):
-        response = await self.graph.ainvoke({"messages": [SystemMessage(content=self.system_prompt), HumanMessage(content=query)]})
+    def initial_messages(self, query: str, history: str = "") -> list:
+        # historique budgété de la session (GlobalStateManager.get_context) ajouté au message système
+        system = self.system_prompt + (f"\n\nHistorique de la conversation :\n{history}" if history else "")
+        return [SystemMessage(content=system), HumanMessage(content=query)]
+
+    async def ask_AssistantTeacher(self, query: str, history: str = ""):
+        response = await self.graph.ainvoke({"messages": self.initial_messages(query, history)})
         return response
 
+    def stream_AssistantTeacher(self, query: str, history: str = ""):
+        """
+        Version streamée (et mise en cache) de ask_AssistantTeacher : générateur asynchrone des tokens de la réponse finale.
+        arg : history (contexte de la conversation pour une question de suivi ; la réponse n'est alors pas mise en cache)
+        """
+        tokens = stream_graph_answer(
+            self.graph,
+            {"messages": self.initial_messages(query, history)},
+            nodes=("tool_calling_llm",),
+            tool_nodes=("tool_calling_llm",),
+            final_answer=lambda state: state["messages"][-1].content,
+        )
+        if history:
+            return tokens
+        # les questions quasi identiques déjà traitées (toutes sessions confondues) sont servies depuis le cache
+        return stream_with_cache("AssistantTeacher", query, collection_version(COLLECTION_PATH, COLLECTION_NAME), tokens)
+
 # ---- TESTS ----
 queries = [
     "Quelle est la différence fondamentale entre probabilité et statistique ?",
@@ -105,4 +160,21 @@ queries = [
     "Dans quel type de données appliquerait-on un estimateur par histogramme ?",
     "Quels sont les risques d'un mauvais choix de h ?",
     "Quelle méthode pourrait être plus adaptée que l'histogramme pour une estimation de densité lisse ?"
-]
\ No newline at end of file
+]
+# # délai avant le premier token, sans et avec streaming
+# import asyncio
+# from utils.benchmark import compare_ttft
+# agent = AssistantTeacher()
+# print(asyncio.run(compare_ttft(agent.ask_AssistantTeacher, agent.stream_AssistantTeacher, queries[:5])))
+# # taux de hit et latence économisée par le cache sémantique
+# from utils.semantic_cache import SemanticCache
+# print(SemanticCache.stats("AssistantTeacher"))
+# # latence et tokens : appel obligatoire au tool vs pre-retrieval
+# from utils.benchmark import compare_modes
+# print(asyncio.run(compare_modes({"tool_call": AssistantTeacher().ask_AssistantTeacher, "pre_retrieval": AssistantTeacher(pre_retrieval=True).ask_AssistantTeacher}, queries)))
+
+# # tokens de contexte / de prompt et latences par appel, pour régler CONTEXT_PACKING.token_budget
+# from utils.context_packing import context_stats
+# for q in queries[:10]:
+#     asyncio.run(AssistantTeacher().ask_AssistantTeacher(q))
+# print(context_stats("AssistantTeacher"))
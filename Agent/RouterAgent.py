@@ -1,14 +1,146 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from utils.utils import llm
+from utils.utils import llm, query_embedding_function
+from utils.benchmark import summarize, timed, atimed
+from Agent.router_examples import labelled_questions, benchmark_questions
+import numpy as np
+import unicodedata
+import asyncio
+import logging
+import re
+
+INTENTS = ("cours", "emploi_du_temps", "UVSQ", "autre")
+
+# ---- Étage 1 : mots-clés (sur le texte normalisé, sans accents ni majuscules)
+# termes non ambigus : un seul suffit à décider de l'intention
+keyword_patterns = {
+    "cours": [
+        r"\bestimateurs?\b", r"\bdensites?\b", r"\bhistogrammes?\b", r"\bvariance\b", r"\bdemonstration\b",
+        r"\btheoremes?\b", r"\bnon parametrique\b", r"\bprobabilites?\b", r"\besperance\b", r"\$",
+    ],
+    "emploi_du_temps": [
+        r"\bemploi du temps\b", r"\bedt\b", r"\bprochain cours\b", r"\bai-je cours\b", r"\bj'ai cours\b",
+    ],
+    "UVSQ": [
+        r"\buvsq\b", r"\bcrous\b", r"\bsuaps\b", r"\bmaison de l'etudiant\b", r"\bhandicap\b",
+        r"\bharcelement\b", r"\balumni\b", r"\bparis-saclay\b", r"\bbourses?\b",
+    ],
+    "autre": [
+        r"^(bonjour|bonsoir|salut|hello|coucou|merci|bonne (journee|soiree))\b",
+    ],
+}
+# termes fréquents mais ambigus ("demain", "a quelle heure", "mise en place") : un indice seulement, l'étage
+# d'embedding doit trouver la même intention pour se passer du LLM
+hint_patterns = {
+    "cours": [
+        r"\bbiais\b", r"\bconvergence\b", r"\bdefinition\b", r"\bformules?\b", r"\bnoyau\b", r"\bmise\b",
+    ],
+    "emploi_du_temps": [
+        r"\bplanning\b", r"\bhoraires?\b", r"\ba quelle heure\b", r"\bquelle salle\b", r"\bdemain\b",
+        r"\bcette semaine\b", r"\bsemaine prochaine\b", r"\b(lundi|mardi|mercredi|jeudi|vendredi|samedi)\b",
+        r"\b(cm|td|tp)\b",
+    ],
+    "UVSQ": [
+        r"\bcampus\b", r"\blogements?\b", r"\bbibliotheque\b", r"\bcafeterias?\b", r"\binscriptions?\b",
+    ],
+}
+compiled_patterns = {
+    intent: [re.compile(p) for p in patterns] for intent, patterns in keyword_patterns.items()
+}
+compiled_hints = {
+    intent: [re.compile(p) for p in patterns] for intent, patterns in hint_patterns.items()
+}
+
+
+def normalize_question(question: str) -> str:
+    """
+    Met en minuscules et retire les accents pour rendre les mots-clés robustes à la saisie.
+    """
+    text = question.lower().replace("’", "'")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def _matched(text: str, patterns: dict) -> list:
+    return [intent for intent, compiled in patterns.items() if any(p.search(text) for p in compiled)]
+
+
+def keyword_intent(question: str):
+    """
+    return : l'intention si une seule catégorie est détectée par les termes non ambigus (et aucune autre par les
+             indices), None sinon
+    """
+    text = normalize_question(question)
+    matched = _matched(text, compiled_patterns)
+    # les salutations ne sont concluantes que pour des messages courts
+    if "autre" in matched and len(text.split()) > 6:
+        matched.remove("autre")
+    hints = _matched(text, compiled_hints)
+    if len(matched) == 1 and all(intent == matched[0] for intent in hints):
+        return matched[0]
+    return None
+
+
+def keyword_hint(question: str):
+    """
+    return : l'intention si une seule catégorie est suggérée par les termes ambigus, None sinon
+    """
+    hints = _matched(normalize_question(question), compiled_hints)
+    return hints[0] if len(hints) == 1 else None
+
+
+def clean_label(label: str) -> str:
+    label = label.strip().strip("'\"`. ")
+    return label if label in INTENTS else "autre"
+
+
+# ---- Étage 2 : centroïdes d'embedding
+class CentroidClassifier:
+    def __init__(self, examples=labelled_questions, min_similarity: float = 0.80, min_margin: float = 0.02):
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.labels = None
+        self.centroids = None
+
+    @staticmethod
+    def _embed(texts: list[str]) -> np.ndarray:
+        vectors = np.asarray(query_embedding_function(texts), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def fit(self):
+        vectors = self._embed([q for q, _ in self.examples])
+        self.labels = [intent for intent in INTENTS if any(l == intent for _, l in self.examples)]
+        centroids = []
+        for intent in self.labels:
+            rows = [i for i, (_, l) in enumerate(self.examples) if l == intent]
+            centroid = vectors[rows].mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self.centroids = np.vstack(centroids)
+        return self
+
+    def predict(self, question: str):
+        """
+        return : (intention, confiance) ou (None, confiance) si la marge entre les deux meilleures catégories est trop faible
+        """
+        if self.centroids is None:
+            self.fit()
+        similarities = self.centroids @ self._embed([question])[0]
+        order = np.argsort(similarities)[::-1]
+        best, second = similarities[order[0]], similarities[order[1]]
+        margin = float(best - second)
+        if best >= self.min_similarity and margin >= self.min_margin:
+            return self.labels[order[0]], margin
+        return None, margin
+
 
 class RouterAgent:
-    def __init__(self):
+    def __init__(self, use_local_routing: bool = True):
         intent_prompt = ChatPromptTemplate.from_messages([
-            ("system", """Tu es un classificateur d'intention. Tu dois classer la question dans l'une de ces catégories : 
+            ("system", """Tu es un classificateur d'intention. Tu dois classer la question dans l'une de ces catégories :
              - 'cours' si elle concerne une notion académique comme une définition, démonstration, formule, etc.
              - 'emploi_du_temps' si elle concerne une organisation de planning, horaires, ou cours programmés
-             - 'UVSQ' si elle concerne des informations sur l'Université de Versailles Saint-Quentin en Yvelines (UVSQ) qui peuvent être disponibles 
+             - 'UVSQ' si elle concerne des informations sur l'Université de Versailles Saint-Quentin en Yvelines (UVSQ) qui peuvent être disponibles
              sur son site internet
              - 'autre' si elle ne concerne aucune des 3 thématiques précédentes.
              Réponds uniquement par 'cours' ou 'emploi_du_temps' ou 'UVSQ' ou 'autre'."""),
@@ -16,6 +148,65 @@ class RouterAgent:
         ])
 
         self.intent_classifier = intent_prompt | llm | StrOutputParser()
+        self.use_local_routing = use_local_routing
+        self.centroid_classifier = CentroidClassifier()
+
+    def local_route(self, question: str):
+        """
+        Routage local : termes non ambigus, puis centroïdes d'embedding (qui doivent confirmer un indice des termes ambigus).
+        return : (intention ou None, étage ayant décidé)
+        """
+        intent = keyword_intent(question)
+        if intent is not None:
+            return intent, "keywords"
+        hint = keyword_hint(question)
+        intent, margin = self.centroid_classifier.predict(question)
+        if intent is not None and hint in (None, intent):
+            return intent, "keywords+embedding" if hint else "embedding"
+        if intent is not None:
+            logging.info(f"[ROUTER] mots-clés ('{hint}') et embedding ('{intent}') en désaccord, repli sur le LLM")
+        else:
+            logging.info(f"[ROUTER] confiance trop faible (marge={margin:.3f}), repli sur le LLM")
+        return None, "llm"
 
     async def ask_router(self, question: str) -> str:
-        return self.intent_classifier.invoke({"question": question})
+        if self.use_local_routing:
+            # l'encodage de la question est synchrone (CPU) : exécuté dans un thread
+            intent, stage = await asyncio.to_thread(self.local_route, question)
+            if intent is not None:
+                logging.info(f"[ROUTER] intention '{intent}' décidée par l'étage {stage}")
+                return intent
+        return clean_label(await self.intent_classifier.ainvoke({"question": question}))
+
+
+async def benchmark_router(questions=benchmark_questions):
+    """
+    Compare précision et latence du routeur local (avec repli LLM) et du routeur LLM seul.
+    """
+    router = RouterAgent()
+    router.centroid_classifier.fit()     # le calcul des centroïdes n'est pas compté dans la latence
+
+    local, llm_only = {"ok": 0, "latencies": [], "llm_calls": 0}, {"ok": 0, "latencies": []}
+    for question, expected in questions:
+        (predicted, stage), duration = timed(router.local_route, question)
+        if predicted is None:
+            label, llm_duration = await atimed(router.intent_classifier.ainvoke({"question": question}))
+            predicted, duration = clean_label(label), duration + llm_duration
+            local["llm_calls"] += 1
+        local["ok"] += predicted == expected
+        local["latencies"].append(duration)
+
+        predicted, duration = await atimed(router.intent_classifier.ainvoke({"question": question}))
+        llm_only["ok"] += clean_label(predicted) == expected
+        llm_only["latencies"].append(duration)
+
+    n = len(questions)
+    return {
+        "local": {"accuracy": local["ok"] / n, "llm_fallback_rate": local["llm_calls"] / n, **summarize(local["latencies"])},
+        "llm": {"accuracy": llm_only["ok"] / n, **summarize(llm_only["latencies"])},
+    }
+
+
+# ---- TESTS ----
+# import asyncio
+# print(asyncio.run(benchmark_router()))
@@ -1,24 +1,62 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from langchain_community.utilities import SQLDatabase
 from typing_extensions import TypedDict
 from pydantic import BaseModel, Field
 from utils.utils import llm
+from utils.handle import stream_graph_answer
+from utils.benchmark import summarize, atimed
+from utils import metrics
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from sqlalchemy import text
-from Agent.SmartPlanner.prompts import relevance_prompt, text_to_sql_prompt
+from Agent.SmartPlanner.prompts import relevance_prompt, text_to_sql_prompt, relevance_and_sql_prompt
+from Agent.SmartPlanner.fast_path import match, render
+from Agent.SmartPlanner.interval_index import IntervalIndex, match as match_interval, answer as answer_interval
+from Agent.SmartPlanner.sql_cache import SQLResultCache, cache_key
+from Agent.SmartPlanner.sql_engine import ReadOnlyPool, MAX_ROWS
+from Agent.SmartPlanner.result_rendering import compact_result, is_tabular, markdown_table
+from Agent.SmartPlanner.sql_exemplars import ExemplarStore, record_question, question_stats
 from langgraph.graph import StateGraph, END
 
 from dotenv import load_dotenv
+import functools
+import asyncio
+import random
+import os
 
 load_dotenv()
 
 # === BDD setup ===
 DB_PATH = r"Agent\SmartPlanner\data\edt.db"
 engine = create_engine(f"sqlite:///{DB_PATH}")
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 db = SQLDatabase(engine)
+# exécution des requêtes : connexions en lecture seule partagées, budget de temps et nombre de lignes plafonné
+read_only_pool = ReadOnlyPool(DB_PATH)
+# résultats SQL et réponses rédigées, partagés par toutes les sessions et vidés quand edt.db change
+sql_cache = SQLResultCache(DB_PATH)
+# couples (question, SQL) qui ont réussi, ajoutés en few-shot au prompt de génération SQL
+sql_exemplars = ExemplarStore()
+
+
+@functools.lru_cache(maxsize=1)
+def _course_names(db_version: float) -> tuple:
+    result = read_only_pool.execute("SELECT DISTINCT cours FROM evenement WHERE cours != ''", max_rows=10_000)
+    return tuple(row["cours"] for row in result.rows)
+
+
+def course_names() -> tuple:
+    # noms des cours en base, relus quand edt.db est modifiée
+    return _course_names(os.path.getmtime(DB_PATH))
+
+
+@functools.lru_cache(maxsize=1)
+def _interval_index(db_version: float) -> IntervalIndex:
+    with read_only_pool.connection() as connection:
+        return IntervalIndex.from_connection(connection)
+
+
+def interval_index() -> IntervalIndex:
+    # séances par salle et par formation, reconstruites quand edt.db est modifiée
+    return _interval_index(os.path.getmtime(DB_PATH))
 
 class StatePlanner(TypedDict):
     question: str
@@ -28,6 +66,13 @@ class StatePlanner(TypedDict):
     attempts: int
     relevance: str
     sql_error: bool
+    truncated: bool
+    template: str
+    cache_key: str
+    cached_answer: str
+    original_question: str
+    llm_calls: int
+    exemplars: bool
 
 class ConvertToSQL(BaseModel):
     sql_query: str = Field(
@@ -39,15 +84,38 @@ class CheckRelevance(BaseModel):
         description="Indique si la question est liée au schéma de la base de données. 'relevant' ou 'not_relevant'."
     )
 
+class RelevanceAndSQL(BaseModel):
+    relevance: str = Field(
+        description="Indique si la question est liée au schéma de la base de données. 'relevant' ou 'not_relevant'."
+    )
+    sql_query: str = Field(
+        description="The SQL query corresponding to the user's natural language question, empty if not_relevant."
+    )
+
 class RewrittenQuestion(BaseModel):
     question: str = Field(description="The rewritten question.")
 
 class SmartPlanner:
-    def __init__(self):
+    def __init__(self, fast_path: bool = True, sql_mode: str = "sequential", exemplars: bool = True):
+        """
+        arg : fast_path (templates SQL sans LLM pour les questions fréquentes),
+              exemplars (exemples few-shot (question, SQL réussi) dans le prompt de génération SQL),
+              sql_mode ("sequential" : pertinence puis SQL, deux appels successifs ;
+                        "single" : un seul appel structuré renvoie la pertinence et le SQL ;
+                        "concurrent" : les deux appels en parallèle, le SQL est ignoré si la question n'est pas pertinente)
+        """
+        self.exemplars = exemplars
         workflow = StateGraph(StatePlanner)
+        first_step = {
+            "sequential": self.check_relevance,
+            "single": self.check_relevance_and_convert,
+            "concurrent": self.check_relevance_and_convert_concurrently,
+        }[sql_mode]
 
         # nodes
-        workflow.add_node("check_relevance", self.check_relevance)
+        if fast_path:
+            workflow.add_node("fast_path", self.fast_path)
+        workflow.add_node("check_relevance", first_step)
         workflow.add_node("convert_to_sql", self.convert_nl_to_sql)
         workflow.add_node("execute_sql", self.execute_sql)
         workflow.add_node("generate_human_readable_answer", self.generate_human_readable_answer)
@@ -60,7 +128,8 @@ class SmartPlanner:
             "check_relevance",
             self.relevance_router,
             {
-                "convert_to_sql": "convert_to_sql",
+                # hors mode séquentiel, le SQL est déjà généré avec la pertinence
+                "convert_to_sql": "convert_to_sql" if sql_mode == "sequential" else "execute_sql",
                 "generate_funny_response": "generate_funny_response",
             },
         )
@@ -84,12 +153,72 @@ class SmartPlanner:
         workflow.add_edge("generate_human_readable_answer", END)
         workflow.add_edge("generate_funny_response", END)
         workflow.add_edge("end_max_iterations", END)
-        workflow.set_entry_point("check_relevance")
+        if fast_path:
+            # questions fréquentes : requête SQL fixe sans LLM, sinon repli sur le pipeline LLM
+            workflow.add_conditional_edges(
+                "fast_path",
+                self.fast_path_router,
+                {
+                    "check_relevance": "check_relevance",
+                    END: END,
+                },
+            )
+            workflow.set_entry_point("fast_path")
+        else:
+            workflow.set_entry_point("check_relevance")
 
         self.graph = workflow.compile()
 
     @staticmethod
-    def check_relevance(state: StatePlanner):
+    async def fast_path(state: StatePlanner):
+        # reconnaissance locale et requête SQLite synchrones : exécutées dans un thread
+        return await asyncio.to_thread(SmartPlanner.fast_path_sync, state)
+
+    @staticmethod
+    def fast_path_sync(state: StatePlanner):
+        question = state["question"]
+        # salles libres, créneaux libres, chevauchements : réponse depuis l'index d'intervalles
+        try:
+            index = interval_index()
+            interval_query = match_interval(question, sorted(set(index.buildings.values())), rooms=list(index.rooms))
+            if interval_query is not None:
+                state["query_result"], state["template"] = answer_interval(index, interval_query), interval_query.kind
+                print(f"Interval index answered '{interval_query.kind}': {state['query_result']}")
+                return state
+        except Exception as e:
+            print(f"Interval index unavailable: {str(e)}")
+        try:
+            fast_query = match(question, course_names())
+        except Exception as e:
+            print(f"Fast path unavailable: {str(e)}")
+            fast_query = None
+        if fast_query is None:
+            print(f"No fast path template for: {question}")
+            return state
+        key = cache_key(fast_query.sql, fast_query.params)
+        cached = sql_cache.get(key)
+        if cached is not None:
+            state["query_rows"], state["sql_query"] = cached.rows, fast_query.sql
+            state["query_result"], state["template"] = cached.answer, fast_query.template
+            print(f"Fast path template '{fast_query.template}' answered from cache")
+            return state
+        try:
+            result = read_only_pool.execute(fast_query.sql, fast_query.params)
+            state["query_rows"], state["truncated"] = result.rows, result.truncated
+            state["sql_query"] = fast_query.sql
+            state["query_result"] = render(fast_query, state["query_rows"])
+            if result.truncated:
+                state["query_result"] += f"\n(seules les {MAX_ROWS} premières séances sont affichées)"
+            state["template"] = fast_query.template
+            sql_cache.put(key, state["query_rows"], state["query_result"])
+            sql_cache.set_answer(key, state["query_result"])
+            print(f"Fast path template '{fast_query.template}' answered: {state['query_result']}")
+        except Exception as e:
+            print(f"Error executing fast path query, falling back to the LLM: {str(e)}")
+        return state
+
+    @staticmethod
+    async def check_relevance(state: StatePlanner):
         question = state["question"]
         print(f"Checking relevance of the question: {question}")
         human = f"Question: {question}"
@@ -101,71 +230,117 @@ class SmartPlanner:
         )
         structured_llm = llm.with_structured_output(CheckRelevance)
         relevance_checker = check_prompt | structured_llm
-        relevance = relevance_checker.invoke({})
+        relevance = await relevance_checker.ainvoke({})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
         state["relevance"] = relevance.relevance
         print(f"Relevance determined: {state['relevance']}")
         return state
 
     @staticmethod
-    def convert_nl_to_sql(state: StatePlanner):
+    async def convert_nl_to_sql(state: StatePlanner):
         question = state["question"]
         print(f"Converting question to SQL for user: {question}")
+        exemplars = sql_exemplars.prompt_block(question) if state.get("exemplars", True) else ""
         convert_prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", text_to_sql_prompt),
+                ("system", text_to_sql_prompt + exemplars),
                 ("human", "Question: {question}"),
             ]
         )
         structured_llm = llm.with_structured_output(ConvertToSQL)
         sql_generator = convert_prompt | structured_llm
-        result = sql_generator.invoke({"question": question})
+        result = await sql_generator.ainvoke({"question": question})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
         state["sql_query"] = result.sql_query
         print(f"Generated SQL query: {state['sql_query']}")
         return state
 
     @staticmethod
-    def execute_sql(state: StatePlanner):
+    async def check_relevance_and_convert(state: StatePlanner):
+        question = state["question"]
+        print(f"Checking relevance and converting to SQL in one call: {question}")
+        exemplars = sql_exemplars.prompt_block(question) if state.get("exemplars", True) else ""
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", relevance_and_sql_prompt + exemplars),
+                ("human", "Question: {question}"),
+            ]
+        )
+        structured_llm = llm.with_structured_output(RelevanceAndSQL)
+        result = await (prompt | structured_llm).ainvoke({"question": question})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
+        state["relevance"] = result.relevance
+        state["sql_query"] = result.sql_query
+        print(f"Relevance determined: {state['relevance']}, generated SQL query: {state['sql_query']}")
+        return state
+
+    @staticmethod
+    async def check_relevance_and_convert_concurrently(state: StatePlanner):
+        # les deux appels partent en même temps : une seule attente LLM au lieu de deux
+        relevance_state, sql_state = await asyncio.gather(
+            SmartPlanner.check_relevance(dict(state)),
+            SmartPlanner.convert_nl_to_sql(dict(state)),
+        )
+        state["relevance"] = relevance_state["relevance"]
+        state["sql_query"] = sql_state["sql_query"] if state["relevance"].lower() == "relevant" else ""
+        state["llm_calls"] = state.get("llm_calls", 0) + 2
+        return state
+
+    @staticmethod
+    async def execute_sql(state: StatePlanner):
+        # la session SQLAlchemy est synchrone : exécutée dans un thread pour ne pas bloquer la boucle d'événements
+        return await asyncio.to_thread(SmartPlanner.execute_sql_sync, state)
+
+    @staticmethod
+    def execute_sql_sync(state: StatePlanner):
         sql_query = state["sql_query"].strip()
-        session = SessionLocal()
+        key = cache_key(sql_query)
+        state["cache_key"] = key or ""
+        state["cached_answer"] = ""
+        cached = sql_cache.get(key) if key and sql_query.lower().startswith("select") else None
+        if cached is not None:
+            state["query_rows"], state["query_result"] = cached.rows, cached.result
+            state["cached_answer"] = cached.answer
+            state["sql_error"] = False
+            print("SQL SELECT query answered from cache.")
+            return state
         print(f"Executing SQL query: {sql_query}")
         try:
-            result = session.execute(text(sql_query))
-            if sql_query.lower().startswith("select"):
-                rows = result.fetchall()
-                columns = result.keys()
-                if rows:
-                    header = ", ".join(columns)
-                    state["query_rows"] = [dict(zip(columns, row)) for row in rows]
-                    # Format the result for readability
-                    data = "\n".join([
-                        ", ".join([f"{col}: {row[col]}" for col in columns]) for row in state["query_rows"]
-                        ])
-                    formatted_result = f"{header}\n{data}"
-                else:
-                    state["query_rows"] = []
-                    formatted_result = "No results found."
-                state["query_result"] = formatted_result
-                state["sql_error"] = False
-                print("SQL SELECT query executed successfully.")
-            else:
-                session.commit()
-                state["query_result"] = "The action has been successfully completed."
-                state["sql_error"] = False
-                print("SQL command executed successfully.")
+            # lecture seule : les requêtes de modification, multiples ou trop coûteuses sont refusées
+            result = read_only_pool.execute(sql_query)
+            state["query_rows"], state["truncated"] = result.rows, result.truncated
+            # forme compacte pour le prompt : colonnes répétées écrites une fois, groupement par jour, résumé des gros résultats
+            formatted_result = compact_result(result.rows, result.truncated)
+            state["query_result"] = formatted_result
+            state["sql_error"] = False
+            if key:
+                sql_cache.put(key, state["query_rows"], formatted_result)
+            print(f"SQL SELECT query executed successfully in {result.duration:.3f}s.")
         except Exception as e:
             state["query_result"] = f"Error executing SQL query: {str(e)}"
             state["sql_error"] = True
             print(f"Error executing SQL query: {str(e)}")
-        finally:
-            session.close()
         return state
 
     @staticmethod
-    def generate_human_readable_answer(state: StatePlanner):
+    async def generate_human_readable_answer(state: StatePlanner):
         sql = state["sql_query"]
         result = state["query_result"]
         query_rows = state.get("query_rows", [])
         sql_error = state.get("sql_error", False)
+        if state.get("cached_answer") and not sql_error:
+            # même requête déjà rédigée : pas d'appel au LLM
+            state["query_result"] = state["cached_answer"]
+            print("Human-readable answer served from cache.")
+            record_question(state, sql_exemplars)
+            return state
+        if not sql_error and is_tabular(query_rows):
+            # résultat tabulaire : rendu directement en tableau markdown, sans appel au LLM
+            state["query_result"] = markdown_table(query_rows, state.get("truncated", False))
+            sql_cache.set_answer(state.get("cache_key", ""), state["query_result"])
+            print("Tabular result rendered as a markdown table.")
+            record_question(state, sql_exemplars)
+            return state
         print("Generating a human-readable answer.")
         system = """
         Tu es un assistant intelligent qui convertit les résultats d'une requête SQL en réponse claire et naturelle.
@@ -223,38 +398,18 @@ class SmartPlanner:
                 ]
             )
         human_response = generate_prompt | llm | StrOutputParser()
-        answer = human_response.invoke({})
+        answer = await human_response.ainvoke({})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
+        record_question(state, sql_exemplars)
         state["query_result"] = answer
+        if not sql_error and sql.lower().startswith("select"):
+            sql_cache.set_answer(state.get("cache_key", ""), answer)
         print("Generated human-readable answer.")
         print(state)
         return state
     
     @staticmethod
-    def regenerate_query(state: StatePlanner):
-        question = state["question"]
-        print("Regenerating the SQL query by rewriting the question.")
-        system = """Tu es un assistant qui reformule une question originale pour permettre des requêtes SQL plus précises. Assure-toi que tous les détails nécessaires sont préservés afin de récupérer des données complètes et précises.
-        """
-        rewrite_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system),
-                (
-                    "human",
-                    f"Question originale : {question}\nReformule la question pour permettre des requêtes SQL plus précises, en veillant à ce que tous les détails nécessaires soient préservés.",
-                ),
-            ]
-        )
-        llm = llm
-        structured_llm = llm.with_structured_output(RewrittenQuestion)
-        rewriter = rewrite_prompt | structured_llm
-        rewritten = rewriter.invoke({})
-        state["question"] = rewritten.question
-        state["attempts"] += 1
-        print(f"Rewritten question: {state['question']}")
-        return state
-    
-    @staticmethod
-    def regenerate_query(state: StatePlanner):
+    async def regenerate_query(state: StatePlanner):
         question = state["question"]
         print("Regenerating the SQL query by rewriting the question.")
         system = """Tu es un assistant qui reformule une question originale pour permettre des requêtes SQL plus précises. Assure-toi que tous les détails nécessaires, tels que les jointures de tables, sont préservés afin de récupérer des données complètes et précises. Si la date et l'heure ne sont pas précisées dans une question qui concerne une période précise ajoute les. Par exemple pour "A quelle heure ai-je cours demain ?", tu dois transformer le "demain" en une date précise.
@@ -270,14 +425,15 @@ class SmartPlanner:
         )
         structured_llm = llm.with_structured_output(RewrittenQuestion)
         rewriter = rewrite_prompt | structured_llm
-        rewritten = rewriter.invoke({})
+        rewritten = await rewriter.ainvoke({})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
         state["question"] = rewritten.question
         state["attempts"] += 1
         print(f"Rewritten question: {state['question']}")
         return state
     
     @staticmethod
-    def generate_funny_response(state: StatePlanner):
+    async def generate_funny_response(state: StatePlanner):
         question = state["question"]
         print("Generating a funny response for an unrelated question.")
         system = """Tu es un assistant charmant et drôle qui répond de manière ludique à une question hors sujet. L'utilisateur est censé poser des questions relatives sur l'emploi du temps de son université."""
@@ -288,7 +444,8 @@ class SmartPlanner:
             ]
         )
         funny_response = funny_prompt | llm | StrOutputParser()
-        message = funny_response.invoke({})
+        message = await funny_response.ainvoke({})
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
         state["query_result"] = message
         print("Generated funny response.")
         return state
@@ -296,9 +453,17 @@ class SmartPlanner:
     @staticmethod   
     def end_max_iterations(state: StatePlanner):
         state["query_result"] = "Veuillez réessayer"
+        record_question(state)
         print("Maximum attempts reached. Ending the workflow.")
         return state
 
+    @staticmethod
+    def fast_path_router(state: StatePlanner):
+        if state.get("template"):
+            return END
+        else:
+            return "check_relevance"
+
     @staticmethod  
     def relevance_router(state: StatePlanner):
         if state["relevance"].lower() == "relevant":
@@ -319,9 +484,13 @@ class SmartPlanner:
         else:
             return "regenerate_query"
     
-    async def ask_SmartPlanner(self, query: str):
-        return await self.graph.ainvoke({
+    @staticmethod
+    def initial_state(query: str, exemplars: bool = True) -> StatePlanner:
+        return {
             "question": query,
+            "original_question": query,
+            "llm_calls": 0,
+            "exemplars": exemplars,
             "query_rows": [],
             "query_result": "",
             "sql_query": "",
@@ -329,7 +498,113 @@ class SmartPlanner:
             "attempts": 0,
             "relevance": "",
             "sql_error": False,
-            })
+            "truncated": False,
+            "template": "",
+            "cache_key": "",
+            "cached_answer": "",
+            }
+
+    async def ask_SmartPlanner(self, query: str):
+        return await self.graph.ainvoke(self.initial_state(query, self.exemplars))
+
+    def stream_SmartPlanner(self, query: str):
+        """
+        Version streamée de ask_SmartPlanner : seuls les noeuds qui rédigent la réponse finale sont streamés.
+        """
+        return stream_graph_answer(
+            self.graph,
+            self.initial_state(query, self.exemplars),
+            nodes=("generate_human_readable_answer", "generate_funny_response"),
+            final_answer=lambda state: state["query_result"],
+        )
+
+async def benchmark_sql_modes(questions: list[tuple], modes=("sequential", "single", "concurrent")) -> dict:
+    """
+    A/B des modes de génération SQL (chemin rapide désactivé pour mesurer le pipeline LLM) sur des questions étiquetées
+    (question, "relevant" ou "not_relevant") : exactitude de la pertinence, part des requêtes SQL valides du premier coup,
+    accord des lignes renvoyées avec le premier mode (référence) et latence de bout en bout.
+    """
+    reference, results = {}, {}
+    for mode in modes:
+        planner = SmartPlanner(fast_path=False, sql_mode=mode)
+        relevance_ok, first_try, agree, n_relevant, latencies = 0, 0, 0, 0, []
+        for question, expected in questions:
+            state, duration = await atimed(planner.ask_SmartPlanner(question))
+            latencies.append(duration)
+            relevance_ok += state["relevance"].lower() == expected
+            if expected == "relevant":
+                n_relevant += 1
+                first_try += state["attempts"] == 0 and not state["sql_error"] and state["relevance"].lower() == "relevant"
+                rows = sorted(map(str, state.get("query_rows") or []))
+                reference.setdefault(question, rows)
+                agree += reference[question] == rows
+        results[mode] = {
+            "relevance_accuracy": relevance_ok / len(questions),
+            "sql_first_try_rate": first_try / n_relevant if n_relevant else 0.0,
+            f"rows_agreement_with_{modes[0]}": agree / n_relevant if n_relevant else 0.0,
+            **summarize(latencies),
+        }
+    return results
+
+
+async def benchmark_sql_cache(questions: list[str], n_requests: int = 200, seed: int = 0) -> dict:
+    """
+    Rejoue un journal de questions réaliste (n_requests tirages suivant une loi de Zipf : quelques questions posées
+    très souvent, beaucoup rarement) avec et sans cache SQL : taux de hit et latence de bout en bout.
+    """
+    rng = random.Random(seed)
+    log = rng.choices(questions, weights=[1 / (rank + 1) for rank in range(len(questions))], k=n_requests)
+    planner = SmartPlanner()
+    results = {}
+    for mode in ("without_cache", "with_cache"):
+        sql_cache.invalidate()
+        metrics.reset("sql_cache.")
+        latencies = []
+        for question in log:
+            if mode == "without_cache":
+                sql_cache.invalidate()
+            _, duration = await atimed(planner.ask_SmartPlanner(question))
+            latencies.append(duration)
+        results[mode] = {**SQLResultCache.stats(), **summarize(latencies)}
+    return results
+
+
+
+async def benchmark_exemplars(questions: list[str], n_train: int = None, seed: int = 0, mode: str = "sequential") -> dict:
+    """
+    Questions d'emploi du temps passées par le pipeline LLM (chemin rapide et cache SQL désactivés), avant et après
+    les exemples few-shot : taux de réussite au premier essai et nombre moyen d'appels LLM par question.
+    Les exemples sont appris sur une moitié des questions (n_train) et mesurés sur l'autre, dans un fichier temporaire.
+    """
+    import tempfile
+    global sql_exemplars
+    rng = random.Random(seed)
+    questions = rng.sample(questions, len(questions))
+    n_train = n_train if n_train is not None else len(questions) // 2
+    train, test = questions[:n_train], questions[n_train:]
+    kept = sql_exemplars
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            sql_exemplars = ExemplarStore(os.path.join(folder, "sql_exemplars.json"))
+            for name, use_exemplars, learn in (("without_exemplars", False, []), ("with_exemplars", True, train)):
+                planner = SmartPlanner(fast_path=False, sql_mode=mode, exemplars=use_exemplars)
+                for question in learn:
+                    sql_cache.invalidate()
+                    await planner.ask_SmartPlanner(question)
+                metrics.reset("smartplanner.")
+                metrics.reset("sql_exemplars.")
+                latencies = []
+                for question in test:
+                    sql_cache.invalidate()
+                    _, duration = await atimed(planner.ask_SmartPlanner(question))
+                    latencies.append(duration)
+                results[name] = {**question_stats(), "exemplars": len(sql_exemplars.entries), **summarize(latencies)}
+            # écrit avant la suppression du dossier temporaire (rien ne reste à écrire à l'arrêt)
+            sql_exemplars.flush()
+    finally:
+        sql_exemplars = kept
+    return results
 
 # -------------- TESTS
 # import asyncio
@@ -337,6 +612,9 @@ class SmartPlanner:
 #     instance = SmartPlanner()
 #     result = asyncio.run(instance.ask_SmartPlanner("Qui est Mathis Jacq ?"))
 #     print(result)
+# # N sessions simultanées doivent durer environ autant qu'une seule (ratio proche de 1)
+# from utils.benchmark import concurrency_check
+# print(asyncio.run(concurrency_check(SmartPlanner().ask_SmartPlanner, ["A quelle heure ai-je cours demain ?"], n_sessions=10)))
 # import datetime
 # agent = SmartPlanner()
 # exemple_state = {
@@ -346,6 +624,46 @@ class SmartPlanner:
 #     "query_rows": [],
 #     "attempts": 0,
 #     "relevance": "",
-#     "sql_error": False
+#     "sql_error": False,
+#     "template": ""
 # }
 # agent.regenerate_query(exemple_state)['question']
+
+# # chemin rapide : couverture sur le jeu étiqueté, puis latence avec et sans chemin rapide
+# from Agent.SmartPlanner.fast_path import benchmark_coverage, benchmark_latency
+# from Agent.SmartPlanner.fast_path_examples import fast_path_questions
+# print(benchmark_coverage(fast_path_questions, course_names()))
+# covered = [q for q, template in fast_path_questions if template]
+# print(asyncio.run(benchmark_latency(covered, SmartPlanner().ask_SmartPlanner, SmartPlanner(fast_path=False).ask_SmartPlanner)))
+
+# # A/B : pertinence puis SQL (deux appels) vs un seul appel structuré vs deux appels en parallèle
+# from Agent.SmartPlanner.fast_path_examples import relevance_questions
+# print(asyncio.run(benchmark_sql_modes(relevance_questions)))
+
+# # cache SQL : journal de questions rejoué avec et sans cache
+# from Agent.SmartPlanner.fast_path_examples import relevance_questions
+# print(asyncio.run(benchmark_sql_cache([q for q, r in relevance_questions if r == "relevant"], n_requests=200)))
+# print(SQLResultCache.stats())
+
+# # exemples few-shot (question, SQL réussi) : réussite au premier essai et appels LLM par question, avant / après
+# from Agent.SmartPlanner.fast_path_examples import relevance_questions
+# print(asyncio.run(benchmark_exemplars([q for q, r in relevance_questions if r == "relevant"])))
+# print(question_stats())
+
+# # exécution SQL sous N sessions simultanées : session par requête vs pool en lecture seule
+# from Agent.SmartPlanner.sql_engine import benchmark_concurrent
+# print(benchmark_concurrent(DB_PATH, ["SELECT * FROM edt WHERE formation LIKE '%ISADS%' AND debut >= '2025-03-01' AND debut < '2025-04-01'", "SELECT * FROM edt"], n_sessions=20))
+
+# # salles libres et chevauchements : index d'intervalles contre les requêtes SQL équivalentes
+# from Agent.SmartPlanner.interval_index import benchmark_interval_index
+# print(benchmark_interval_index(DB_PATH))
+# print(benchmark_interval_index())     # emploi du temps synthétique de 3 ans et 12 formations
+# from Agent.SmartPlanner.fast_path_examples import interval_questions
+# print([(q, getattr(match_interval(q), "kind", None), kind) for q, kind in interval_questions])
+
+# # tokens du résultat dans le prompt (ancien format vs compact) sur des requêtes à gros résultats
+# from Agent.SmartPlanner.result_rendering import benchmark_rendering
+# print(asyncio.run(benchmark_rendering(DB_PATH, [
+#     "SELECT * FROM edt WHERE formation LIKE '%ISADS%' AND debut >= '2025-03-01' AND debut < '2025-04-01' ORDER BY debut",
+#     "SELECT cours, type, debut, fin, salle, batiment FROM edt WHERE debut >= '2025-01-01' ORDER BY debut",
+# ], with_llm=True)))
@@ -1,18 +1,81 @@
 import json
 import re
 import html
-import pandas as pd
-from langchain_community.utilities import SQLDatabase
 import os
-from sqlalchemy import create_engine, Column, String
-from sqlalchemy.orm import Session, declarative_base
-from sqlalchemy import create_engine
+import sys
+import time
+import hashlib
+import sqlite3
+import random
+import tempfile
+import shutil
 from datetime import datetime
+from Agent.SmartPlanner.edt_schema import (create_schema, insert_events, delete_events, migrate_legacy, data_version,
+                                           set_meta, synthetic_timetable)
 
-with open(r'Agent\SmartPlanner\data\edt.json', "r", encoding="utf-8") as f:
-    edt = json.load(f)
+# Synchronisation de edt.db avec l'export de l'emploi du temps (edt.json) :
+# - l'export est lu au fil de l'eau (tableau JSON décodé événement par événement)
+# - chaque événement a une clé stable (identifiant de l'export, sinon hash de son créneau et de sa description)
+#   et une empreinte de son contenu nettoyé
+# - seuls les événements nouveaux ou modifiés sont écrits (executemany par lots), les disparus sont supprimés,
+#   le tout dans une seule transaction
+# - meta.data_version est incrémentée quand la base change (le cache SQL de SmartPlanner se vide sur la date
+#   de modification de edt.db, qui ne bouge pas si rien n'a changé)
 
-def clean_event(i, event):
+EXPORT_PATH = r"Agent\SmartPlanner\data\edt.json"
+DB_PATH = r"Agent\SmartPlanner\data\edt.db"
+BATCH_SIZE = 5000
+CHUNK_SIZE = 1 << 16
+_separators = re.compile(r"[\s,]*")
+FIELDS = ["type", "debut", "fin", "cours", "salle", "batiment", "formation", "module"]
+
+
+def iter_export(path: str = EXPORT_PATH):
+    """
+    Lit un export JSON (tableau d'événements) sans le charger en entier : décode un événement à la fois.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(CHUNK_SIZE)
+        position = buffer.index("[") + 1
+        while True:
+            # saute les séparateurs entre deux événements
+            position = _separators.match(buffer, position).end()
+            if position == len(buffer):
+                buffer, position = f.read(CHUNK_SIZE), 0
+                if not buffer:
+                    return
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                event, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # événement coupé en fin de bloc : on complète le tampon
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield event
+
+
+def event_key(event: dict) -> str:
+    """
+    Clé stable d'un événement : son identifiant dans l'export, sinon un hash de son créneau et de sa description
+    (un événement sans identifiant déplacé ou modifié est alors vu comme supprimé puis ajouté).
+    """
+    if event.get("id"):
+        return str(event["id"])
+    raw = "|".join([event.get("start", ""), event.get("end", ""), event.get("description", "")])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def fingerprint(cleaned: dict) -> str:
+    return hashlib.sha1("\x1f".join(str(cleaned[c]) for c in FIELDS).encode("utf-8")).hexdigest()[:20]
+
+
+def clean_event(event):
     # reformate la description pour récupérer la salle et le cours
     description = html.unescape(event['description'])
     lines = list(filter(str.strip, re.split(r'<br\s*/?>|\n|\r', description)))
@@ -28,9 +91,9 @@ def clean_event(i, event):
             formations.append("M2 Saclay Ingénierie Statistique, Actuariat et Data Science ISADS")
         if "Mathématiques et Apprentissage Statistique" in text:
             formations.append("M2 Saclay Mathématiques et Apprentissage Statistique" + " Math&AS")
-            
-    return {
-        "id": str(i),
+
+    cleaned = {
+        "id": event_key(event),
         "type": event.get("eventCategory", ""),  # CM/TD, etc.
         "debut": event["start"],
         "fin": event["end"],
@@ -40,50 +103,139 @@ def clean_event(i, event):
         "formation" : "; ".join(formations),
         "module": ", ".join(event.get("modules") or [])
     }
-    
-cleaned_events = [clean_event(i, e) for i, e in enumerate(edt)]
-cleaned_events = sorted(cleaned_events, key=lambda x: datetime.fromisoformat(x["debut"]))
+    cleaned["empreinte"] = fingerprint(cleaned)
+    return cleaned
+
+
+def sync(export_path: str = EXPORT_PATH, db_path: str = DB_PATH, full: bool = False) -> dict:
+    """
+    Met edt.db à jour depuis l'export : ajoute les événements nouveaux, réécrit les modifiés, supprime les disparus.
+    arg : full (réécrit tous les événements, comme un rechargement complet)
+    return : nombre d'événements ajoutés / modifiés / supprimés / inchangés, version des données, durée
+    """
+    start = time.perf_counter()
+    # base créée avec l'ancienne table plate edt : conversion vers le schéma normalisé
+    migrate_legacy(db_path)
+    connection = sqlite3.connect(db_path)
+    try:
+        create_schema(connection)
+        known = dict(connection.execute("SELECT id, empreinte FROM evenement"))
+        seen, batch = set(), []
+        report = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        with connection:
+            for raw in iter_export(export_path):
+                event = clean_event(raw)
+                if event["id"] in seen:
+                    continue    # doublon dans l'export : la première occurrence est gardée
+                seen.add(event["id"])
+                previous = known.get(event["id"], "")
+                if previous == event["empreinte"] and not full:
+                    report["unchanged"] += 1
+                    continue
+                report["updated" if event["id"] in known else "added"] += 1
+                batch.append(event)
+                if len(batch) >= BATCH_SIZE:
+                    insert_events(connection, batch)
+                    batch = []
+            insert_events(connection, batch)
+            vanished = known.keys() - seen
+            delete_events(connection, vanished)
+            report["deleted"] = len(vanished)
+            if report["added"] or report["updated"] or report["deleted"]:
+                set_meta(connection, {"data_version": data_version(connection) + 1,
+                                      "synced_at": datetime.now().isoformat(timespec="seconds"),
+                                      "source": os.path.basename(export_path)})
+        if report["added"] + report["deleted"] > len(known) // 10:
+            connection.execute("ANALYZE")
+        report["data_version"] = data_version(connection)
+    finally:
+        connection.close()
+    report["duration_s"] = round(time.perf_counter() - start, 3)
+    return report
 
-DB_PATH = r"Agent\SmartPlanner\data\edt.db"
-engine = create_engine(f"sqlite:///{DB_PATH}")
-db = SQLDatabase(engine=engine)
-
-Base = declarative_base()
-class Edt(Base):
-    __tablename__ = "edt"
-    id = Column(String, primary_key=True)  # Clé primaire obligatoire
-    type=Column(String, index=True)
-    debut=Column(String, index=True)
-    fin=Column(String, index=True)
-    cours=Column(String, index=True)
-    salle=Column(String, index=True)
-    batiment=Column(String, index=True)
-    formation=Column(String, index=True)
-    module=Column(String, index=True)
 
 def init_db():
-    # Création de la table (si elle n'existe pas)
-    Base.metadata.create_all(engine)
+    # Création du schéma normalisé et premier import complet de l'export
+    print(sync(EXPORT_PATH, DB_PATH))
 
-    # Suppose que cleaned_events est ta liste de dictionnaires
-    with Session(engine) as session:
-        objets = [Edt(**e) for e in cleaned_events]
-        session.add_all(objets)
-        session.commit()
 
-if __name__ == "__main__":
-    if not os.path.exists(r"Agent.SmartPlanner.data\.edt.db"):
-        init_db()
-    else:
-        print("edt.db déjà présent dans le path")
+def synthetic_export(n_events: int, seed: int = 0) -> list[dict]:
+    """
+    Export synthétique au format de edt.json (description HTML : type, salle - bâtiment, - cours [code], formations).
+    """
+    formations = ["M2 Saclay Ingénierie Statistique, Actuariat et Data Science ISADS",
+                  "M2 Saclay Mathématiques et Apprentissage Statistique"]
+    rng = random.Random(seed)
+    events = []
+    for i, e in enumerate(synthetic_timetable(n_years=1 + n_events // 12_000, n_formations=12)):
+        if i >= n_events:
+            break
+        shared = formations if rng.random() < 0.2 else [rng.choice(formations)]
+        events.append({
+            "id": f"evt-{i}",
+            "start": e["debut"] + "+01:00", "end": e["fin"] + "+01:00",
+            "eventCategory": e["type"],
+            "description": f"{e['type']}<br />{e['salle']} - {e['batiment']}<br />- {e['cours']} [C{i % 97}]<br />"
+                           + "<br />".join(shared),
+            "sites": [e["batiment"]], "modules": [e["module"]],
+        })
+    return events
+
+
+def benchmark_sync(n_events: int = 50_000, changed: float = 0.01, removed: float = 0.005, added: float = 0.005) -> dict:
+    """
+    Import de n_events événements : premier import, rechargement complet (base reconstruite), synchronisation
+    incrémentale après modification d'une petite partie de l'export, et synchronisation sans changement.
+    """
+    events = synthetic_export(n_events)
+    rng = random.Random(1)
+    results = {"events": n_events}
+    with tempfile.TemporaryDirectory() as folder:
+        export_path, db_path = os.path.join(folder, "edt.json"), os.path.join(folder, "edt.db")
+
+        def write_export(items):
+            with open(export_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
 
+        write_export(events)
+        results["first_import"] = sync(export_path, db_path)
+        reload_path = os.path.join(folder, "edt_reload.db")
+        shutil.copy(db_path, reload_path)
 
-# ---------- APERCU DES DONNEES ----------
-edt_df = pd.DataFrame(cleaned_events)   # exporte au format dataframe
-edt_df["formation"].unique()
+        # export rafraîchi : quelques séances changent de salle, certaines disparaissent, d'autres apparaissent
+        refreshed = [dict(e) for e in events if rng.random() >= removed]
+        for e in rng.sample(refreshed, int(changed * n_events)):
+            parts = e["description"].split("<br />")
+            parts[1] = "Z999 - " + parts[1].split(" - ")[-1]
+            e["description"] = "<br />".join(parts)
+        for i, e in enumerate(synthetic_export(int(added * n_events), seed=2)):
+            refreshed.append({**e, "id": f"new-{i}"})
+        write_export(refreshed)
 
+        results["incremental"] = sync(export_path, db_path)
+        results["no_change"] = sync(export_path, db_path)
+        results["full_reload"] = sync(export_path, reload_path, full=True)
+        rebuild_path = os.path.join(folder, "edt_rebuild.db")
+        results["full_rebuild"] = sync(export_path, rebuild_path)
+
+        # la synchronisation incrémentale donne la même base qu'une reconstruction complète
+        query = "SELECT id, type, debut, fin, cours, salle, batiment, formation, module FROM edt ORDER BY id"
+        rebuilt = sqlite3.connect(rebuild_path)
+        incremental = sqlite3.connect(db_path)
+        results["same_content"] = rebuilt.execute(query).fetchall() == incremental.execute(query).fetchall()
+        rebuilt.close()
+        incremental.close()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m Agent.SmartPlanner.edt_parser [--full] [chemin de l'export]
+    arguments = [a for a in sys.argv[1:] if a != "--full"]
+    if not os.path.exists(DB_PATH):
+        init_db()
+    else:
+        print(sync(arguments[0] if arguments else EXPORT_PATH, DB_PATH, full="--full" in sys.argv))
 
-edt_df.debut.value_counts()
 
-test = edt_df[(edt_df["debut"]>="2025-03-01") & (edt_df["fin"]<="2025-03-31")]
-test.batiment.value_counts()
+# ---- TESTS ----
+# print(benchmark_sync(50_000))
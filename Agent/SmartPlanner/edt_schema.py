@@ -0,0 +1,308 @@
+from datetime import datetime, timedelta
+from utils.benchmark import summarize, timed
+import tempfile
+import sqlite3
+import random
+import os
+import re
+
+# Schéma normalisé de l'emploi du temps :
+# - evenement : une ligne par séance, dates en texte ISO (affichage) et en jour julien de l'heure locale
+#   (debut_jd / fin_jd, indexés, à comparer à julianday('now', 'localtime'))
+# - formation / evenement_formation : une ligne par couple (séance, formation), indexée par (formation_id, debut_jd),
+#   rang garde l'ordre d'origine des formations
+# - edt_fts : index plein texte FTS5 (sans accents) sur cours, module et salle, tenu à jour par triggers
+# - meta : version des données (data_version, incrémentée à chaque synchronisation qui modifie la base)
+# - edt : vue de compatibilité avec l'ancienne table (formation = noms concaténés par "; ")
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS evenement (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    debut TEXT NOT NULL,
+    fin TEXT NOT NULL,
+    debut_jd REAL NOT NULL,
+    fin_jd REAL NOT NULL,
+    cours TEXT,
+    salle TEXT,
+    batiment TEXT,
+    module TEXT,
+    empreinte TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_evenement_debut_jd ON evenement (debut_jd);
+CREATE INDEX IF NOT EXISTS ix_evenement_debut ON evenement (debut);
+CREATE INDEX IF NOT EXISTS ix_evenement_salle ON evenement (salle, debut_jd);
+CREATE INDEX IF NOT EXISTS ix_evenement_cours ON evenement (cours, debut_jd);
+CREATE INDEX IF NOT EXISTS ix_evenement_type ON evenement (type, debut_jd);
+
+CREATE TABLE IF NOT EXISTS meta (
+    cle TEXT PRIMARY KEY,
+    valeur TEXT
+);
+
+CREATE TABLE IF NOT EXISTS formation (
+    id INTEGER PRIMARY KEY,
+    nom TEXT NOT NULL UNIQUE,
+    code TEXT
+);
+
+CREATE TABLE IF NOT EXISTS evenement_formation (
+    formation_id INTEGER NOT NULL REFERENCES formation (id),
+    debut_jd REAL NOT NULL,
+    evenement_id TEXT NOT NULL REFERENCES evenement (id) ON DELETE CASCADE,
+    rang INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (formation_id, debut_jd, evenement_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_evenement_formation_evenement ON evenement_formation (evenement_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS edt_fts USING fts5 (
+    cours, module, salle,
+    content = 'evenement', content_rowid = 'rowid', tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS evenement_fts_insert AFTER INSERT ON evenement BEGIN
+    INSERT INTO edt_fts (rowid, cours, module, salle) VALUES (new.rowid, new.cours, new.module, new.salle);
+END;
+CREATE TRIGGER IF NOT EXISTS evenement_fts_delete AFTER DELETE ON evenement BEGIN
+    INSERT INTO edt_fts (edt_fts, rowid, cours, module, salle) VALUES ('delete', old.rowid, old.cours, old.module, old.salle);
+END;
+CREATE TRIGGER IF NOT EXISTS evenement_fts_update AFTER UPDATE ON evenement BEGIN
+    INSERT INTO edt_fts (edt_fts, rowid, cours, module, salle) VALUES ('delete', old.rowid, old.cours, old.module, old.salle);
+    INSERT INTO edt_fts (rowid, cours, module, salle) VALUES (new.rowid, new.cours, new.module, new.salle);
+END;
+
+CREATE VIEW IF NOT EXISTS edt AS
+SELECT e.id, e.type, e.debut, e.fin, e.cours, e.salle, e.batiment,
+       (SELECT group_concat(nom, '; ') FROM (SELECT f.nom FROM evenement_formation ef JOIN formation f ON f.id = ef.formation_id
+        WHERE ef.evenement_id = e.id ORDER BY ef.rang)) AS formation,
+       e.module
+FROM evenement e;
+"""
+
+# ancienne table plate (edt_parser.Edt), gardée pour la migration et la comparaison
+LEGACY_SCHEMA_SQL = """
+CREATE TABLE edt (
+    id TEXT PRIMARY KEY, type TEXT, debut TEXT, fin TEXT, cours TEXT, salle TEXT, batiment TEXT, formation TEXT, module TEXT
+);
+CREATE INDEX ix_edt_type ON edt (type);
+CREATE INDEX ix_edt_debut ON edt (debut);
+CREATE INDEX ix_edt_fin ON edt (fin);
+CREATE INDEX ix_edt_cours ON edt (cours);
+CREATE INDEX ix_edt_salle ON edt (salle);
+CREATE INDEX ix_edt_batiment ON edt (batiment);
+CREATE INDEX ix_edt_formation ON edt (formation);
+CREATE INDEX ix_edt_module ON edt (module);
+"""
+
+JULIAN_UNIX_EPOCH = 2440587.5
+
+
+def julian_day(iso: str) -> float:
+    """
+    Jour julien de l'heure locale (heure de Paris affichée dans l'emploi du temps) : le décalage UTC de la chaîne
+    est ignoré. Égal à julianday() de SQLite sur la chaîne sans décalage (julianday('2025-03-01T08:00:00')) ;
+    SQLite convertit en UTC une chaîne avec décalage. L'instant présent se compare donc à julianday('now', 'localtime').
+    """
+    moment = datetime.fromisoformat(iso).replace(tzinfo=None)
+    return JULIAN_UNIX_EPOCH + (moment - datetime(1970, 1, 1)).total_seconds() / 86400
+
+
+def formation_code(nom: str) -> str:
+    # dernier mot du nom : "M2 Saclay ... ISADS" -> "ISADS"
+    return nom.split()[-1] if nom.split() else nom
+
+
+def split_formations(formation: str) -> list[str]:
+    return [f.strip() for f in re.split(r";", formation or "") if f.strip()]
+
+
+def create_schema(connection: sqlite3.Connection):
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA_SQL)
+    # bases créées avant l'ajout de l'empreinte (synchronisation incrémentale)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(evenement)")]
+    if "empreinte" not in columns:
+        connection.execute("ALTER TABLE evenement ADD COLUMN empreinte TEXT")
+
+
+def data_version(connection: sqlite3.Connection) -> int:
+    row = connection.execute("SELECT valeur FROM meta WHERE cle = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def set_meta(connection: sqlite3.Connection, values: dict):
+    connection.executemany("INSERT INTO meta (cle, valeur) VALUES (?, ?) ON CONFLICT (cle) DO UPDATE SET valeur = excluded.valeur",
+                           [(k, str(v)) for k, v in values.items()])
+
+
+def insert_events(connection: sqlite3.Connection, events):
+    """
+    Insère (ou remplace) des séances au format de edt_parser.clean_event (formation : noms séparés par "; ",
+    empreinte facultative).
+    """
+    formation_ids = {nom: i for i, nom in connection.execute("SELECT id, nom FROM formation")}
+    event_rows, links = [], []
+    for e in events:
+        debut_jd = julian_day(e["debut"])
+        event_rows.append((e["id"], e["type"], e["debut"], e["fin"], debut_jd, julian_day(e["fin"]),
+                           e["cours"], e["salle"], e["batiment"], e["module"], e.get("empreinte")))
+        for rang, nom in enumerate(split_formations(e["formation"])):
+            if nom not in formation_ids:
+                cursor = connection.execute("INSERT INTO formation (nom, code) VALUES (?, ?)", (nom, formation_code(nom)))
+                formation_ids[nom] = cursor.lastrowid
+            links.append((formation_ids[nom], debut_jd, e["id"], rang))
+    # une séance remplacée perd ses anciennes formations
+    connection.executemany("DELETE FROM evenement_formation WHERE evenement_id = ?", [(r[0],) for r in event_rows])
+    connection.executemany("""
+        INSERT INTO evenement (id, type, debut, fin, debut_jd, fin_jd, cours, salle, batiment, module, empreinte)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET type = excluded.type, debut = excluded.debut, fin = excluded.fin,
+            debut_jd = excluded.debut_jd, fin_jd = excluded.fin_jd, cours = excluded.cours, salle = excluded.salle,
+            batiment = excluded.batiment, module = excluded.module, empreinte = excluded.empreinte
+    """, event_rows)
+    connection.executemany("INSERT OR IGNORE INTO evenement_formation (formation_id, debut_jd, evenement_id, rang) VALUES (?, ?, ?, ?)", links)
+
+
+def delete_events(connection: sqlite3.Connection, ids):
+    ids = [(i,) for i in ids]
+    connection.executemany("DELETE FROM evenement_formation WHERE evenement_id = ?", ids)
+    connection.executemany("DELETE FROM evenement WHERE id = ?", ids)
+
+
+def migrate_legacy(db_path: str):
+    """
+    Convertit une base à l'ancienne table plate edt vers le schéma normalisé (la vue edt la remplace).
+    La nouvelle base est construite dans un fichier à côté puis remplace l'ancienne : une migration interrompue
+    laisse la base d'origine intacte. Les lignes invalides (date absente ou illisible) sont ignorées et comptées.
+    Reprend aussi une base laissée à moitié migrée (vue edt et table edt_legacy).
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        kinds = dict(connection.execute("SELECT name, type FROM sqlite_master WHERE name IN ('edt', 'edt_legacy')"))
+        source = "edt_legacy" if kinds.get("edt_legacy") == "table" else "edt" if kinds.get("edt") == "table" else None
+        if source is None:
+            create_schema(connection)
+            connection.commit()
+            return
+        columns = ["id", "type", "debut", "fin", "cours", "salle", "batiment", "formation", "module"]
+        rows = connection.execute(f"SELECT {', '.join(columns)} FROM {source}").fetchall()
+    finally:
+        connection.close()
+
+    tmp_path = db_path + ".migration"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    events, skipped = [], 0
+    for row in rows:
+        event = dict(zip(columns, row))
+        try:
+            julian_day(event["debut"])
+            julian_day(event["fin"])
+        except (TypeError, ValueError):
+            skipped += 1
+            continue
+        events.append(event)
+    migrated = sqlite3.connect(tmp_path)
+    try:
+        create_schema(migrated)
+        with migrated:
+            insert_events(migrated, events)
+    except Exception:
+        migrated.close()
+        os.remove(tmp_path)
+        raise
+    migrated.close()
+    os.replace(tmp_path, db_path)
+    print(f"{db_path} migrée vers le schéma normalisé ({len(events)} séances"
+          + (f", {skipped} lignes invalides ignorées)" if skipped else ")"))
+
+
+def synthetic_timetable(n_years: int = 3, n_formations: int = 12, start: str = "2023-09-04", seed: int = 0):
+    """
+    Emploi du temps synthétique : n_formations formations, 4 séances par jour ouvré et par formation,
+    une séance sur cinq partagée avec une autre formation (cours mutualisés).
+    """
+    rng = random.Random(seed)
+    formations = [f"M2 Saclay Formation {i} F{i}" for i in range(n_formations)]
+    courses = [f"{a} {b}" for a in ("Statistique", "Analyse", "Apprentissage", "Séries", "Optimisation", "Probabilités")
+               for b in ("avancée", "bayésienne", "temporelles", "numérique", "non paramétrique")]
+    day, i = datetime.fromisoformat(start), 0
+    for _ in range(n_years * 365):
+        if day.weekday() < 5:
+            for f, formation in enumerate(formations):
+                for slot in range(4):
+                    debut = day + timedelta(hours=8 + 2 * slot)
+                    shared = [formation] + ([formations[(f + 1) % n_formations]] if rng.random() < 0.2 else [])
+                    yield {
+                        "id": str(i), "type": rng.choice(["CM", "TD", "TP", "Examen"]),
+                        "debut": debut.isoformat(), "fin": (debut + timedelta(hours=2)).isoformat(),
+                        "cours": rng.choice(courses), "salle": f"{rng.choice('ABCDEFG')}{rng.randint(100, 140)}",
+                        "batiment": rng.choice(["Fermat", "Buffon", "Descartes", "Vauban"]),
+                        "formation": "; ".join(shared), "module": f"Module {rng.randint(1, 20)}",
+                    }
+                    i += 1
+        day += timedelta(days=1)
+
+
+# requêtes typiques générées par le LLM : (nom, SQL sur l'ancienne table ou la vue, SQL sur le schéma normalisé)
+benchmark_queries = [
+    ("formation_mois",
+     "SELECT * FROM edt WHERE formation LIKE '%F3%' AND debut >= '2024-03-01' AND debut < '2024-04-01' ORDER BY debut",
+     "SELECT e.* FROM evenement_formation ef JOIN formation f ON f.id = ef.formation_id JOIN evenement e ON e.id = ef.evenement_id "
+     "WHERE f.code = 'F3' AND ef.debut_jd >= julianday('2024-03-01') AND ef.debut_jd < julianday('2024-04-01') ORDER BY ef.debut_jd"),
+    ("formation_semaine",
+     "SELECT cours, debut, fin, salle FROM edt WHERE formation LIKE '%F7%' AND debut >= '2025-01-13' AND debut < '2025-01-20'",
+     "SELECT e.cours, e.debut, e.fin, e.salle FROM evenement_formation ef JOIN formation f ON f.id = ef.formation_id "
+     "JOIN evenement e ON e.id = ef.evenement_id WHERE f.code = 'F7' AND ef.debut_jd >= julianday('2025-01-13') "
+     "AND ef.debut_jd < julianday('2025-01-20')"),
+    ("jour",
+     "SELECT * FROM edt WHERE debut >= '2024-11-05' AND debut < '2024-11-06'",
+     "SELECT * FROM evenement WHERE debut_jd >= julianday('2024-11-05') AND debut_jd < julianday('2024-11-06')"),
+    ("salle_mois",
+     "SELECT cours, debut, fin FROM edt WHERE salle = 'B120' AND debut LIKE '2024-11%'",
+     "SELECT cours, debut, fin FROM evenement WHERE salle = 'B120' AND debut_jd >= julianday('2024-11-01') "
+     "AND debut_jd < julianday('2024-12-01')"),
+    ("nom_cours_approx",
+     "SELECT DISTINCT cours FROM edt WHERE cours LIKE '%series%' OR cours LIKE '%séries%'",
+     "SELECT DISTINCT e.cours FROM evenement e WHERE e.rowid IN (SELECT rowid FROM edt_fts WHERE edt_fts MATCH 'cours : series*')"),
+    ("examens_formation",
+     "SELECT cours, debut FROM edt WHERE formation LIKE '%F5%' AND type = 'Examen' ORDER BY debut",
+     "SELECT e.cours, e.debut FROM evenement_formation ef JOIN formation f ON f.id = ef.formation_id "
+     "JOIN evenement e ON e.id = ef.evenement_id WHERE f.code = 'F5' AND e.type = 'Examen' ORDER BY ef.debut_jd"),
+]
+
+
+def benchmark_schema(n_years: int = 3, n_formations: int = 12, n_runs: int = 5) -> dict:
+    """
+    Compare, sur un emploi du temps synthétique pluriannuel, les requêtes typiques sur l'ancienne table plate,
+    les mêmes requêtes sur la vue de compatibilité, et leur version sur le schéma normalisé.
+    """
+    events = list(synthetic_timetable(n_years, n_formations))
+    results = {"events": len(events)}
+    with tempfile.TemporaryDirectory() as folder:
+        legacy = sqlite3.connect(os.path.join(folder, "legacy.db"))
+        legacy.executescript(LEGACY_SCHEMA_SQL)
+        columns = ["id", "type", "debut", "fin", "cours", "salle", "batiment", "formation", "module"]
+        legacy.executemany(f"INSERT INTO edt VALUES ({', '.join('?' * len(columns))})",
+                           [tuple(e[c] for c in columns) for e in events])
+        legacy.commit()
+        normalized = sqlite3.connect(os.path.join(folder, "normalized.db"))
+        create_schema(normalized)
+        with normalized:
+            insert_events(normalized, events)
+        normalized.execute("ANALYZE")
+
+        for name, legacy_sql, typed_sql in benchmark_queries:
+            entry = {}
+            for mode, connection, sql in (("legacy_table", legacy, legacy_sql), ("compat_view", normalized, legacy_sql),
+                                          ("normalized", normalized, typed_sql)):
+                rows, _ = timed(lambda: connection.execute(sql).fetchall())
+                entry[mode] = {"rows": len(rows), **summarize([timed(lambda: connection.execute(sql).fetchall())[1]
+                                                             for _ in range(n_runs)])}
+            results[name] = entry
+        legacy.close()
+        normalized.close()
+    return results
+
+
+# ---- TESTS ----
+# print(benchmark_schema(n_years=3, n_formations=12))
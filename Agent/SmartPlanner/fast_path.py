@@ -0,0 +1,348 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from Agent.RouterAgent import normalize_question
+from Agent.SmartPlanner.edt_schema import julian_day
+from utils.benchmark import summarize, timed, atimed
+import re
+
+# Chemin rapide de SmartPlanner : les questions fréquentes (prochain cours, cours d'un jour, semaine d'une formation,
+# salle d'un cours, filtres examen/CM/TD) sont reconnues localement et traduites en requêtes SQL paramétrées fixes,
+# sans appel au LLM. Les questions non reconnues passent par le pipeline LLM habituel.
+
+MONTHS = {
+    "janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7,
+    "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12,
+}
+WEEKDAYS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+# question de suivi complétée par la question précédente : "<question précédente> — <suivi>"
+FOLLOW_UP_SEPARATOR = " — "
+
+# codes de formation (colonne formation.code)
+formation_patterns = [
+    (re.compile(r"\bisads\b|\bactuariat\b|\bdata science\b"), "ISADS"),
+    (re.compile(r"\bmath ?& ?as\b|\bmathas\b|\b(master|m2|formation) (de |d')?(mathematiques et )?apprentissage statistique\b"), "Math&AS"),
+]
+# motifs LIKE de la colonne type
+type_patterns = [
+    ("examen", re.compile(r"\b(examens?|partiels?|controles?)\b"), ("%exam%", "%partiel%", "%contr%le%")),
+    ("CM", re.compile(r"\bcm\b|\bcours magistra(l|ux)\b"), ("CM%", "%magistra%")),
+    ("TD", re.compile(r"\btds?\b|\btravaux diriges\b"), ("TD%",)),
+    ("TP", re.compile(r"\btps?\b|\btravaux pratiques\b"), ("TP%",)),
+]
+hour_pattern = re.compile(r"\b(\d{1,2}) ?h ?(\d{2})?\b")
+_months = "|".join(MONTHS)
+date_pattern = re.compile(r"\b(\d{1,2})(?:er)? (" + _months + r")(?: (\d{4}))?\b")
+numeric_date_pattern = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+month_pattern = re.compile(r"\b(" + _months + r")(?: (\d{4}))?\b")
+day_part_pattern = re.compile(r"\b(matin(ee)?|apres[- ]?midi|soir(ee)?)\b")
+# qualificatifs de date, d'heure ou de lieu que les templates ne traduisent pas en clause : la question passe par le LLM
+unsupported_qualifier_patterns = [
+    re.compile(r"\b(salle|amphi\w*|batiment)\s+(n ?°? ?)?[a-z]?\d[\w.-]*|\b[a-z]\d{2,4}\b"),     # salle citée
+    re.compile(r"\b(le|du|au|ce|jusqu'au) \d{1,2}(er)?\b(?! ?(" + _months + r"|/|h\b|h ?\d))"),  # jour sans mois
+    re.compile(r"\bmois\b(?! (de |d'))|\b(week-?end|vacances|semestre|trimestre|annee)\b"),
+    re.compile(r"\bdans (\d+|un|une|deux|trois|quatre|quinze) (jours?|semaines?|mois)\b|\bsemaine \d+\b"),
+    re.compile(r"\b(avant|apres|entre|depuis|a partir d[eu']?|jusqu'a|jusqu'au|des|vers)\s*(le |l')?\d"),
+    re.compile(r"\b\d{1,2} ?h(\d{2})? ?(a|-|et) ?\d{1,2} ?h"),                                   # plage horaire
+]
+
+# intentions reconnues, de la plus spécifique à la plus générale
+room_pattern = re.compile(r"\b(quelle salle|salles?|batiment|ou a lieu|ou se (trouve|passe|deroule)|ou est|ou ai-je|ou sont)\b")
+# question au pluriel ("quelles salles", "mes cours") : plusieurs séances, jamais le template d'une seule séance
+plural_pattern = re.compile(r"\b(salles|quels|quelles|mes|(les|des) (cours|tds?|tps?|cms?|seances|examens|partiels))\b")
+next_pattern = re.compile(r"\b(prochain|prochaine|suivant|suivante)\b(?! semaine)")
+first_last_pattern = re.compile(r"(?<!semaine )\b(premier|premiere|dernier|derniere)\b(?! semaine)")
+count_pattern = re.compile(r"\bcombien\b")
+# salles libres, créneaux communs, chevauchements : hors des templates SQL (index d'intervalles, interval_index.py)
+unsupported_pattern = re.compile(r"\b(libres?|disponibles?|dispo|chevauch\w*|en meme temps|conflits?)\b")
+schedule_pattern = re.compile(r"\b(cours|emploi du temps|edt|planning|horaires?|a quelle heure|ai-je|j'ai|seances?|td|tp|cm|examens?|partiels?)\b")
+
+
+@dataclass
+class Period:
+    start: datetime
+    end: datetime
+    label: str
+
+
+@dataclass
+class FastQuery:
+    template: str
+    sql: str
+    params: dict = field(default_factory=dict)
+    label: str = ""
+    kind: str = "list"      # "list", "one" (un seul événement), "count" (nombre et heures)
+
+
+def parse_period(text: str, now: datetime):
+    """
+    Dates relatives et absolues en français : aujourd'hui, demain, après-demain, hier, "12 mars", "12/03",
+    jour de la semaine, cette semaine / la semaine prochaine / dernière, "semaine du 17 mars", "en mars".
+    Affinée par matin / après-midi / soir. Les dates explicites passent avant les semaines relatives.
+    arg : text (question normalisée)
+    return : Period ou None
+    """
+    today = datetime(now.year, now.month, now.day)
+    monday = today - timedelta(days=today.weekday())
+    if re.search(r"\bsemaine (prochaine|suivante)\b|\bprochaine semaine\b", text):
+        week, week_label = 1, "la semaine prochaine"
+    elif re.search(r"\bsemaine (derniere|passee|precedente)\b|\bderniere semaine\b", text):
+        week, week_label = -1, "la semaine dernière"
+    elif re.search(r"\b(cette|la) semaine\b", text):
+        week, week_label = 0, "cette semaine"
+    else:
+        week, week_label = None, ""
+
+    period = None
+    if re.search(r"\baujourd'hui\b|\bce (matin|soir|midi)\b|\bcet apres[- ]?midi\b", text):
+        period = Period(today, today + timedelta(days=1), "aujourd'hui")
+    elif re.search(r"\bapres[- ]demain\b", text):
+        period = Period(today + timedelta(days=2), today + timedelta(days=3), "après-demain")
+    elif re.search(r"\bdemain\b", text):
+        period = Period(today + timedelta(days=1), today + timedelta(days=2), "demain")
+    elif re.search(r"\bhier\b", text):
+        period = Period(today - timedelta(days=1), today, "hier")
+    elif match := date_pattern.search(text):
+        month = MONTHS[match.group(2)]
+        year = int(match.group(3)) if match.group(3) else _year(month, now)
+        day = _date(year, month, int(match.group(1)))
+        period = day and Period(day, day + timedelta(days=1), f"le {day:%d/%m/%Y}")
+    elif match := numeric_date_pattern.search(text):
+        month = int(match.group(2))
+        year = int(match.group(3)) if match.group(3) else _year(month, now)
+        day = _date(year + 2000 if year < 100 else year, month, int(match.group(1)))
+        period = day and Period(day, day + timedelta(days=1), f"le {day:%d/%m/%Y}")
+    elif match := re.search(r"\b(" + "|".join(WEEKDAYS) + r")\b( prochain)?", text):
+        if week is not None:
+            # "lundi de la semaine prochaine"
+            day = monday + timedelta(days=7 * week + WEEKDAYS.index(match.group(1)))
+        else:
+            delta = (WEEKDAYS.index(match.group(1)) - today.weekday()) % 7
+            if match.group(2) and delta == 0:
+                delta = 7
+            day = today + timedelta(days=delta)
+        period = Period(day, day + timedelta(days=1), f"{match.group(1)} {day:%d/%m}")
+    elif week is not None:
+        start = monday + timedelta(days=7 * week)
+        period = Period(start, start + timedelta(days=7), week_label)
+    elif match := month_pattern.search(text):
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else _year(month, now)
+        start = datetime(year, month, 1)
+        end = datetime(year + (month == 12), month % 12 + 1, 1)
+        period = Period(start, end, f"en {match.group(1)}")
+
+    if period is not None and period.end - period.start == timedelta(days=1):
+        if re.search(r"\bsemaine (du|de|d')", text):
+            # "semaine du 17 mars" : semaine de la date citée
+            start = period.start - timedelta(days=period.start.weekday())
+            period = Period(start, start + timedelta(days=7), f"la semaine du {start:%d/%m/%Y}")
+        elif re.search(r"\bmatin(ee)?\b", text):
+            period = Period(period.start, period.start + timedelta(hours=12), f"{period.label} matin")
+        elif re.search(r"\bapres[- ]?midi\b", text):
+            period = Period(period.start + timedelta(hours=12), period.end, f"{period.label} après-midi")
+        elif re.search(r"\bsoir(ee)?\b", text):
+            period = Period(period.start + timedelta(hours=18), period.end, f"{period.label} soir")
+    return period
+
+
+def question_period(text: str, now: datetime):
+    """
+    Période d'une question ; pour une question de suivi complétée ("<question précédente> — <suivi>"), la période
+    du suivi ("et jeudi ?") prime sur celle de la question précédente.
+    arg : text (question normalisée)
+    """
+    _, separator, follow_up = text.rpartition(FOLLOW_UP_SEPARATOR)
+    return (separator and parse_period(follow_up, now)) or parse_period(text, now)
+
+
+def _year(month: int, now: datetime) -> int:
+    # mois cité sans année : celui de l'année universitaire en cours (à moins de 6 mois de la date de référence)
+    if month - now.month > 6:
+        return now.year - 1
+    if now.month - month > 5:
+        return now.year + 1
+    return now.year
+
+
+def unsupported_qualifier(text: str, period) -> bool:
+    """
+    return : True si la question contient une date, une plage horaire ou une salle que les templates ne traduisent
+             pas en clause (ex: "en salle 101", "le 17" sans mois, "le mois prochain", "avant 10h", "le matin" sans jour)
+    """
+    if any(pattern.search(text) for pattern in unsupported_qualifier_patterns):
+        return True
+    # moment de la journée sans jour auquel l'appliquer
+    return bool(day_part_pattern.search(text)) and (period is None or period.end - period.start >= timedelta(days=1))
+
+
+def _date(year: int, month: int, day: int):
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_formation(text: str):
+    for pattern, code in formation_patterns:
+        if pattern.search(text):
+            return code
+    return None
+
+
+def parse_type(text: str):
+    """
+    return : (nom du type, motifs LIKE) ou (None, ())
+    """
+    for name, pattern, likes in type_patterns:
+        if pattern.search(text):
+            return name, likes
+    return None, ()
+
+
+def parse_course(text: str, courses: list[str]):
+    """
+    Cours cité dans la question : nom complet, ou tous ses mots significatifs (4 lettres et plus).
+    return : le nom du cours tel qu'en base (le plus long en cas de plusieurs correspondances) ou None
+    """
+    found = None
+    for course in courses:
+        name = normalize_question(course)
+        words = [w for w in re.findall(r"[\w&]+", name) if len(w) >= 4]
+        if (name and name in text) or (words and all(re.search(rf"\b{re.escape(w)}\b", text) for w in words)):
+            if found is None or len(course) > len(found):
+                found = course
+    return found
+
+
+def match(question: str, courses: list[str] = (), now: datetime = None):
+    """
+    Reconnaît une question fréquente et construit sa requête SQL (paramètres liés, jamais de texte utilisateur dans le SQL).
+    arg : courses (noms des cours en base, pour reconnaître un cours cité), now (date de référence)
+    return : FastQuery, ou None si la question doit passer par le LLM
+    """
+    now = now or datetime.now()
+    text = normalize_question(question)
+    if unsupported_pattern.search(text) or not (schedule_pattern.search(text) or room_pattern.search(text)):
+        return None
+
+    period = question_period(text, now)
+    if unsupported_qualifier(text, period):
+        return None
+    formation = parse_formation(text)
+    type_name, type_likes = parse_type(text)
+    course = parse_course(text, courses)
+    hour = hour_pattern.search(text)
+
+    # requêtes sur les tables normalisées (pas sur la vue edt, qui recalcule les formations de chaque ligne) :
+    # formation par son code via evenement_formation (index (formation_id, debut_jd)), dates en jours juliens
+    select = "SELECT e.cours, e.type, e.debut, e.fin, e.salle, e.batiment FROM evenement e"
+    clauses, params = [], {}
+    jd = "e.debut_jd"
+    if formation:
+        select = ("SELECT e.cours, e.type, e.debut, e.fin, e.salle, e.batiment FROM evenement_formation ef "
+                  "JOIN formation f ON f.id = ef.formation_id JOIN evenement e ON e.id = ef.evenement_id")
+        clauses.append("f.code = :formation")
+        params["formation"] = formation
+        jd = "ef.debut_jd"
+    if type_likes:
+        clauses.append("(" + " OR ".join(f"e.type LIKE :type{i}" for i in range(len(type_likes))) + ")")
+        params.update({f"type{i}": like for i, like in enumerate(type_likes)})
+    if course:
+        clauses.append("e.cours = :cours")
+        params["cours"] = course
+    if hour:
+        clauses.append("substr(e.debut, 12, 2) = :heure")
+        params["heure"] = f"{int(hour.group(1)):02d}"
+
+    def build(template, extra, order="", limit=None, kind="list", label=""):
+        where = clauses + extra
+        sql = select + (" WHERE " + " AND ".join(where) if where else "") + f" ORDER BY {jd}{order}"
+        sql += f" LIMIT {limit}" if limit else ""
+        return FastQuery(template, sql, params, label, kind)
+
+    label = " ".join(filter(None, [type_name, course and f"de {course}", period and period.label]))
+    if period:
+        params["start"], params["end"] = julian_day(period.start.isoformat()), julian_day(period.end.isoformat())
+        in_period = [f"{jd} >= :start", f"{jd} < :end"]
+    # à la minute près : la même question posée dans la minute réutilise le cache SQL
+    params["now"] = julian_day(now.isoformat(timespec="minutes"))
+    upcoming = [f"{jd} >= :now"]
+
+    # salle / bâtiment d'un cours : sa prochaine séance (ou sa séance de la période demandée) ;
+    # au pluriel ("quelles salles ... cette semaine"), la liste des séances de la période, avec leurs salles
+    if room_pattern.search(text) and not plural_pattern.search(text) and (course or period or hour or type_likes):
+        return build("salle", in_period if period else upcoming, limit=1, kind="one", label=label)
+    # prochain cours (éventuellement d'un type, d'un cours ou d'une formation)
+    if next_pattern.search(text) and not period:
+        return build("prochain_cours", upcoming, limit=1, kind="one", label=label)
+    # premier / dernier cours d'une période
+    if (first_last := first_last_pattern.search(text)) and period:
+        last = first_last.group(1).startswith("dernier")
+        return build("premier_dernier", in_period, order=" DESC" if last else "", limit=1, kind="one", label=label)
+    # nombre de cours ou d'heures sur une période
+    if count_pattern.search(text) and period:
+        return build("combien", in_period, kind="count", label=label)
+    # semaine d'une formation, cours d'une date, examens : liste des événements de la période
+    if period:
+        template = "semaine" if period.end - period.start == timedelta(days=7) else "date"
+        return build("examen" if type_name == "examen" else template, in_period, label=label)
+    if type_name == "examen" or (course and re.search(r"\b(quand|date|horaires?|a quelle heure)\b", text)):
+        # sans période : les prochaines séances
+        return build("examen" if type_name == "examen" else "horaire_cours", upcoming, limit=10, label=label)
+    if formation and re.search(r"\b(planning|emploi du temps|edt)\b", text):
+        monday = datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
+        params["start"], params["end"] = julian_day(monday.isoformat()), julian_day((monday + timedelta(days=7)).isoformat())
+        return build("semaine", [f"{jd} >= :start", f"{jd} < :end"], label="cette semaine")
+    return None
+
+
+def _format_event(row: dict) -> str:
+    debut, fin = datetime.fromisoformat(row["debut"]), datetime.fromisoformat(row["fin"])
+    place = ", ".join(filter(None, [row["salle"] and f"salle {row['salle'].strip()}", row["batiment"]]))
+    return (f"{WEEKDAYS[debut.weekday()]} {debut:%d/%m} de {debut:%Hh%M} à {fin:%Hh%M} : "
+            f"{row['cours'] or 'cours'}" + (f" ({row['type']})" if row["type"] else "") + (f", {place}" if place else ""))
+
+
+def render(fast_query: FastQuery, rows: list[dict]) -> str:
+    """
+    Réponse rédigée sans LLM à partir des lignes renvoyées par la requête du chemin rapide.
+    """
+    label = f" {fast_query.label}" if fast_query.label else ""
+    if not rows:
+        return f"Aucun cours trouvé{label}."
+    if fast_query.kind == "one":
+        return _format_event(rows[0])
+    if fast_query.kind == "count":
+        hours = sum((datetime.fromisoformat(r["fin"]) - datetime.fromisoformat(r["debut"])).total_seconds() for r in rows) / 3600
+        return f"{len(rows)} séance(s){label}, soit {hours:g} heure(s) au total."
+    return f"Cours{label} :\n" + "\n".join(f"- {_format_event(r)}" for r in rows)
+
+
+def benchmark_coverage(questions: list[tuple], courses: list[str] = (), now: datetime = None) -> dict:
+    """
+    Couverture du chemin rapide sur un jeu de questions étiquetées (question, template attendu ou None) :
+    part des questions traitées sans LLM, exactitude du template reconnu et latence de la reconnaissance.
+    """
+    covered, correct, latencies = 0, 0, []
+    errors = []
+    for question, expected in questions:
+        fast_query, duration = timed(match, question, courses, now)
+        latencies.append(duration)
+        template = fast_query.template if fast_query else None
+        covered += template is not None
+        correct += template == expected
+        if template != expected:
+            errors.append((question, expected, template))
+    n = len(questions)
+    return {"coverage": covered / n, "accuracy": correct / n, "errors": errors, **summarize(latencies)}
+
+
+async def benchmark_latency(questions: list[str], fast_ask, llm_ask) -> dict:
+    """
+    Latence de bout en bout des mêmes questions avec chemin rapide (fast_ask) et avec le pipeline LLM seul (llm_ask).
+    """
+    results = {}
+    for mode, ask in (("fast_path", fast_ask), ("llm", llm_ask)):
+        latencies = [(await atimed(ask(q)))[1] for q in questions]
+        results[mode] = summarize(latencies)
+    return results
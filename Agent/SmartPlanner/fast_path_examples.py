@@ -0,0 +1,103 @@
+# Questions d'emploi du temps étiquetées avec le template attendu du chemin rapide (None : doit passer par le LLM).
+# Sert à mesurer la couverture et l'exactitude de Agent.SmartPlanner.fast_path.
+# Les questions qui citent un cours supposent qu'il existe dans edt.db (example_courses pour un test hors base).
+# relevance_questions : les mêmes questions et des questions hors sujet, étiquetées avec la pertinence attendue
+# (comparaison des modes de génération SQL de SmartPlanner).
+# interval_questions : questions traitées par l'index d'intervalles (Agent.SmartPlanner.interval_index), avec le type attendu.
+
+example_courses = ["Séries temporelles", "Statistique non paramétrique", "Apprentissage statistique"]
+
+fast_path_questions = [
+    # ---- prochain cours
+    ("Quand est mon prochain cours ?", "prochain_cours"),
+    ("C'est quoi mon prochain cours ?", "prochain_cours"),
+    ("Quel est le prochain TD ?", "prochain_cours"),
+    ("Quand a lieu le prochain cours de séries temporelles ?", "prochain_cours"),
+    ("Quel est le prochain cours des M2 ISADS ?", "prochain_cours"),
+    # ---- cours d'une date ou d'un jour relatif
+    ("A quelle heure ai-je cours demain ?", "date"),
+    ("Quels sont mes cours aujourd'hui ?", "date"),
+    ("Est-ce que j'ai cours le 12 mars ?", "date"),
+    ("Ai-je des cours samedi ?", "date"),
+    ("Quels sont mes cours lundi prochain ?", "date"),
+    ("J'ai cours après-demain ?", "date"),
+    ("Quels cours avais-je hier ?", "date"),
+    ("Est-ce que j'ai TD jeudi après-midi ?", "date"),
+    ("Quels cours ai-je le 03/04 ?", "date"),
+    ("Quels sont les cours de demain matin pour les Math&AS ?", "date"),
+    # ---- semaine d'une formation
+    ("Quel est mon emploi du temps cette semaine ?", "semaine"),
+    ("Quels cours ont les M2 ISADS la semaine prochaine ?", "semaine"),
+    ("Quel est le planning de la semaine prochaine pour les ISADS ?", "semaine"),
+    ("Montre-moi le planning du master Math&AS.", "semaine"),
+    ("Emploi du temps ISADS", "semaine"),
+    # ---- salle / bâtiment d'un cours
+    ("Dans quelle salle a lieu le cours de statistique non paramétrique ?", "salle"),
+    ("Dans quel bâtiment se trouve mon cours de 14h ?", "salle"),
+    ("Où a lieu mon TD de demain matin ?", "salle"),
+    ("Dans quelle salle est le cours d'apprentissage statistique ?", "salle"),
+    ("Où se passe mon cours de lundi ?", "salle"),
+    # ---- examens et filtres CM / TD
+    ("Quand a lieu l'examen de séries temporelles ?", "examen"),
+    ("Y a-t-il un examen en avril ?", "examen"),
+    ("Quels sont mes partiels ?", "examen"),
+    ("Est-ce que j'ai des CM cette semaine ?", "semaine"),
+    ("Quels TD ai-je vendredi ?", "date"),
+    ("Quel est l'horaire du cours d'apprentissage statistique ?", "horaire_cours"),
+    # ---- premier / dernier cours, comptages
+    ("À quelle heure finit le dernier cours vendredi ?", "premier_dernier"),
+    ("Quand commence mon premier cours lundi ?", "premier_dernier"),
+    ("Combien de cours ai-je aujourd'hui ?", "combien"),
+    ("Combien d'heures de CM ai-je en mars ?", "combien"),
+    # ---- dates explicites avant les semaines relatives, mois, moments de la journée
+    ("Quels cours ai-je la semaine du 17 mars ?", "semaine"),
+    ("Quels sont les examens de janvier ?", "examen"),
+    ("Ai-je cours demain apres midi ?", "date"),
+    ("Quels cours ai-je eus la semaine dernière ?", "semaine"),
+    ("Ai-je cours lundi de la semaine prochaine ?", "date"),
+    ("Quelles salles pour les ISADS cette semaine ?", "semaine"),
+    # ---- hors du chemin rapide : pipeline LLM
+    ("Quels cours ai-je en salle 101 demain ?", None),
+    ("La salle B120 est-elle occupée lundi ?", None),
+    ("J'ai cours le 17 ?", None),
+    ("Quels cours ai-je le mois prochain ?", None),
+    ("Ai-je cours avant 10h demain ?", None),
+    ("Ai-je cours demain de 14h à 16h ?", None),
+    ("Ai-je des cours le matin ?", None),
+    ("Quelles salles sont libres jeudi à 10h ?", None),
+    ("Est-ce que deux de mes cours se chevauchent la semaine prochaine ?", None),
+    ("Quel professeur enseigne le plus d'heures ?", None),
+    ("Quel module regroupe le plus de cours ?", None),
+    ("Qui est Mathis Jacq ?", None),
+]
+
+off_topic_questions = [
+    "Quelle est la capitale de l'Australie ?",
+    "Peux-tu m'écrire un poème sur la pluie ?",
+    "Quel temps fera-t-il demain ?",
+    "Qui a gagné la coupe du monde 2018 ?",
+    "Donne-moi une recette de crêpes.",
+    "Combien font 12 fois 7 ?",
+    "Quel est le meilleur film de l'année ?",
+    "Comment changer un pneu de vélo ?",
+]
+
+relevance_questions = (
+    [(q, "relevant") for q, _ in fast_path_questions if q != "Qui est Mathis Jacq ?"]
+    + [(q, "not_relevant") for q in off_topic_questions + ["Qui est Mathis Jacq ?"]]
+)
+
+interval_questions = [
+    ("Quelles salles sont libres jeudi à 10h ?", "salles_libres"),
+    ("Y a-t-il une salle disponible demain de 14h à 16h ?", "salles_libres"),
+    ("Quelles salles sont vides en ce moment ?", "salles_libres"),
+    ("Est-ce que deux de mes cours se chevauchent la semaine prochaine ?", "chevauchements"),
+    ("Y a-t-il des conflits dans l'emploi du temps des ISADS ?", "chevauchements"),
+    ("Quels sont les créneaux libres des Math&AS cette semaine ?", "creneaux_libres"),
+    ("Quand suis-je libre vendredi ?", "creneaux_libres"),
+    ("La salle B120 est-elle libre jeudi à 14h ?", "salle_libre"),
+    ("Quelles salles sont libres demain ?", "salles_libres"),
+    ("Quel est mon prochain cours ?", None),
+    ("Quels cours ont lieu en même temps que Séries temporelles ?", None),
+    ("Quelles salles sont libres cette semaine ?", None),
+]
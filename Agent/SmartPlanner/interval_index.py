@@ -0,0 +1,362 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from Agent.RouterAgent import normalize_question
+from Agent.SmartPlanner.edt_schema import julian_day, JULIAN_UNIX_EPOCH
+from Agent.SmartPlanner.fast_path import question_period, parse_formation, hour_pattern, WEEKDAYS, Period
+from utils.benchmark import summarize, timed
+import random
+import sqlite3
+import re
+
+# Index d'intervalles de l'emploi du temps, construit en mémoire au chargement de edt.db : pour chaque salle et
+# chaque formation, les séances triées par début (jour julien). Répond sans SQL aux questions de salles libres,
+# de créneaux libres d'une formation et de chevauchements de cours, que le LLM traduit mal en auto-jointures
+# et NOT EXISTS sur des dates en texte.
+
+DEFAULT_SLOT = timedelta(hours=1)       # durée demandée quand la question ne donne qu'une heure ("libre à 14h")
+DAY_START, DAY_END = 8, 20              # plage horaire des créneaux libres
+MIN_FREE_MINUTES = 30
+
+free_room_pattern = re.compile(r"\bsalles?\b.*\b(libres?|disponibles?|dispo|vides?|inoccupees?)\b"
+                               r"|\b(libres?|disponibles?|dispo|vides?|inoccupees?)\b.*\bsalles?\b")
+overlap_pattern = re.compile(r"\b(chevauch\w*|en meme temps|conflits?|superpos\w*)\b")
+free_slot_pattern = re.compile(r"\b(creneaux? (libres?|disponibles?|communs?)|(suis-je|sommes-nous|est-on|je suis|on est) libres?"
+                               r"|temps libre|pas cours|trous?)\b")
+# salle citée ("salle B120", "amphi 3", "en B120") : question sur cette salle seule
+cited_room_pattern = re.compile(r"\b(?:salle|amphi\w*)\s+(?:n ?° ?)?([a-z]?\d[\w.-]*)|\b([a-z]\d{2,4})\b")
+# chevauchements : seulement dans l'emploi du temps de l'étudiant ou d'une formation ("en même temps que <cours>" : LLM)
+own_schedule_pattern = re.compile(r"\b(mes|mon|ma|nos|notre|j'ai|ai-je|avons-nous|emploi du temps|edt|planning)\b")
+range_pattern = re.compile(r"\b(?:de|entre) (\d{1,2}) ?h ?(\d{2})? (?:a|et) (\d{1,2}) ?h ?(\d{2})?\b")
+
+
+def to_datetime(jd: float) -> datetime:
+    # arrondi à la seconde : un jour julien en flottant ne tombe pas exactement sur l'heure
+    return datetime(1970, 1, 1) + timedelta(seconds=round((jd - JULIAN_UNIX_EPOCH) * 86400))
+
+
+def to_jd(moment: datetime) -> float:
+    return julian_day(moment.isoformat())
+
+
+class Timeline:
+    """
+    Séances d'une salle ou d'une formation triées par début, avec la durée maximale d'une séance :
+    les séances qui recoupent [start, end[ commencent entre start - durée max et end (deux recherches dichotomiques).
+    """
+    def __init__(self, events: list[dict]):
+        self.events = sorted(events, key=lambda e: e["debut_jd"])
+        self.starts = [e["debut_jd"] for e in self.events]
+        self.max_duration = max((e["fin_jd"] - e["debut_jd"] for e in self.events), default=0.0)
+
+    def overlapping(self, start: float, end: float) -> list[dict]:
+        lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_left(self.starts, end)
+        return [e for e in self.events[lo:hi] if e["fin_jd"] > start]
+
+    def is_free(self, start: float, end: float) -> bool:
+        lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_left(self.starts, end)
+        return not any(e["fin_jd"] > start for e in self.events[lo:hi])
+
+
+class IntervalIndex:
+    def __init__(self, events: list[dict]):
+        """
+        arg : events (dicts id, cours, type, debut, fin, debut_jd, fin_jd, salle, batiment, formations : codes séparés par "; ")
+        """
+        by_room, by_formation = {}, {}
+        self.buildings = {}
+        for e in events:
+            salle = (e["salle"] or "").strip()
+            if salle:
+                by_room.setdefault(salle, []).append(e)
+                self.buildings.setdefault(salle, (e["batiment"] or "").strip())
+            for code in filter(None, (e.get("formations") or "").split("; ")):
+                by_formation.setdefault(code, []).append(e)
+        self.rooms = {salle: Timeline(items) for salle, items in by_room.items()}
+        # toutes les séances avec une salle : les salles occupées sur un créneau en une seule recherche
+        self.occupied = Timeline([e for items in by_room.values() for e in items])
+        self.formations = {code: Timeline(items) for code, items in by_formation.items()}
+        self.size = len(events)
+
+    @classmethod
+    def from_connection(cls, connection: sqlite3.Connection):
+        cursor = connection.execute("""
+            SELECT e.id, e.cours, e.type, e.debut, e.fin, e.debut_jd, e.fin_jd, e.salle, e.batiment,
+                   group_concat(f.code, '; ') AS formations
+            FROM evenement e
+            LEFT JOIN evenement_formation ef ON ef.evenement_id = e.id
+            LEFT JOIN formation f ON f.id = ef.formation_id
+            GROUP BY e.id
+        """)
+        columns = [d[0] for d in cursor.description]
+        return cls([dict(zip(columns, row)) for row in cursor])
+
+    def free_rooms(self, start: float, end: float, batiment: str = None) -> list[tuple]:
+        """
+        return : [(salle, bâtiment)] des salles sans séance sur [start, end[, éventuellement d'un seul bâtiment
+        """
+        batiment = batiment and normalize_question(batiment)
+        busy = {e["salle"].strip() for e in self.occupied.overlapping(start, end)}
+        return sorted((salle, self.buildings[salle]) for salle in self.rooms
+                      if salle not in busy and (not batiment or batiment in normalize_question(self.buildings[salle])))
+
+    def is_room_free(self, salle: str, start: float, end: float) -> bool:
+        timeline = self.rooms.get(salle)
+        return timeline is None or timeline.is_free(start, end)
+
+    def room_events(self, salle: str, start: float, end: float) -> list[dict]:
+        timeline = self.rooms.get(salle)
+        return timeline.overlapping(start, end) if timeline else []
+
+    def free_slots(self, formation: str, start: float, end: float, min_minutes: int = MIN_FREE_MINUTES) -> list[tuple]:
+        """
+        Créneaux sans séance d'une formation, jour par jour entre DAY_START et DAY_END (samedi et dimanche exclus).
+        return : [(début, fin)] en jours juliens
+        """
+        timeline = self.formations.get(formation)
+        busy = sorted((e["debut_jd"], e["fin_jd"]) for e in timeline.overlapping(start, end)) if timeline else []
+        slots, day = [], to_datetime(start).replace(hour=0, minute=0, second=0, microsecond=0)
+        while to_jd(day) < end:
+            if day.weekday() < 5:
+                cursor = max(start, to_jd(day + timedelta(hours=DAY_START)))
+                day_end = min(end, to_jd(day + timedelta(hours=DAY_END)))
+                for debut, fin in busy:
+                    if fin <= cursor or debut >= day_end:
+                        continue
+                    if debut > cursor:
+                        slots.append((cursor, debut))
+                    cursor = max(cursor, fin)
+                if day_end > cursor:
+                    slots.append((cursor, day_end))
+            day += timedelta(days=1)
+        return [(a, b) for a, b in slots if (b - a) * 1440 >= min_minutes - 1e-6]
+
+    def overlaps(self, formation: str, start: float, end: float) -> list[tuple]:
+        """
+        return : [(séance, séance)] des paires de séances d'une formation qui se recoupent sur [start, end[
+        """
+        timeline = self.formations.get(formation)
+        events = timeline.overlapping(start, end) if timeline else []
+        pairs, active = [], []
+        # balayage par début croissant : une séance recoupe les séances actives qui finissent après son début
+        for event in events:
+            active = [a for a in active if a["fin_jd"] > event["debut_jd"]]
+            pairs.extend((a, event) for a in active)
+            active.append(event)
+        return pairs
+
+
+@dataclass
+class IntervalQuery:
+    kind: str               # "salles_libres", "salle_libre", "creneaux_libres" ou "chevauchements"
+    start: datetime
+    end: datetime
+    formation: str = None   # code de formation (ISADS, Math&AS)
+    batiment: str = None
+    label: str = ""
+    salle: str = None       # salle citée (salle_libre)
+
+
+def _at(day: datetime, hour: str, minutes: str) -> datetime:
+    return day.replace(hour=int(hour) % 24, minute=int(minutes or 0))
+
+
+def match(question: str, buildings: list[str] = (), now: datetime = None, rooms: list[str] = ()):
+    """
+    Reconnaît une question de salles libres, de disponibilité d'une salle, de créneaux libres ou de chevauchements.
+    arg : buildings (bâtiments en base, pour reconnaître un bâtiment cité), rooms (salles en base, pour retrouver
+          le nom exact d'une salle citée)
+    return : IntervalQuery ou None
+    """
+    now = now or datetime.now()
+    text = normalize_question(question)
+    room = cited_room_pattern.search(text)
+    if free_room_pattern.search(text):
+        kind = "salle_libre" if room else "salles_libres"
+    elif overlap_pattern.search(text):
+        kind = "chevauchements"
+    elif free_slot_pattern.search(text):
+        kind = "creneaux_libres"
+    else:
+        return None
+
+    period = question_period(text, now)
+    formation = parse_formation(text)
+    batiment = next((b for b in buildings if b and normalize_question(b) in text), None)
+
+    if kind in ("salles_libres", "salle_libre"):
+        day = period.start if period else now.replace(second=0, microsecond=0)
+        if hours := range_pattern.search(text):
+            start, end = _at(day, hours.group(1), hours.group(2)), _at(day, hours.group(3), hours.group(4))
+        elif hour := hour_pattern.search(text):
+            start = _at(day, hour.group(1), hour.group(2))
+            end = start + DEFAULT_SLOT
+        elif period:
+            if period.end - period.start > timedelta(days=1):
+                return None     # "libre cette semaine" : pas un créneau précis
+            # jour (ou partie de journée) demandé, limité aux heures de cours
+            start = max(period.start, _at(period.start, DAY_START, 0))
+            end = min(period.end, _at(period.start, DAY_END, 0))
+            if end <= start:
+                return None
+        else:
+            start, end = day, day + DEFAULT_SLOT
+        label = f"{WEEKDAYS[start.weekday()]} {start:%d/%m} de {start:%Hh%M} à {end:%Hh%M}"
+        salle = None
+        if kind == "salle_libre":
+            code = room.group(1) or room.group(2)
+            salle = next((r for r in rooms if normalize_question(r.strip()) == code), code.upper())
+        return IntervalQuery(kind, start, end, formation, batiment, label, salle)
+
+    if kind == "chevauchements" and (re.search(r"\ben meme temps que\b", text)
+                                     or not (formation or own_schedule_pattern.search(text))):
+        # chevauchements avec un cours donné, ou sans emploi du temps désigné : pipeline LLM
+        return None
+    # créneaux libres et chevauchements : la période demandée, par défaut la semaine en cours
+    if period is None:
+        monday = datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
+        period = Period(monday, monday + timedelta(days=7), "cette semaine")
+    return IntervalQuery(kind, period.start, period.end, formation, batiment, period.label)
+
+
+def _hours(start: float, end: float) -> str:
+    return f"{to_datetime(start):%Hh%M}-{to_datetime(end):%Hh%M}"
+
+
+def _day(jd: float) -> str:
+    moment = to_datetime(jd)
+    return f"{WEEKDAYS[moment.weekday()]} {moment:%d/%m}"
+
+
+def answer(index: IntervalIndex, query: IntervalQuery) -> str:
+    """
+    Réponse rédigée sans LLM à partir de l'index.
+    """
+    start, end = to_jd(query.start), to_jd(query.end)
+    if query.kind == "salles_libres":
+        rooms = index.free_rooms(start, end, query.batiment)
+        where = f" ({query.batiment})" if query.batiment else ""
+        if not rooms:
+            return f"Aucune salle libre{where} {query.label}."
+        return (f"{len(rooms)} salle(s) libre(s){where} {query.label} :\n"
+                + "\n".join(f"- {salle}" + (f", {batiment}" if batiment else "") for salle, batiment in rooms))
+
+    if query.kind == "salle_libre":
+        salle = query.salle if query.salle in index.rooms else next(
+            (r for r in index.rooms if normalize_question(r) == normalize_question(query.salle)), None)
+        if salle is None:
+            return f"La salle {query.salle} n'apparaît pas dans l'emploi du temps : impossible de dire si elle est libre {query.label}."
+        if index.is_room_free(salle, start, end):
+            return f"Oui, la salle {salle} est libre {query.label}."
+        events = index.room_events(salle, start, end)
+        return (f"Non, la salle {salle} est occupée {query.label} :\n"
+                + "\n".join(f"- {e['cours'] or 'cours'}" + (f" ({e['type']})" if e["type"] else "")
+                             + f", {_hours(e['debut_jd'], e['fin_jd'])}" for e in events))
+
+    formations = [query.formation] if query.formation else sorted(index.formations)
+    lines = []
+    for formation in formations:
+        if query.kind == "creneaux_libres":
+            slots = index.free_slots(formation, start, end)
+            lines.append(f"Créneaux libres {formation} {query.label} :")
+            if not slots:
+                lines.append("- aucun")
+            lines.extend(f"- {_day(a)} {_hours(a, b)}" for a, b in slots)
+        else:
+            pairs = index.overlaps(formation, start, end)
+            if not pairs:
+                lines.append(f"Aucun chevauchement de cours {formation} {query.label}.")
+                continue
+            lines.append(f"{len(pairs)} chevauchement(s) de cours {formation} {query.label} :")
+            lines.extend(f"- {_day(a['debut_jd'])} : {a['cours']} ({_hours(a['debut_jd'], a['fin_jd'])}) "
+                         f"et {b['cours']} ({_hours(b['debut_jd'], b['fin_jd'])})" for a, b in pairs)
+    return "\n".join(lines)
+
+
+# requêtes SQL équivalentes sur la vue edt (dates en texte, formations concaténées), comme les génère le LLM
+legacy_free_rooms_sql = """
+    SELECT DISTINCT salle, batiment FROM edt e1 WHERE trim(salle) != '' AND NOT EXISTS (
+        SELECT 1 FROM edt e2 WHERE e2.salle = e1.salle AND e2.debut < :end AND e2.fin > :start)
+"""
+legacy_overlaps_sql = """
+    SELECT a.id, b.id FROM edt a JOIN edt b ON a.id < b.id AND a.debut < b.fin AND b.debut < a.fin
+    WHERE a.formation LIKE :formation AND b.formation LIKE :formation AND a.debut < :end AND a.fin > :start
+"""
+# mêmes requêtes sur les tables typées (jours juliens indexés)
+typed_free_rooms_sql = """
+    SELECT DISTINCT salle, batiment FROM evenement e1 WHERE trim(salle) != '' AND NOT EXISTS (
+        SELECT 1 FROM evenement e2 WHERE e2.salle = e1.salle AND e2.debut_jd < :end_jd AND e2.fin_jd > :start_jd)
+"""
+typed_overlaps_sql = """
+    SELECT a.evenement_id, b.evenement_id FROM evenement_formation a
+    JOIN formation f ON f.id = a.formation_id AND f.code = :code
+    JOIN evenement ea ON ea.id = a.evenement_id
+    JOIN evenement_formation b ON b.formation_id = a.formation_id AND b.evenement_id > a.evenement_id
+         AND b.debut_jd < ea.fin_jd AND b.debut_jd >= a.debut_jd - 1
+    JOIN evenement eb ON eb.id = b.evenement_id AND eb.fin_jd > ea.debut_jd
+    WHERE a.debut_jd < :end_jd AND ea.fin_jd > :start_jd
+"""
+
+
+def benchmark_interval_index(db_path: str = None, n_queries: int = 20, seed: int = 0) -> dict:
+    """
+    Salles libres et chevauchements sur des créneaux tirés au hasard : index d'intervalles contre SQL (vue edt
+    à dates texte, tables typées), avec vérification que les réponses sont identiques.
+    arg : db_path (base à interroger ; par défaut un emploi du temps synthétique de 3 ans et 12 formations)
+    """
+    import tempfile
+    import os
+    from Agent.SmartPlanner.edt_schema import create_schema, insert_events, synthetic_timetable
+
+    with tempfile.TemporaryDirectory() as folder:
+        if db_path is None:
+            db_path = os.path.join(folder, "edt.db")
+            connection = sqlite3.connect(db_path)
+            create_schema(connection)
+            with connection:
+                insert_events(connection, synthetic_timetable(n_years=3, n_formations=12))
+            connection.execute("ANALYZE")
+            connection.close()
+        connection = sqlite3.connect(db_path)
+        index, build_s = timed(IntervalIndex.from_connection, connection)
+        first, last = connection.execute("SELECT min(debut_jd), max(debut_jd) FROM evenement").fetchone()
+        # codes dont aucun n'est le préfixe d'un autre : le LIKE '%code%' des requêtes texte reste exact
+        codes = [c for c in sorted(index.formations) if not any(o != c and o.startswith(c) for o in index.formations)]
+        rng = random.Random(seed)
+        windows = []
+        for _ in range(n_queries):
+            day = to_datetime(rng.uniform(first, last)).replace(hour=rng.randint(8, 18), minute=0, second=0, microsecond=0)
+            windows.append((day, day + timedelta(hours=rng.choice([1, 2])), rng.choice(codes)))
+
+        def params(start, end, code):
+            return {"start": start.isoformat(), "end": end.isoformat(), "start_jd": to_jd(start), "end_jd": to_jd(end),
+                    "formation": f"%{code}%", "code": code}
+
+        results = {"events": index.size, "rooms": len(index.rooms), "build_ms": round(1000 * build_s, 1)}
+        modes = {
+            "free_rooms": (
+                lambda s, e, c: {r[0] for r in index.free_rooms(to_jd(s), to_jd(e))},
+                legacy_free_rooms_sql, typed_free_rooms_sql, lambda rows: {r[0].strip() for r in rows}),
+            "overlaps": (
+                lambda s, e, c: {tuple(sorted((a["id"], b["id"]))) for a, b in index.overlaps(c, to_jd(s), to_jd(e))},
+                legacy_overlaps_sql, typed_overlaps_sql, lambda rows: {tuple(sorted(r)) for r in rows}),
+        }
+        for name, (from_index, legacy_sql, typed_sql, to_set) in modes.items():
+            # chevauchements : sur la journée entière du créneau tiré
+            day_windows = windows if name == "free_rooms" else [
+                (s.replace(hour=0), s.replace(hour=0) + timedelta(days=1), c) for s, _, c in windows]
+            latencies = {"interval_index": [], "sql_text_dates": [], "sql_typed": []}
+            mismatches = 0
+            for start, end, code in day_windows:
+                expected, duration = timed(from_index, start, end, code)
+                latencies["interval_index"].append(duration)
+                for mode, sql in (("sql_text_dates", legacy_sql), ("sql_typed", typed_sql)):
+                    rows, duration = timed(lambda: connection.execute(sql, params(start, end, code)).fetchall())
+                    latencies[mode].append(duration)
+                    mismatches += to_set(rows) != expected
+            results[name] = {mode: summarize(values) for mode, values in latencies.items()}
+            results[name]["mismatches"] = mismatches
+        connection.close()
+    return results
@@ -0,0 +1,180 @@
+from collections import Counter
+from datetime import datetime
+from utils.tokens import estimate_tokens
+from utils.benchmark import timed, atimed
+import itertools
+
+# Mise en forme des résultats SQL de SmartPlanner avant le LLM :
+# - forme compacte en colonnes (en-tête unique, colonnes constantes sorties du tableau, lignes groupées par jour)
+# - résumé (nombre de lignes, plage de dates, valeurs les plus fréquentes) au-delà de SUMMARY_THRESHOLD lignes
+# - tableau markdown renvoyé tel quel à l'utilisateur pour les résultats tabulaires, sans appel au LLM
+
+SUMMARY_THRESHOLD = 40      # au-delà : résumé et seulement les DETAIL_ROWS premières lignes dans le prompt
+DETAIL_ROWS = 20
+TABLE_MIN_ROWS = 3          # à partir de 3 lignes et 2 colonnes, le résultat est rendu en tableau markdown
+WEEKDAYS = ["lun.", "mar.", "mer.", "jeu.", "ven.", "sam.", "dim."]
+
+
+def _as_datetime(value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _columns(rows: list[dict]) -> list:
+    return list(rows[0].keys()) if rows else []
+
+
+def split_constant_columns(rows: list[dict]):
+    """
+    return : ({colonne: valeur} des colonnes identiques sur toutes les lignes, colonnes qui varient)
+    """
+    columns = _columns(rows)
+    if len(rows) < 2:
+        return {}, columns
+    constant = {c: rows[0][c] for c in columns if all(r[c] == rows[0][c] for r in rows)}
+    return constant, [c for c in columns if c not in constant]
+
+
+def _has_schedule(columns, rows) -> bool:
+    return "debut" in columns and all(_as_datetime(r["debut"]) for r in rows)
+
+
+def _hours(row: dict) -> str:
+    debut = _as_datetime(row["debut"])
+    fin = _as_datetime(row.get("fin")) if row.get("fin") else None
+    return f"{debut:%Hh%M}" + (f"-{fin:%Hh%M}" if fin else "")
+
+
+def verbose_result(rows: list[dict]) -> str:
+    # ancien format : "colonne: valeur" répété sur chaque ligne (gardé pour comparaison)
+    columns = _columns(rows)
+    if not rows:
+        return "No results found."
+    data = "\n".join(", ".join(f"{col}: {row[col]}" for col in columns) for row in rows)
+    return f"{', '.join(columns)}\n{data}"
+
+
+def summarize_rows(rows: list[dict], columns: list = None) -> str:
+    """
+    Résumé d'un grand résultat : nombre de lignes, plage de dates, plage des valeurs numériques
+    et valeurs les plus fréquentes des colonnes texte.
+    arg : columns (colonnes à résumer, toutes par défaut)
+    """
+    lines = [f"{len(rows)} lignes."]
+    for column in columns or _columns(rows):
+        values = [r[column] for r in rows if r[column] not in (None, "")]
+        if not values:
+            continue
+        dates = [_as_datetime(v) for v in values] if column in ("debut", "fin") else []
+        if dates and all(dates):
+            lines.append(f"{column} : du {min(dates):%d/%m/%Y %Hh%M} au {max(dates):%d/%m/%Y %Hh%M}")
+        elif all(isinstance(v, (int, float)) for v in values):
+            lines.append(f"{column} : de {min(values)} à {max(values)}")
+        else:
+            counts = Counter(values)
+            top = ", ".join(f"{v} ×{n}" for v, n in counts.most_common(5))
+            lines.append(f"{column} : {len(counts)} valeurs distinctes (les plus fréquentes : {top})")
+    return "\n".join(lines)
+
+
+def compact_result(rows: list[dict], truncated: bool = False) -> str:
+    """
+    Forme compacte d'un résultat pour le prompt : colonnes constantes écrites une fois, en-tête unique,
+    séances groupées par jour (horaire seul sur chaque ligne), résumé au-delà de SUMMARY_THRESHOLD lignes.
+    """
+    if not rows:
+        return "No results found."
+    constant, varying = split_constant_columns(rows)
+    lines = []
+    if constant:
+        lines.append("Identique pour toutes les lignes : " + ", ".join(f"{c} = {v}" for c, v in constant.items()))
+    shown = rows
+    if len(rows) > SUMMARY_THRESHOLD:
+        lines.append(summarize_rows(rows, varying))
+        shown = rows[:DETAIL_ROWS]
+        lines.append(f"{DETAIL_ROWS} premières lignes :")
+
+    if _has_schedule(varying, shown):
+        others = [c for c in varying if c not in ("debut", "fin")]
+        lines.append(" | ".join(["horaire"] + others))
+        # lignes consécutives du même jour sous un seul titre (l'ordre de la requête est conservé)
+        for day, group in itertools.groupby(shown, key=lambda r: _as_datetime(r["debut"]).date()):
+            lines.append(f"{WEEKDAYS[day.weekday()]} {day:%d/%m/%Y} :")
+            lines.extend(" | ".join([_hours(r)] + [str(r[c]) for c in others]) for r in group)
+    else:
+        lines.append(" | ".join(varying))
+        lines.extend(" | ".join(str(r[c]) for c in varying) for r in shown)
+    if truncated:
+        lines.append("(résultat tronqué)")
+    return "\n".join(lines)
+
+
+def is_tabular(rows: list[dict]) -> bool:
+    return len(rows) >= TABLE_MIN_ROWS and len(_columns(rows)) >= 2
+
+
+def markdown_table(rows: list[dict], truncated: bool = False) -> str:
+    """
+    Réponse directe (sans LLM) pour un résultat tabulaire : colonnes constantes en phrase d'introduction,
+    puis un tableau markdown ; debut/fin deviennent les colonnes jour et horaire.
+    """
+    constant, varying = split_constant_columns(rows)
+    schedule = _has_schedule(varying, rows)
+    others = [c for c in varying if c not in ("debut", "fin")] if schedule else varying
+    header = (["jour", "horaire"] if schedule else []) + others
+
+    def cells(row):
+        if schedule:
+            debut = _as_datetime(row["debut"])
+            yield f"{WEEKDAYS[debut.weekday()]} {debut:%d/%m/%Y}"
+            yield _hours(row)
+        for c in others:
+            yield str(row[c] if row[c] is not None else "").replace("|", "\\|").strip()
+
+    lines = [f"{len(rows)} résultats" + (" (liste tronquée)" if truncated else "") + " :"]
+    if constant:
+        lines[0] += "\n\n" + "\n".join(f"- {c} : {v}" for c, v in constant.items())
+    lines.append("")
+    lines.append("| " + " | ".join(header) + " |")
+    lines.append("|" + "---|" * len(header))
+    lines.extend("| " + " | ".join(cells(r)) + " |" for r in rows)
+    return "\n".join(lines)
+
+
+async def benchmark_rendering(db_path: str, queries: list[str], with_llm: bool = False) -> dict:
+    """
+    Sur des requêtes à gros résultats : tokens du résultat dans le prompt (ancien format vs forme compacte),
+    temps de mise en forme et, si with_llm, latence de la rédaction par le LLM avec chaque format
+    comparée au tableau markdown sans LLM.
+    """
+    from Agent.SmartPlanner.sql_engine import ReadOnlyPool
+    from utils.utils import llm
+
+    pool = ReadOnlyPool(db_path)
+    results = []
+    for sql in queries:
+        rows = pool.execute(sql, max_rows=5000).rows
+        verbose, verbose_s = timed(verbose_result, rows)
+        compact, compact_s = timed(compact_result, rows)
+        table, table_s = timed(markdown_table, rows)
+        entry = {
+            "sql": sql, "rows": len(rows),
+            "verbose_tokens": estimate_tokens(verbose), "compact_tokens": estimate_tokens(compact),
+            "render_ms": {"verbose": round(1000 * verbose_s, 2), "compact": round(1000 * compact_s, 2),
+                          "markdown_table": round(1000 * table_s, 2)},
+        }
+        if with_llm:
+            for name, text in (("verbose", verbose), ("compact", compact)):
+                prompt = f"SQL Query: {sql}\nResult: {text}\nFormule une réponse claire et compréhensible à la question initiale."
+                _, duration = await atimed(llm.ainvoke(prompt))
+                entry[f"llm_{name}_s"] = round(duration, 3)
+        results.append(entry)
+    verbose_total, compact_total = sum(r["verbose_tokens"] for r in results), sum(r["compact_tokens"] for r in results)
+    return {
+        "queries": results,
+        "mean_verbose_tokens": round(verbose_total / len(results), 1),
+        "mean_compact_tokens": round(compact_total / len(results), 1),
+        "token_reduction": round(1 - compact_total / verbose_total, 3) if verbose_total else 0.0,
+    }
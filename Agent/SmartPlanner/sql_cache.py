@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from utils import metrics
+import threading
+import re
+import os
+
+# Cache des résultats SQL de SmartPlanner, partagé par toutes les sessions : les étudiants d'une même formation posent
+# les mêmes questions, qui produisent les mêmes requêtes. Une entrée garde les lignes et la réponse rédigée,
+# elle est indexée par le SQL normalisé (et ses paramètres liés), et tout le cache est vidé quand edt.db change.
+# Les requêtes relatives à la date courante ont cette date dans leur clé ; celles qui utilisent random() ne sont
+# pas mises en cache.
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Espaces, casse et ";" final ignorés en dehors des chaînes littérales (qui restent intactes).
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts)).strip()
+
+
+# fonctions dont le résultat dépend de l'heure de l'exécution (date('now'), CURRENT_DATE...) ou du hasard
+now_pattern = re.compile(r"'now'|\bcurrent_(time|timestamp)\b")
+today_pattern = re.compile(r"\bcurrent_date\b")
+random_pattern = re.compile(r"\brandom(blob)?\s*\(")
+
+
+def cache_key(sql: str, params: dict = None, now: datetime = None):
+    """
+    Clé du SQL normalisé et des paramètres liés qu'il utilise. Une requête relative à l'heure courante ('now',
+    CURRENT_TIMESTAMP) a l'heure à la minute dans sa clé, une requête relative au jour (CURRENT_DATE) la date :
+    le même SQL posé le lendemain n'est pas servi avec les lignes de la veille.
+    return : la clé, ou None pour une requête qui ne doit pas être mise en cache (random())
+    """
+    normalized = normalize_sql(sql)
+    if random_pattern.search(normalized):
+        return None
+    # seuls les paramètres utilisés par la requête font partie de la clé
+    used = sorted((k, str(v)) for k, v in (params or {}).items() if re.search(rf":{k}\b", sql))
+    key = normalized + ("|" + repr(used) if used else "")
+    now = now or datetime.now()
+    if now_pattern.search(normalized):
+        key += f"|@{now.isoformat(timespec='minutes')}"
+    elif today_pattern.search(normalized):
+        key += f"|@{now.date().isoformat()}"
+    return key
+
+
+def db_version(db_path: str) -> tuple:
+    """
+    Version de edt.db : dates de modification de la base et de son journal WAL (les écritures en mode WAL
+    ne touchent la base qu'au checkpoint).
+    """
+    version = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            version.append(os.path.getmtime(path))
+        except OSError:
+            version.append(0)
+    return tuple(version)
+
+
+@dataclass
+class SQLCacheEntry:
+    rows: list
+    result: str             # lignes mises en forme pour le LLM
+    answer: str = ""        # réponse rédigée, renseignée après generate_human_readable_answer
+
+
+class SQLResultCache:
+    def __init__(self, db_path: str, max_size: int = 512):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        # appelé sous le verrou : edt.db a changé (ré-import de l'emploi du temps), toutes les entrées sont périmées
+        version = db_version(self.db_path)
+        if version != self.version:
+            if self.entries:
+                metrics.incr("sql_cache.invalidations")
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key: str):
+        """
+        return : l'entrée en cache (lignes et éventuellement réponse) ou None
+        """
+        with self._lock:
+            self._check_version()
+            entry = self.entries.get(key)
+            if entry is None:
+                metrics.incr("sql_cache.misses")
+                return None
+            self.entries.move_to_end(key)
+            metrics.incr("sql_cache.hits")
+            if entry.answer:
+                metrics.incr("sql_cache.answer_hits")
+            return entry
+
+    def put(self, key: str, rows: list, result: str):
+        with self._lock:
+            self._check_version()
+            self.entries[key] = SQLCacheEntry(rows, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def set_answer(self, key: str, answer: str):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and answer:
+                entry.answer = answer
+
+    def invalidate(self):
+        with self._lock:
+            self.entries.clear()
+
+    @staticmethod
+    def stats() -> dict:
+        hits, misses = metrics.get("sql_cache.hits"), metrics.get("sql_cache.misses")
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            # hits qui ont aussi évité l'appel LLM de rédaction
+            "answer_hits": int(metrics.get("sql_cache.answer_hits")),
+            "invalidations": int(metrics.get("sql_cache.invalidations")),
+        }
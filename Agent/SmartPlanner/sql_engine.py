@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from utils.benchmark import summarize, timed
+import threading
+import sqlite3
+import queue
+import time
+import re
+
+# Exécution des requêtes SQL de SmartPlanner (générées par le LLM ou par le chemin rapide) :
+# - pool de connexions SQLite en lecture seule (mode=ro, query_only, authorizer limité à la lecture)
+# - une seule instruction SELECT / WITH par requête
+# - garde EXPLAIN QUERY PLAN : les plans qui parcourent entièrement plusieurs tables (produit cartésien) sont refusés
+# - budget de temps par requête (progress handler), lecture par blocs et nombre de lignes plafonné
+
+MAX_ROWS = 200
+TIMEOUT_S = 2.0
+# attente maximale d'une connexion du pool quand les `size` connexions sont occupées
+POOL_TIMEOUT_S = 10.0
+FETCH_SIZE = 50
+
+# actions autorisées par l'authorizer SQLite : lecture uniquement
+_allowed_actions = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                    getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+# pragmas en lecture seule lancés en interne par FTS5 à chaque requête sur edt_fts
+_allowed_pragmas = {"data_version"}
+
+
+class QueryRejected(Exception):
+    """Requête refusée avant exécution (écriture, instructions multiples, plan trop coûteux)."""
+
+
+@dataclass
+class QueryResult:
+    columns: list
+    rows: list          # liste de dicts
+    truncated: bool     # plus de max_rows lignes : seules les max_rows premières sont gardées
+    duration: float
+
+
+def _authorizer(action, *args):
+    if action == sqlite3.SQLITE_PRAGMA and args[0] in _allowed_pragmas:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_OK if action in _allowed_actions else sqlite3.SQLITE_DENY
+
+
+def check_statement(sql: str) -> str:
+    """
+    return : la requête sans ";" final, si c'est une seule instruction de lecture
+    """
+    sql = sql.strip().rstrip(";").strip()
+    # ";" hors des chaînes littérales : plusieurs instructions
+    if ";" in re.sub(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", "", sql):
+        raise QueryRejected("une seule instruction SQL est autorisée")
+    if not re.match(r"(?is)^(select|with)\b", sql):
+        raise QueryRejected("seules les requêtes SELECT sont autorisées")
+    return sql
+
+
+def check_plan(connection: sqlite3.Connection, sql: str, params: dict = None):
+    """
+    Refuse les plans qui parcourent entièrement (SCAN) plusieurs tables : jointure sans condition exploitable,
+    coût en produit des tailles des tables. Une recherche MATCH dans l'index FTS (plan "VIRTUAL TABLE INDEX n:M...")
+    n'est pas un parcours complet.
+    """
+    plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params or {})]
+    scans = [detail for detail in plan if re.match(r"SCAN (?!CONSTANT ROW|SUBQUERY|\()", detail)
+             and not re.search(r"VIRTUAL TABLE INDEX \d+:\S*M", detail)]
+    if len(scans) > 1:
+        raise QueryRejected(f"plan de requête refusé (produit cartésien) : {'; '.join(scans)}")
+    return plan
+
+
+class ReadOnlyPool:
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._connections = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            connection.execute("PRAGMA query_only = ON")
+            # le constructeur de la table virtuelle FTS5 lit sqlite_master : il est chargé avant de poser l'authorizer
+            try:
+                connection.execute("SELECT 1 FROM edt_fts LIMIT 0").fetchall()
+            except sqlite3.OperationalError as e:
+                if "no such table" not in str(e):
+                    raise
+                # ancienne base sans index plein texte
+            connection.set_authorizer(_authorizer)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    @contextmanager
+    def connection(self, timeout_s: float = POOL_TIMEOUT_S):
+        """
+        Connexions ouvertes à la demande, au plus `size` ; au-delà on attend qu'une connexion soit rendue.
+        raise : sqlite3.OperationalError (edt.db impossible à ouvrir, ou aucune connexion rendue avant timeout_s)
+        """
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                self._opened += can_open
+            if can_open:
+                try:
+                    connection = self._open()
+                except Exception:
+                    # ouverture ratée (base absente ou verrouillée) : la place est rendue au pool
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    connection = self._connections.get(timeout=timeout_s)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"no database connection available after {timeout_s}s")
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    def execute(self, sql: str, params: dict = None, max_rows: int = MAX_ROWS, timeout_s: float = TIMEOUT_S) -> QueryResult:
+        """
+        Exécute une requête de lecture dans le budget de temps, en lisant au plus max_rows lignes.
+        raise : QueryRejected (requête refusée), sqlite3.OperationalError ("interrupted" si le budget est dépassé)
+        """
+        sql = check_statement(sql)
+        start = time.perf_counter()
+        with self.connection() as connection:
+            deadline = start + timeout_s
+            # appelé toutes les 1000 instructions de la VM SQLite : une valeur non nulle interrompt la requête
+            connection.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+            try:
+                check_plan(connection, sql, params)
+                cursor = connection.execute(sql, params or {})
+                columns = [d[0] for d in cursor.description]
+                rows = []
+                while len(rows) <= max_rows:
+                    block = cursor.fetchmany(FETCH_SIZE)
+                    if not block:
+                        break
+                    rows.extend(block)
+                cursor.close()
+            finally:
+                connection.set_progress_handler(None, 0)
+        truncated = len(rows) > max_rows
+        rows = [dict(zip(columns, row)) for row in rows[:max_rows]]
+        return QueryResult(columns, rows, truncated, time.perf_counter() - start)
+
+
+def benchmark_concurrent(db_path: str, queries: list[str], n_sessions: int = 20, n_rounds: int = 5) -> dict:
+    """
+    n_sessions sessions simultanées exécutant les mêmes requêtes : une session SQLAlchemy ouverte par requête
+    et fetchall (ancien chemin) vs le pool en lecture seule (lecture plafonnée).
+    """
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    session_factory = sessionmaker(bind=create_engine(f"sqlite:///{db_path}"))
+    pool = ReadOnlyPool(db_path)
+
+    def old_path(sql):
+        session = session_factory()
+        try:
+            return session.execute(text(sql)).fetchall()
+        finally:
+            session.close()
+
+    results = {}
+    for mode, run in (("session_per_query", old_path), ("read_only_pool", pool.execute)):
+        latencies = []
+        with ThreadPoolExecutor(max_workers=n_sessions) as executor:
+            _, total = timed(lambda: [latencies.append(d) for _, d in executor.map(
+                lambda sql: timed(run, sql), queries * n_sessions * n_rounds)])
+        results[mode] = {"queries_per_s": round(len(latencies) / total, 1), **summarize(latencies)}
+    return results
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from utils.lexical_index import BM25Index
+from utils import metrics
+from Agent.SmartPlanner.sql_cache import normalize_sql
+import threading
+import atexit
+import json
+import time
+import os
+
+# Exemples few-shot pour la génération SQL de SmartPlanner : les couples (question, requête SQL) qui ont réussi
+# et renvoyé des lignes sont gardés dans un fichier JSON. À la génération, les k questions les plus proches (BM25)
+# sont ajoutées au prompt, ce qui évite une partie des boucles de reformulation (deux appels LLM par tentative).
+# Une entrée par requête SQL normalisée (la question la plus récente est gardée), éviction des moins utilisées.
+# Seules les requêtes réussies du premier coup, qui ont renvoyé des lignes et reçu une réponse, deviennent des exemples.
+# Le fichier est réécrit par lots (toutes les SAVE_EVERY nouvelles entrées, et à l'arrêt), dans un thread.
+
+EXEMPLARS_PATH = r"Agent\SmartPlanner\data\sql_exemplars.json"
+MAX_EXEMPLARS = 200
+TOP_K = 3
+SAVE_EVERY = 10
+
+
+class ExemplarStore:
+    def __init__(self, path: str = EXEMPLARS_PATH, max_size: int = MAX_EXEMPLARS):
+        self.path = path
+        self.max_size = max_size
+        self.entries = OrderedDict()    # SQL normalisé -> {"question", "sql", "uses", "added"}, du moins au plus récemment utilisé
+        self.index = None               # BM25 sur les questions, reconstruit à la demande après une modification
+        self.unsaved = 0                # modifications pas encore écrites dans le fichier
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for entry in json.load(f):
+                    self.entries[normalize_sql(entry["sql"])] = entry
+        except (OSError, ValueError):
+            pass    # pas encore d'exemples
+
+    def save(self):
+        # écriture dans un fichier temporaire puis remplacement : jamais de fichier à moitié écrit
+        with self._lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+            self.unsaved = 0
+        with self._save_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+    def flush(self):
+        """
+        Écrit les modifications en attente (appelé à l'arrêt du processus).
+        """
+        if self.unsaved:
+            self.save()
+
+    def _index(self) -> BM25Index:
+        if self.index is None:
+            self.index = BM25Index()
+            for key, entry in self.entries.items():
+                self.index.add(key, entry["question"])
+        return self.index
+
+    def add(self, question: str, sql: str):
+        """
+        Enregistre une requête qui a réussi et renvoyé des lignes.
+        """
+        key = normalize_sql(sql)
+        question = " ".join(question.split())
+        with self._lock:
+            # la même question avec une autre requête : l'ancienne requête est remplacée
+            for other in [k for k, e in self.entries.items() if k != key and e["question"].lower() == question.lower()]:
+                del self.entries[other]
+            entry = self.entries.pop(key, None) or {"uses": 0, "added": time.time()}
+            entry.update(question=question, sql=sql.strip())
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                metrics.incr("sql_exemplars.evictions")
+            self.index = None
+            self.unsaved += 1
+            save = self.unsaved >= SAVE_EVERY
+        if save:
+            # réécriture du fichier hors de la boucle d'événements et du verrou
+            threading.Thread(target=self.save, daemon=True).start()
+
+    def search(self, question: str, k: int = TOP_K) -> list[dict]:
+        """
+        return : les k exemples dont la question est la plus proche (score BM25 non nul)
+        """
+        with self._lock:
+            if not self.entries:
+                return []
+            index = self._index()
+            found = [self.entries[index.ids[position]] for position, score in index.search(question, k) if score > 0]
+            for entry in found:
+                entry["uses"] += 1
+                self.entries.move_to_end(normalize_sql(entry["sql"]))
+            return found
+
+    def prompt_block(self, question: str, k: int = TOP_K) -> str:
+        """
+        Exemples à ajouter au prompt système (accolades doublées : le prompt passe par ChatPromptTemplate).
+        """
+        exemplars = self.search(question, k)
+        metrics.incr("sql_exemplars.lookups")
+        if not exemplars:
+            return ""
+        metrics.incr("sql_exemplars.injected")
+        lines = ["Exemples de questions déjà traduites avec succès (adapte-les, ne les recopie pas si la question diffère) :"]
+        for entry in exemplars:
+            lines.append(f"Question : {entry['question']}\nSQL : {entry['sql']}")
+        return "\n\n" + "\n\n".join(lines).replace("{", "{{").replace("}", "}}")
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.index = None
+        self.save()
+
+
+def record_question(state: dict, store: ExemplarStore = None):
+    """
+    Bilan d'une question d'emploi du temps passée par le pipeline LLM : réussite au premier essai et appels LLM.
+    Une requête réussie au premier essai, qui a renvoyé des lignes et reçu une réponse, est ajoutée aux exemples.
+    arg : store (exemples few-shot, None pour ne rien ajouter)
+    """
+    metrics.incr("smartplanner.llm_questions")
+    metrics.incr("smartplanner.llm_calls", state.get("llm_calls", 0))
+    first_try = state.get("attempts", 0) == 0 and not state.get("sql_error")
+    if first_try:
+        metrics.incr("smartplanner.first_try")
+    sql = (state.get("sql_query") or "").strip()
+    if (store is not None and first_try and state.get("query_rows") and state.get("exemplars", True)
+            and sql.lower().startswith("select")):
+        store.add(state.get("original_question") or state["question"], sql)
+
+
+def question_stats() -> dict:
+    questions = metrics.get("smartplanner.llm_questions")
+    return {
+        "questions": int(questions),
+        "first_attempt_success_rate": metrics.ratio("smartplanner.first_try", "smartplanner.llm_questions"),
+        "llm_calls_per_question": metrics.get("smartplanner.llm_calls") / questions if questions else 0.0,
+        "exemplars_injected_rate": metrics.ratio("sql_exemplars.injected", "sql_exemplars.lookups"),
+    }
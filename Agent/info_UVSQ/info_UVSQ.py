@@ -1,41 +1,46 @@
 from langchain_core.messages import AnyMessage, HumanMessage
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from langchain_core.tools import tool
 from utils.utils import llm
+from utils.handle import stream_graph_answer, create_batched_retrieval_node
+from utils.retrieval import retrieve_groups, collection_version
+from utils.semantic_cache import stream_with_cache
+from utils.context_packing import PackingConfig, record_llm_call
 from langchain_core.messages import SystemMessage
 import functools
-import chromadb
 import logging
+import asyncio
+import time
+import os
 
 from typing import Annotated
 from typing_extensions import TypedDict
 from dotenv import load_dotenv
 load_dotenv()
 
+COLLECTION_PATH = r"Agent/info_UVSQ/DBv"
+COLLECTION_NAME = "UVSQ_DOCS"
+# contextes envoyés au LLM : sélectionnés parmi les candidats de la recherche dans un budget de tokens (réglable par variable d'environnement)
+CONTEXT_PACKING = PackingConfig("info_UVSQ", token_budget=int(os.environ.get("UVSQ_CONTEXT_TOKENS", 1200)))
+
 @tool
-def retrieve_context(query: str):
-    """Utilise les contextes les plus liés à la question de l'utilisateur pour y répondre. Ces contextes sont extraits du site de l'UVSQ."""
-    ef = SentenceTransformerEmbeddingFunction(model_name="intfloat/multilingual-e5-large")
-    collection_path = r"Agent/info_UVSQ/DBv"
-    collection_name = "UVSQ_DOCS"
-    client = chromadb.PersistentClient(path=collection_path)
-    collection = client.get_collection(name=collection_name, embedding_function=ef)
-    contexts = collection.query(
-        query_texts=[query],
-        n_results=3
-        )
-    # log les contextes
-    context_list = contexts['documents'][0]
-    formatted_context = "\n\n".join(
-        f"Contexte {i + 1} :\n{doc}" for i, doc in enumerate(context_list)
-    )
-    logging.info(f"[CONTEXT] pour query='{query}' :\n{formatted_context}")
-    return formatted_context
+async def retrieve_context(queries: list[str]):
+    """Utilise les contextes les plus liés à la question de l'utilisateur pour y répondre. Ces contextes sont extraits du site de l'UVSQ. Passe la question dans `queries` ; si elle porte sur plusieurs points, passe une sous-question par point dans la même liste."""
+    # requête Chroma et encodage synchrones : exécutés dans un thread
+    return (await asyncio.to_thread(query_contexts_groups, [queries]))[0]
+
+
+def query_contexts_groups(groups: list[list[str]]) -> list[str]:
+    # recherche hybride dense (Chroma) + lexicale (BM25) de toutes les requêtes en un seul lot, modèle et collection partagés par le processus
+    contexts = retrieve_groups(COLLECTION_PATH, COLLECTION_NAME, groups, CONTEXT_PACKING)
+    logging.info(f"[CONTEXT] pour queries={groups} :\n" + "\n\n".join(contexts))
+    return contexts
 
 
+def query_contexts(query: str) -> str:
+    return query_contexts_groups([[query]])[0]
 
 
 # ---- State
@@ -45,7 +50,7 @@ class StateUVSQ(TypedDict):
 # ---- Agent
 class info_UVSQ():
 
-    def __init__(self):
+    def __init__(self, pre_retrieval: bool = False):
         
         self.system_prompt = """
         Tu es un assistant conçu et spécialisé pour répondre aux informations sur le site de l'UVSQ (l'Université Versailles Saint-Quentin en Yvelines).
@@ -58,83 +63,131 @@ class info_UVSQ():
         1. Appelle `retrieve_context` avec la question posée.
         2. Utilise les extraits des pages du site retournés pour construire une réponse structurée, pédagogique et exacte.
         """
+        self.pre_retrieval_prompt = """
+        Tu es un assistant conçu et spécialisé pour répondre aux informations sur le site de l'UVSQ (l'Université Versailles Saint-Quentin en Yvelines).
+        Des extraits des pages du site liés à la question ont déjà été récupérés : ils figurent à la fin de ce message.
+        Utilise-les pour construire une réponse structurée, pédagogique et exacte.
+
+        Tu ne dois pas deviner la réponse toi-même sans contexte. Si ces extraits ne suffisent pas, appelle le tool `retrieve_context` avec une question plus précise.
+        """
+        # mode pre-retrieval : les contextes sont récupérés directement sur la question, avant l'unique appel au LLM
+        self.pre_retrieval = pre_retrieval
+        if pre_retrieval:
+            self.system_prompt = self.pre_retrieval_prompt
         
         tools = [retrieve_context]
         self.tooled_llm = llm.bind_tools(tools)
         
         builder = StateGraph(StateUVSQ)
         builder.add_node("tool_calling_llm", functools.partial(self.tool_calling_llm))
-        builder.add_node("tools", ToolNode(tools))
-
-        builder.add_edge(START, "tool_calling_llm")
+        # les appels parallèles à retrieve_context sont regroupés en une seule recherche
+        builder.add_node("tools", create_batched_retrieval_node(query_contexts_groups))
+
+        if pre_retrieval:
+            builder.add_node("pre_retrieve", self.pre_retrieve)
+            builder.add_edge(START, "pre_retrieve")
+            builder.add_edge("pre_retrieve", "tool_calling_llm")
+        else:
+            builder.add_edge(START, "tool_calling_llm")
         builder.add_conditional_edges("tool_calling_llm", tools_condition)
         builder.add_edge("tools", "tool_calling_llm")
 
         self.graph = builder.compile()
 
+    async def pre_retrieve(self, state: StateUVSQ) -> StateUVSQ:
+        # ajoute les contextes récupérés sur la question au message système (même id : le message est remplacé)
+        system, question = state["messages"][0], state["messages"][-1]
+        contexts = await asyncio.to_thread(query_contexts, question.content)
+        return {"messages": [SystemMessage(content=f"{system.content}\n\nExtraits récupérés :\n{contexts}", id=system.id)]}
+
     async def tool_calling_llm(self, state: StateUVSQ) -> StateUVSQ:
+        start = time.perf_counter()
         result = await self.tooled_llm.ainvoke(state["messages"])
+        record_llm_call("info_UVSQ", result, time.perf_counter() - start)
         return {"messages": state["messages"] + [result]}
 
-    async def ask_info_UVSQ(self, query: str):
-        response = await self.graph.ainvoke({"messages": [SystemMessage(content=self.system_prompt), HumanMessage(content=query)]})
+    def initial_messages(self, query: str, history: str = "") -> list:
+        # historique budgété de la session (GlobalStateManager.get_context) ajouté au message système
+        system = self.system_prompt + (f"\n\nHistorique de la conversation :\n{history}" if history else "")
+        return [SystemMessage(content=system), HumanMessage(content=query)]
+
+    async def ask_info_UVSQ(self, query: str, history: str = ""):
+        response = await self.graph.ainvoke({"messages": self.initial_messages(query, history)})
         return response
 
+    def stream_info_UVSQ(self, query: str, history: str = ""):
+        """
+        Version streamée (et mise en cache) de ask_info_UVSQ : générateur asynchrone des tokens de la réponse finale.
+        arg : history (contexte de la conversation pour une question de suivi ; la réponse n'est alors pas mise en cache)
+        """
+        tokens = stream_graph_answer(
+            self.graph,
+            {"messages": self.initial_messages(query, history)},
+            nodes=("tool_calling_llm",),
+            tool_nodes=("tool_calling_llm",),
+            final_answer=lambda state: state["messages"][-1].content,
+        )
+        if history:
+            return tokens
+        # les questions quasi identiques déjà traitées (toutes sessions confondues) sont servies depuis le cache
+        return stream_with_cache("info_UVSQ", query, collection_version(COLLECTION_PATH, COLLECTION_NAME), tokens)
+
 
 # ----------- TEST -----------
-# import asyncio
-# import logging
+queries = [
+    "Quelle place occupe l'UVSQ dans le classement CWUR 2024 ?  ²",
+    "Quelles formations de master reconnues internationalement propose l'UVSQ ?",
+    "Quel est le rôle de l'UVSQ au sein de l'Université Paris-Saclay ?",
+    "Qu'est-ce qui a été mis en avant lors de l'édition d'avril 2022 dans la revue « Décisions Achats » ?",
+    "Quels types d'espaces sont accessibles aux étudiants pour se détendre ou travailler sur les campus de l’UVSQ ?",
+    "Quelles salles peut-on réserver à la Maison de l’Étudiant Marta Pan à Saint-Quentin-en-Yvelines ?",
+    "Où se trouve la Maison de l'Étudiant Marta Pan et à quoi sert-elle ?",
+    "Quels partenaires proposent des tarifs réduits aux étudiants de l’UVSQ ?",
+    "L’UVSQ propose-t-elle des aides pour accéder à des salles de sport ou des activités de loisir ?",
+    "Existe-t-il un partenariat entre l’UVSQ et des clubs de tennis ou de fitness ?",
+    "Que propose l’UVSQ en cas de règles menstruelles douloureuses ?",
+    "Le port du masque est-il encore obligatoire à l’UVSQ ?",
+    "Qui peut-on contacter en cas de détresse psychologique sur un campus de l’UVSQ ?",
+    "Que faire si je me blesse pendant un stage ou sur le campus ?",
+    "Quels aménagements sont proposés par l’UVSQ pour les examens des étudiants en situation de handicap ?",
+    "Est-il possible d’obtenir une transcription en braille ou l’assistance d’un interprète LSF à l’UVSQ ?",
+    "Le service handicap de l’UVSQ peut-il fournir un secrétaire pour rédiger les examens ?",
+    "Quels sont les numéros d'urgence disponibles pour les victimes de harcèlement ou de violences à l’UVSQ ?",
+    "Quelles associations partenaires peuvent accompagner les victimes de violences dans les Yvelines ?",
+    "À qui s’adresser en cas de harcèlement sexuel à l’université ?",
+    "Quels dispositifs sont mis en place par l’UVSQ pour lutter contre les discriminations et agissements sexistes ?",
+    "Qu’est-ce que le dispositif Culture-ActionS du CROUS et à quoi sert-il ?",
+    "Que propose le service culturel de l’UVSQ aux étudiants et personnels ?",
+    "Peut-on accueillir des artistes ou organiser des spectacles sur les campus ?",
+    "En quoi consiste l’UE Engagement proposée par l’UVSQ et combien de crédits ECTS permet-elle de valider ?",
+    "Quels services de restauration sont disponibles sur le campus de Mantes ?",
+    "Y a-t-il des cafétérias tenues par des associations à l’UVSQ ?",
+    "Peut-on accéder à des plats chauds ou des sandwichs sur les différents campus ?",
+    "Quand peut-on faire une demande de logement ou de bourse via le CROUS ?",
+    "Est-il possible de consulter gratuitement des annonces de logements étudiants via l’UVSQ ?",
+    "Quels types de pratiques sportives sont proposées par le SUAPS de l’UVSQ ?",
+    "Existe-t-il des dispositifs sportifs adaptés pour les étudiants en situation de handicap ?",
+    "Comment s’engage l’UVSQ pour le sport-santé ?",
+    "Quels avantages ou tarifs préférentiels sont proposés pour les activités sportives à l’UVSQ ?",
+    "Où peut-on consulter les offres d’emploi ou de stage liées à l’UVSQ ?",
+    "Quelles entreprises proposent des stages ou des alternances en partenariat avec l’UVSQ ?",
+    "Est-ce que le réseau Alumni de l’UVSQ diffuse régulièrement des offres ?",
+]
 
+# import asyncio
 # agent = info_UVSQ()
+# result = asyncio.run(agent.ask_info_UVSQ(queries[1]))
+# result["messages"][-1].content
 
-# query_1 = "Quelle place occupe l'UVSQ dans le classement CWUR 2024 ?  ²"
-# query_2 = "Quelles formations de master reconnues internationalement propose l'UVSQ ?"
-# query_3 = "Quel est le rôle de l'UVSQ au sein de l'Université Paris-Saclay ?"
-# query_4 = "Qu'est-ce qui a été mis en avant lors de l'édition d'avril 2022 dans la revue « Décisions Achats » ?"
-# query_5  = "Quels types d'espaces sont accessibles aux étudiants pour se détendre ou travailler sur les campus de l’UVSQ ?"
-# query_6  = "Quelles salles peut-on réserver à la Maison de l’Étudiant Marta Pan à Saint-Quentin-en-Yvelines ?"
-# query_7  = "Où se trouve la Maison de l'Étudiant Marta Pan et à quoi sert-elle ?"
-
-# query_8  = "Quels partenaires proposent des tarifs réduits aux étudiants de l’UVSQ ?"
-# query_9  = "L’UVSQ propose-t-elle des aides pour accéder à des salles de sport ou des activités de loisir ?"
-# query_10 = "Existe-t-il un partenariat entre l’UVSQ et des clubs de tennis ou de fitness ?"
-
-# query_11 = "Que propose l’UVSQ en cas de règles menstruelles douloureuses ?"
-# query_12 = "Le port du masque est-il encore obligatoire à l’UVSQ ?"
-# query_13 = "Qui peut-on contacter en cas de détresse psychologique sur un campus de l’UVSQ ?"
-# query_14 = "Que faire si je me blesse pendant un stage ou sur le campus ?"
-
-# query_15 = "Quels aménagements sont proposés par l’UVSQ pour les examens des étudiants en situation de handicap ?"
-# query_16 = "Est-il possible d’obtenir une transcription en braille ou l’assistance d’un interprète LSF à l’UVSQ ?"
-# query_17 = "Le service handicap de l’UVSQ peut-il fournir un secrétaire pour rédiger les examens ?"
-
-# query_18 = "Quels sont les numéros d'urgence disponibles pour les victimes de harcèlement ou de violences à l’UVSQ ?"
-# query_19 = "Quelles associations partenaires peuvent accompagner les victimes de violences dans les Yvelines ?"
-# query_20 = "À qui s’adresser en cas de harcèlement sexuel à l’université ?"
-# query_21 = "Quels dispositifs sont mis en place par l’UVSQ pour lutter contre les discriminations et agissements sexistes ?"
-
-# query_22 = "Qu’est-ce que le dispositif Culture-ActionS du CROUS et à quoi sert-il ?"
-# query_23 = "Que propose le service culturel de l’UVSQ aux étudiants et personnels ?"
-# query_24 = "Peut-on accueillir des artistes ou organiser des spectacles sur les campus ?"
-# query_25 = "En quoi consiste l’UE Engagement proposée par l’UVSQ et combien de crédits ECTS permet-elle de valider ?"
-
-# query_26 = "Quels services de restauration sont disponibles sur le campus de Mantes ?"
-# query_27 = "Y a-t-il des cafétérias tenues par des associations à l’UVSQ ?"
-# query_28 = "Peut-on accéder à des plats chauds ou des sandwichs sur les différents campus ?"
-
-# query_29 = "Quand peut-on faire une demande de logement ou de bourse via le CROUS ?"
-# query_30 = "Est-il possible de consulter gratuitement des annonces de logements étudiants via l’UVSQ ?"
-
-# query_31 = "Quels types de pratiques sportives sont proposées par le SUAPS de l’UVSQ ?"
-# query_32 = "Existe-t-il des dispositifs sportifs adaptés pour les étudiants en situation de handicap ?"
-# query_33 = "Comment s’engage l’UVSQ pour le sport-santé ?"
-# query_34 = "Quels avantages ou tarifs préférentiels sont proposés pour les activités sportives à l’UVSQ ?"
-
-# query_35 = "Où peut-on consulter les offres d’emploi ou de stage liées à l’UVSQ ?"
-# query_36 = "Quelles entreprises proposent des stages ou des alternances en partenariat avec l’UVSQ ?"
-# query_37 = "Est-ce que le réseau Alumni de l’UVSQ diffuse régulièrement des offres ?"
-
-# result = asyncio.run(agent.ask_info_UVSQ(query_2))
+# from utils.benchmark import concurrency_check
+# print(asyncio.run(concurrency_check(agent.ask_info_UVSQ, queries[:3], n_sessions=10)))
 
-# result["messages"][-1].content
+# # latence et tokens : appel obligatoire au tool vs pre-retrieval
+# from utils.benchmark import compare_modes
+# print(asyncio.run(compare_modes({"tool_call": info_UVSQ().ask_info_UVSQ, "pre_retrieval": info_UVSQ(pre_retrieval=True).ask_info_UVSQ}, queries)))
 
+# # tokens de contexte / de prompt et latences par appel, pour régler CONTEXT_PACKING.token_budget
+# from utils.context_packing import context_stats
+# for q in queries[:10]:
+#     asyncio.run(info_UVSQ().ask_info_UVSQ(q))
+# print(context_stats("info_UVSQ"))
@@ -0,0 +1,81 @@
+from Agent.AssistantTeacher.AssistantTeacher import AssistantTeacher
+from Agent.info_UVSQ.info_UVSQ import info_UVSQ
+from Agent.SmartPlanner.SmartPlanner import SmartPlanner
+from Agent.RouterAgent import RouterAgent
+from utils.benchmark import summarize, timed
+import functools
+import threading
+import tracemalloc
+import os
+
+# PRE_RETRIEVAL=true : les agents RAG récupèrent les contextes avant l'appel au LLM (un seul appel LLM par réponse)
+PRE_RETRIEVAL = os.environ.get("PRE_RETRIEVAL", "false").lower() == "true"
+# SMARTPLANNER_SQL_MODE=sequential|single|concurrent (sequential par défaut) : pertinence puis SQL en deux appels LLM
+# successifs, pertinence et SQL en un seul appel LLM, ou en deux appels parallèles
+SMARTPLANNER_SQL_MODE = os.environ.get("SMARTPLANNER_SQL_MODE", "sequential")
+
+# Les agents ne portent aucun état propre à un utilisateur (l'état vit dans chaque exécution du graphe) :
+# une seule instance par processus est construite, ses graphes sont compilés une fois et partagés entre les sessions.
+agent_factories = {
+    "RouterAgent": RouterAgent,
+    "SmartPlanner": functools.partial(SmartPlanner, sql_mode=SMARTPLANNER_SQL_MODE),
+    "AssistantTeacher": functools.partial(AssistantTeacher, pre_retrieval=PRE_RETRIEVAL),
+    "info_UVSQ": functools.partial(info_UVSQ, pre_retrieval=PRE_RETRIEVAL),
+}
+
+_agents = {}
+_lock = threading.Lock()
+
+
+def get_agent(name: str):
+    """
+    arg : name (nom de l'agent, clé de agent_factories)
+    return : l'instance partagée de l'agent, construite au premier appel
+    """
+    agent = _agents.get(name)
+    if agent is None:
+        with _lock:
+            agent = _agents.get(name)
+            if agent is None:
+                agent = agent_factories[name]()
+                _agents[name] = agent
+    return agent
+
+
+def warm_up():
+    """
+    Construit tous les agents d'avance (ex: au démarrage) pour que la première session n'en paie pas le coût.
+    """
+    for name in agent_factories:
+        get_agent(name)
+
+
+def benchmark_sessions(n_sessions: int = 500) -> dict:
+    """
+    Compare le démarrage de n_sessions sessions avec des agents construits par session
+    et avec les agents partagés du registre : latence de démarrage et mémoire par session.
+    """
+    def start_session_per_instance():
+        return {name: factory() for name, factory in agent_factories.items()}
+
+    def start_session_shared():
+        return {name: get_agent(name) for name in agent_factories}
+
+    warm_up()
+    results = {}
+    for mode, start_session in [("per_session", start_session_per_instance), ("shared", start_session_shared)]:
+        sessions, latencies = [], []
+        tracemalloc.start()
+        for _ in range(n_sessions):
+            session, duration = timed(start_session)
+            sessions.append(session)
+            latencies.append(duration)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[mode] = {"memory_per_session_kb": round(memory / n_sessions / 1024, 2), **summarize(latencies)}
+        del sessions
+    return results
+
+
+# ---- TESTS ----
+# print(benchmark_sessions(500))
@@ -0,0 +1,98 @@
+# Questions étiquetées utilisées par le routage local de RouterAgent.
+# - labelled_questions : exemples servant à calculer les centroïdes d'embedding de chaque intention
+# - benchmark_questions : jeu séparé (non vu à l'entraînement) pour comparer routeur local et routeur LLM
+
+labelled_questions = [
+    # ---- cours
+    ("Quelle est la différence fondamentale entre probabilité et statistique ?", "cours"),
+    ("Pourquoi dit-on qu'un problème est non paramétrique ?", "cours"),
+    ("Quelles sont les étapes pour construire un estimateur par histogramme ?", "cours"),
+    ("Quelle est la signification du paramètre h dans l'histogramme ?", "cours"),
+    ("Pourquoi l'estimateur par histogramme est-il une densité ?", "cours"),
+    ("Qu'est-ce que la convergence forte des estimateurs ?", "cours"),
+    ("Que représente l'erreur quadratique moyenne (MISE) ?", "cours"),
+    ("Comment décompose-t-on le MISE en biais et variance ?", "cours"),
+    ("Comment la validation croisée permet-elle de déterminer h de façon empirique ?", "cours"),
+    ("Donne-moi la définition d'un estimateur sans biais.", "cours"),
+    ("Peux-tu me rappeler la démonstration de la loi des grands nombres ?", "cours"),
+    ("Quelle est la formule de l'estimateur à noyau de la densité ?", "cours"),
+    ("Explique-moi le théorème central limite.", "cours"),
+    ("C'est quoi une fonction de répartition empirique ?", "cours"),
+    ("Comment calcule-t-on la variance d'un estimateur ?", "cours"),
+    # ---- emploi_du_temps
+    ("A quelle heure ai-je cours demain ?", "emploi_du_temps"),
+    ("Quel est mon emploi du temps cette semaine ?", "emploi_du_temps"),
+    ("Dans quelle salle a lieu le cours de statistique non paramétrique ?", "emploi_du_temps"),
+    ("Quand est mon prochain cours ?", "emploi_du_temps"),
+    ("Quels sont mes cours lundi prochain ?", "emploi_du_temps"),
+    ("Est-ce que j'ai TD jeudi après-midi ?", "emploi_du_temps"),
+    ("Quand a lieu l'examen de séries temporelles ?", "emploi_du_temps"),
+    ("Combien d'heures de CM ai-je en mars ?", "emploi_du_temps"),
+    ("Dans quel bâtiment se trouve mon cours de 14h ?", "emploi_du_temps"),
+    ("À quelle heure finit le dernier cours vendredi ?", "emploi_du_temps"),
+    ("Quels cours ont les M2 ISADS la semaine prochaine ?", "emploi_du_temps"),
+    ("Est-ce que j'ai cours le 12 mars ?", "emploi_du_temps"),
+    ("Montre-moi le planning du master Math&AS.", "emploi_du_temps"),
+    ("Quel est l'horaire du cours d'apprentissage statistique ?", "emploi_du_temps"),
+    ("Ai-je des cours samedi ?", "emploi_du_temps"),
+    # ---- UVSQ
+    ("Quelle place occupe l'UVSQ dans le classement CWUR 2024 ?", "UVSQ"),
+    ("Quelles formations de master reconnues internationalement propose l'UVSQ ?", "UVSQ"),
+    ("Quel est le rôle de l'UVSQ au sein de l'Université Paris-Saclay ?", "UVSQ"),
+    ("Quelles salles peut-on réserver à la Maison de l'Étudiant Marta Pan à Saint-Quentin-en-Yvelines ?", "UVSQ"),
+    ("Quels partenaires proposent des tarifs réduits aux étudiants de l'UVSQ ?", "UVSQ"),
+    ("Qui peut-on contacter en cas de détresse psychologique sur un campus de l'UVSQ ?", "UVSQ"),
+    ("Quels aménagements sont proposés par l'UVSQ pour les examens des étudiants en situation de handicap ?", "UVSQ"),
+    ("À qui s'adresser en cas de harcèlement sexuel à l'université ?", "UVSQ"),
+    ("Qu'est-ce que le dispositif Culture-ActionS du CROUS et à quoi sert-il ?", "UVSQ"),
+    ("Quels services de restauration sont disponibles sur le campus de Mantes ?", "UVSQ"),
+    ("Quand peut-on faire une demande de logement ou de bourse via le CROUS ?", "UVSQ"),
+    ("Quels types de pratiques sportives sont proposées par le SUAPS de l'UVSQ ?", "UVSQ"),
+    ("Où peut-on consulter les offres d'emploi ou de stage liées à l'UVSQ ?", "UVSQ"),
+    ("Est-ce que le réseau Alumni de l'UVSQ diffuse régulièrement des offres ?", "UVSQ"),
+    ("Comment s'inscrire à la bibliothèque universitaire ?", "UVSQ"),
+    # ---- autre
+    ("Bonjour !", "autre"),
+    ("Salut, ça va ?", "autre"),
+    ("Merci beaucoup pour ton aide.", "autre"),
+    ("Raconte-moi une blague.", "autre"),
+    ("Quel temps fait-il à Paris aujourd'hui ?", "autre"),
+    ("Qui a gagné la coupe du monde de football en 2018 ?", "autre"),
+    ("Donne-moi une recette de crêpes.", "autre"),
+    ("Tu es qui ?", "autre"),
+    ("Quel film me conseilles-tu ce soir ?", "autre"),
+    ("Comment vas-tu ?", "autre"),
+    ("Écris-moi un poème sur la mer.", "autre"),
+    ("Quelle est la capitale de l'Australie ?", "autre"),
+]
+
+benchmark_questions = [
+    ("Pourquoi considère-t-on une partition uniforme de [0,1] ?", "cours"),
+    ("Que se passe-t-il lorsque h → 0 et n → ∞ ?", "cours"),
+    ("Pourquoi le choix théorique optimal de h n'est-il pas réalisable en pratique ?", "cours"),
+    ("Quels sont les risques d'un mauvais choix de h ?", "cours"),
+    ("Quelle méthode pourrait être plus adaptée que l'histogramme pour une estimation de densité lisse ?", "cours"),
+    ("Qu'est-ce qu'un intervalle de confiance ?", "cours"),
+    ("Quelle heure est mon cours de mercredi ?", "emploi_du_temps"),
+    ("Où a lieu mon TD de demain matin ?", "emploi_du_temps"),
+    ("Quel est le planning de la semaine prochaine pour les ISADS ?", "emploi_du_temps"),
+    ("Quand commence mon premier cours lundi ?", "emploi_du_temps"),
+    ("Y a-t-il un examen en avril ?", "emploi_du_temps"),
+    ("Combien de cours ai-je aujourd'hui ?", "emploi_du_temps"),
+    ("Où se trouve la Maison de l'Étudiant Marta Pan et à quoi sert-elle ?", "UVSQ"),
+    ("L'UVSQ propose-t-elle des aides pour accéder à des salles de sport ou des activités de loisir ?", "UVSQ"),
+    ("Le port du masque est-il encore obligatoire à l'UVSQ ?", "UVSQ"),
+    ("Quelles associations partenaires peuvent accompagner les victimes de violences dans les Yvelines ?", "UVSQ"),
+    ("Y a-t-il des cafétérias tenues par des associations à l'UVSQ ?", "UVSQ"),
+    ("Comment s'engage l'UVSQ pour le sport-santé ?", "UVSQ"),
+    ("Hello, tu peux m'aider ?", "autre"),
+    ("Quel est ton plat préféré ?", "autre"),
+    ("Combien font 2 + 2 ?", "autre"),
+    ("Bonne soirée !", "autre"),
+    ("Tu connais une bonne série ?", "autre"),
+    ("Qui est le président de la République ?", "autre"),
+    # mots-clés ambigus : un seul ne suffit pas à décider
+    ("Quel temps fera-t-il demain ?", "autre"),
+    ("Le resto U ouvre à quelle heure ?", "UVSQ"),
+    ("Comment se passe la mise en place des inscriptions pédagogiques ?", "UVSQ"),
+]
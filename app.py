@@ -3,98 +3,142 @@ from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from utils.utils import llm
 
-# import des Agents
-from Agent.AssistantTeacher.AssistantTeacher import AssistantTeacher
-from Agent.info_UVSQ.info_UVSQ import info_UVSQ
-from Agent.SmartPlanner.SmartPlanner import SmartPlanner
-from Agent.RouterAgent import RouterAgent
+# import des Agents (instances partagées par tout le processus)
+from Agent.registry import get_agent, warm_up
+from Agent.RouterAgent import normalize_question
+from Agent.SmartPlanner.fast_path import FOLLOW_UP_SEPARATOR
+from utils.retrieval import warm_up_embeddings
+from utils.conversation_memory import ConversationMemory, is_follow_up
 
 from dotenv import load_dotenv
 from typing import List, Dict
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, SystemMessage
 import logging
+import threading
+import time
+import os
 load_dotenv()
 
+# premier encodage en tâche de fond : en attendant, la recherche passe par l'index lexical seul
+threading.Thread(target=warm_up_embeddings, daemon=True).start()
+# construction des agents (graphes compilés) en tâche de fond, hors de la boucle d'événements du premier message
+threading.Thread(target=warm_up, daemon=True).start()
+
+# envoie les réponses token par token (STREAMING=false pour un envoi en un seul message)
+STREAMING = os.environ.get("STREAMING", "true").lower() == "true"
+# mémoire de conversation par session : derniers échanges gardés en entier, budget de tokens du contexte des agents
+MEMORY_TURNS = int(os.environ.get("MEMORY_TURNS", "6"))
+MEMORY_TOKENS = int(os.environ.get("MEMORY_TOKENS", "1200"))
+# agent qui a répondu au dernier échange -> intention du routeur (questions de suivi)
+agent_intents = {"AssistantTeacher": "cours", "SmartPlanner": "emploi_du_temps", "info_UVSQ": "UVSQ", "none": "autre"}
+
 
 class GlobalStateManager:
     @staticmethod
     def init_state():
         cl.user_session.set("GlobalState", {
-            "messages": [],
+            "memory": ConversationMemory(max_turns=MEMORY_TURNS),
             "selected_agent": None
         })
 
     @staticmethod
     def get_state() -> Dict:
-        return cl.user_session.get("GlobalState", {
-            "messages": [],
-            "selected_agent": None
-        })
+        state = cl.user_session.get("GlobalState")
+        if state is None:
+            GlobalStateManager.init_state()
+            state = cl.user_session.get("GlobalState")
+        return state
 
     @staticmethod
     def add_exchange(user_input: str, assistant_output: str, agent_name: str):
+        # mémoire bornée : les anciens échanges sont compactés dans le résumé, la taille de la session reste constante
         state = GlobalStateManager.get_state()
-
-        messages: List[BaseMessage] = state.get("messages", [])
-        messages.append(HumanMessage(content=user_input))
-        messages.append(AIMessage(content=assistant_output))
-
-        state["messages"] = messages
+        state["memory"].add(user_input, assistant_output, agent_name)
         state["selected_agent"] = agent_name
-
         cl.user_session.set("GlobalState", state)
 
     @staticmethod
-    def get_history() -> List[BaseMessage]:
-        return GlobalStateManager.get_state().get("messages", [])
+    def get_context(token_budget: int = MEMORY_TOKENS, agent: str = None) -> str:
+        """
+        Contexte de conversation à donner à un agent, dans son budget de tokens (derniers échanges puis résumé).
+        arg : agent (seulement les derniers échanges avec cet agent)
+        """
+        return GlobalStateManager.get_state()["memory"].context(token_budget, agent)
+
+    @staticmethod
+    def get_history(token_budget: int = MEMORY_TOKENS) -> List[BaseMessage]:
+        return GlobalStateManager.get_state()["memory"].messages(token_budget)
 
        
 @cl.on_chat_start
 async def on_chat_start():
-    cl.user_session.set("RouterAgent", RouterAgent())
-    cl.user_session.set("SmartPlanner", SmartPlanner())
-    cl.user_session.set("AssistantTeacher", AssistantTeacher())
-    cl.user_session.set("info_UVSQ", info_UVSQ())
+    # les agents ne sont plus construits par session : seul l'état de conversation est propre à la session
     GlobalStateManager.init_state()
 
+async def send_answer(tokens) -> str:
+    """
+    Envoie la réponse d'un agent dans un cl.Message, token par token si STREAMING est actif.
+    arg : tokens (générateur asynchrone de tokens)
+    return : le contenu complet du message
+    """
+    msg = cl.Message(content="")
+    start = time.perf_counter()
+    ttft = None
+    async for token in tokens:
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        if STREAMING:
+            await msg.stream_token(token)
+        else:
+            msg.content += token
+    await msg.send()
+    logging.info(f"[LATENCY] premier token: {ttft or 0:.3f}s, total: {time.perf_counter() - start:.3f}s")
+    return msg.content
+
 @cl.on_message
 async def handle_message(message: cl.Message):
-    router = cl.user_session.get("RouterAgent")
+    router = get_agent("RouterAgent")
     query = message.content
-    # Route vers le bon agent
-    intent = await router.ask_router(query)
+    state = GlobalStateManager.get_state()
+    # question de suivi courte et sans sujet ("et demain ?", "plus de détails") : même agent que l'échange précédent,
+    # avec le contexte budgété ; toute autre question passe par le routeur
+    follow_up = state["memory"].n_turns > 0 and is_follow_up(query, normalize_question)
+    history = GlobalStateManager.get_context() if follow_up else ""
+    if follow_up and state["selected_agent"] in agent_intents:
+        intent = agent_intents[state["selected_agent"]]
+        logging.info(f"[ROUTER] question de suivi, intention '{intent}' reprise de l'échange précédent")
+    else:
+        # Route vers le bon agent
+        intent = await router.ask_router(query)
     
     # Vers AssistantTeacher
     if intent == "cours":
-        agent = cl.user_session.get("AssistantTeacher", AssistantTeacher())
+        agent = get_agent("AssistantTeacher")
         logging.info("\n\n>>> Agent AssistantTeacher selected <<<")
-        result = await agent.ask_AssistantTeacher(query)
-        last_message = result["messages"][-1].content
+        # envoie la réponse au fil de sa génération
+        last_message = await send_answer(agent.stream_AssistantTeacher(query, history))
         # Met à jour le GlobalState
         GlobalStateManager.add_exchange(query, last_message, "AssistantTeacher")
-        # renvoie la réponse
-        await cl.Message(content=last_message).send()
 
     # Vers SmartPlanner
     elif intent == "emploi_du_temps":
-        agent = cl.user_session.get("SmartPlanner", SmartPlanner())
+        agent = get_agent("SmartPlanner")
         logging.info("\n\n>>> Agent SmartPlanner selected <<<")
-        result = await agent.ask_SmartPlanner(query)
-        answer = result["query_result"]
+        # SmartPlanner ne reçoit qu'une question : un suivi est complété par la dernière question qu'il a traitée
+        previous_question = state["memory"].last_question("SmartPlanner", normalize_question) if follow_up else None
+        question = f"{previous_question}{FOLLOW_UP_SEPARATOR}{query}" if previous_question else query
+        answer = await send_answer(agent.stream_SmartPlanner(question))
         # Met à jour le GlobalState
         GlobalStateManager.add_exchange(query, answer, "SmartPlanner")
-        await cl.Message(content=answer).send()
 
     # Vers info_UVSQ
     elif intent == "UVSQ":
-        agent = cl.user_session.get("info_UVSQ", info_UVSQ())
+        agent = get_agent("info_UVSQ")
         logging.info("\n\n>>> Agent info_UVSQ selected <<<")
-        result = await agent.ask_info_UVSQ(query)
-        last_message = result["messages"][-1].content
+        # envoie la réponse au fil de sa génération
+        last_message = await send_answer(agent.stream_info_UVSQ(query, history))
         # Met à jour le GlobalState
         GlobalStateManager.add_exchange(query, last_message, "info_UVSQ")
-        # renvoie la réponse
-        await cl.Message(content=last_message).send()
 
     # Si la requête ne nécessite pas d'appel à un agent redirige directement vers le llm
     else:
@@ -109,13 +153,14 @@ async def handle_message(message: cl.Message):
         hs_prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", system_prompt),
+                # historique passé en message déjà construit : ses accolades ne sont pas lues comme des variables
+                *([SystemMessage(content=f"Historique de la conversation :\n{history}")] if history else []),
                 ("human", f"Question originale: {query}"),
             ]
         )
         irrelevant_response = hs_prompt | llm | StrOutputParser()
-        hs_message = irrelevant_response.invoke({})
+        hs_message = await send_answer(irrelevant_response.astream({}))
         GlobalStateManager.add_exchange(query, hs_message, "none")
-        await cl.Message(content=hs_message).send()
 
     # agent = cl.user_session.get("AssistantTeacher")
     # # Envoie la requête utilisateur à l'agent
@@ -0,0 +1,140 @@
+"""
+Le chemin de requête ne bloque pas la boucle d'événements : N appels simultanés à ask_* / stream_* doivent se
+terminer bien avant N fois la durée d'un appel seul.
+Le LLM (attente asynchrone) et le retrieval / SQLite (attente bloquante, comme l'encodage et les requêtes réelles)
+sont remplacés par des doublures : un appel bloquant exécuté dans la boucle sérialiserait les sessions.
+Lancer depuis la racine du dépôt : python -m pytest -q tests
+"""
+import asyncio
+import itertools
+import sys
+import time
+import types
+
+import numpy as np
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+LLM_DELAY_S = 0.05          # appel LLM : attente réseau, asynchrone
+BLOCKING_DELAY_S = 0.25     # retrieval, encodage, requête SQLite : synchrones, doivent passer par un thread
+N_SESSIONS = 8
+# ~1 si les sessions se recouvrent, ~N_SESSIONS si elles se sérialisent
+MAX_RATIO = N_SESSIONS / 3
+
+
+def fake_llm():
+    """
+    LLM de test : répond après LLM_DELAY_S sans bloquer la boucle ; with_structured_output remplit chaque champ
+    du schéma (relevance = "relevant", une requête SQL différente à chaque appel pour ne pas toucher le cache SQL),
+    bind_tools rend le LLM avec tools de test.
+    """
+    counter = itertools.count()
+
+    async def answer(_):
+        await asyncio.sleep(LLM_DELAY_S)
+        return AIMessage(content="Réponse de test.")
+
+    def with_structured_output(schema):
+        async def structured(_):
+            await asyncio.sleep(LLM_DELAY_S)
+            values = {"relevance": "relevant", "sql_query": f"SELECT {next(counter)} AS n", "question": "question"}
+            return schema(**{name: values[name] for name in schema.model_fields})
+        return RunnableLambda(lambda _: None, afunc=structured)
+
+    llm = RunnableLambda(lambda _: None, afunc=answer)
+    llm.with_structured_output = with_structured_output
+    llm.bind_tools = lambda tools: fake_tooled_llm()
+    return llm
+
+
+def fake_tooled_llm():
+    """
+    LLM avec tools de test : un appel à retrieve_context, puis la réponse une fois le résultat du tool reçu.
+    """
+    async def ainvoke(messages):
+        await asyncio.sleep(LLM_DELAY_S)
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content="Réponse de test.")
+        return AIMessage(content="", tool_calls=[{"name": "retrieve_context", "args": {"queries": [messages[-1].content]},
+                                                  "id": f"call_{time.perf_counter_ns()}"}])
+    return types.SimpleNamespace(ainvoke=ainvoke)
+
+
+def blocking_embeddings(texts):
+    time.sleep(BLOCKING_DELAY_S)
+    return np.random.default_rng(0).random((len(texts), 8), dtype=np.float32)
+
+
+def blocking_contexts_groups(groups):
+    time.sleep(BLOCKING_DELAY_S)
+    return ["Contexte 1 :\nextrait de test" for _ in groups]
+
+
+class BlockingPool:
+    def execute(self, sql, params=None, max_rows=None):
+        time.sleep(BLOCKING_DELAY_S)
+        return types.SimpleNamespace(rows=[{"n": 1}], truncated=False, duration=BLOCKING_DELAY_S)
+
+
+# modèle d'embedding et LLM réels chargés à l'import de utils.utils : remplacés avant l'import des agents
+stub = types.ModuleType("utils.utils")
+stub.llm = fake_llm()
+stub.embedding_function = blocking_embeddings
+stub.query_embedding_function = blocking_embeddings
+sys.modules.setdefault("utils.utils", stub)
+
+import Agent.AssistantTeacher.AssistantTeacher as teacher_module  # noqa: E402
+import Agent.info_UVSQ.info_UVSQ as uvsq_module  # noqa: E402
+import Agent.SmartPlanner.SmartPlanner as planner_module  # noqa: E402
+import Agent.RouterAgent as router_module  # noqa: E402
+from utils.benchmark import concurrency_check  # noqa: E402
+
+
+def assert_non_blocking(ask, queries):
+    result = asyncio.run(concurrency_check(ask, queries, n_sessions=N_SESSIONS))
+    assert result["ratio"] < MAX_RATIO, result
+
+
+def drain(tokens):
+    async def consume(*args):
+        return "".join([token async for token in tokens(*args)])
+    return consume
+
+
+def rag_agent(module, cls, monkeypatch):
+    # le LLM et la fonction de retrieval du noeud de tools sont capturés à la construction : doublures posées avant
+    monkeypatch.setattr(module, "llm", fake_llm())
+    monkeypatch.setattr(module, "query_contexts_groups", blocking_contexts_groups)
+    return cls(pre_retrieval=False)
+
+
+def test_router_does_not_block(monkeypatch):
+    monkeypatch.setattr(router_module, "query_embedding_function", blocking_embeddings)
+    router = router_module.RouterAgent()
+    router.intent_classifier = RunnableLambda(lambda _: None, afunc=fake_llm().ainvoke) | (lambda m: m.content)
+    # pas de mot-clé : étage d'embedding (bloquant) puis repli sur le LLM
+    assert_non_blocking(router.ask_router, ["Raconte-moi une histoire.", "Tu fais quoi ce soir ?"])
+
+
+def test_assistant_teacher_does_not_block(monkeypatch):
+    agent = rag_agent(teacher_module, teacher_module.AssistantTeacher, monkeypatch)
+    queries = ["Qu'est-ce qu'un estimateur à noyau ?", "Explique le biais de l'histogramme."]
+    assert_non_blocking(agent.ask_AssistantTeacher, queries)
+    # avec un historique : pas de cache sémantique, le graphe est toujours exécuté
+    assert_non_blocking(drain(lambda q: agent.stream_AssistantTeacher(q, "Étudiant : bonjour")), queries)
+
+
+def test_info_uvsq_does_not_block(monkeypatch):
+    agent = rag_agent(uvsq_module, uvsq_module.info_UVSQ, monkeypatch)
+    queries = ["Comment contacter le CROUS ?", "Où est la bibliothèque ?"]
+    assert_non_blocking(agent.ask_info_UVSQ, queries)
+    assert_non_blocking(drain(lambda q: agent.stream_info_UVSQ(q, "Étudiant : bonjour")), queries)
+
+
+def test_smartplanner_does_not_block(monkeypatch):
+    monkeypatch.setattr(planner_module, "llm", fake_llm())
+    monkeypatch.setattr(planner_module, "read_only_pool", BlockingPool())
+    agent = planner_module.SmartPlanner(fast_path=False, exemplars=False)
+    queries = ["Quels cours ai-je demain ?", "Où a lieu mon prochain TD ?"]
+    assert_non_blocking(agent.ask_SmartPlanner, queries)
+    assert_non_blocking(drain(agent.stream_SmartPlanner), queries)
@@ -0,0 +1,150 @@
+import threading
+import asyncio
+import statistics
+import resource
+import time
+import os
+
+
+def summarize(latencies: list[float]) -> dict:
+    """
+    arg : latencies (durées en secondes)
+    return : un résumé des latences en millisecondes (moyenne, p50, p95, max)
+    """
+    if not latencies:
+        return {"n": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "mean_ms": round(1000 * statistics.fmean(ordered), 3),
+        "p50_ms": round(1000 * statistics.median(ordered), 3),
+        "p95_ms": round(1000 * p95, 3),
+        "max_ms": round(1000 * ordered[-1], 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Exécute fn et retourne (résultat, durée en secondes).
+    """
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def rss_mb() -> float:
+    """
+    return : mémoire résidente actuelle du process en Mo (/proc/self/statm, sinon le pic de getrusage)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss(fn, *args, interval: float = 0.01, **kwargs):
+    """
+    Exécute fn en relevant la mémoire résidente toutes les `interval` secondes.
+    return : (résultat, durée en secondes, {"rss_before_mb", "rss_peak_mb", "rss_after_mb"})
+    """
+    before = rss_mb()
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result, duration = timed(fn, *args, **kwargs)
+    finally:
+        done.set()
+        sampler.join()
+    after = rss_mb()
+    return result, duration, {"rss_before_mb": round(before, 1), "rss_peak_mb": round(max(peak[0], after), 1),
+                              "rss_after_mb": round(after, 1)}
+
+
+async def atimed(coro):
+    """
+    Attend la coroutine et retourne (résultat, durée en secondes).
+    """
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def concurrency_check(ask, queries: list[str], n_sessions: int = 10) -> dict:
+    """
+    Vérifie que le chemin de requête ne bloque pas la boucle d'événements :
+    n_sessions requêtes simultanées doivent se terminer en un temps proche d'une requête seule.
+    arg : ask (coroutine function prenant une question), queries (questions réparties entre les sessions)
+    return : durée d'une requête seule, durée des n_sessions simultanées et leur ratio
+    """
+    _, single = await atimed(ask(queries[0]))
+    _, concurrent = await atimed(asyncio.gather(*(ask(queries[i % len(queries)]) for i in range(n_sessions))))
+    return {
+        "n_sessions": n_sessions,
+        "single_s": round(single, 3),
+        "concurrent_s": round(concurrent, 3),
+        "ratio": round(concurrent / single, 2),   # ~1 si non bloquant, ~n_sessions si les appels se sérialisent
+    }
+
+
+async def time_to_first_token(tokens) -> dict:
+    """
+    arg : tokens (générateur asynchrone de tokens, ex: stream_AssistantTeacher(query))
+    return : le délai avant le premier token et la durée totale du stream, en secondes
+    """
+    start = time.perf_counter()
+    first = None
+    async for _ in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return {"ttft_s": round(first if first is not None else total, 3), "total_s": round(total, 3)}
+
+
+async def compare_ttft(ask, stream, queries: list[str]) -> dict:
+    """
+    Compare le délai avant le premier token sans streaming (réponse complète, ask) et avec streaming (stream).
+    """
+    before, after = [], []
+    for query in queries:
+        _, duration = await atimed(ask(query))
+        before.append(duration)
+        after.append((await time_to_first_token(stream(query)))["ttft_s"])
+    return {"without_streaming": summarize(before), "with_streaming": summarize(after)}
+
+
+async def compare_modes(asks: dict, queries: list[str]) -> dict:
+    """
+    Compare plusieurs variantes d'un agent sur les mêmes questions : latence, nombre d'appels LLM et tokens consommés.
+    arg : asks ({"mode": fonction ask_* de l'agent dans ce mode}), queries (questions de test)
+    """
+    results = {}
+    for mode, ask in asks.items():
+        latencies, llm_calls, input_tokens, output_tokens = [], 0, 0, 0
+        for query in queries:
+            state, duration = await atimed(ask(query))
+            latencies.append(duration)
+            # chaque AIMessage correspond à un appel LLM
+            for message in state["messages"]:
+                usage = getattr(message, "usage_metadata", None)
+                if message.type == "ai":
+                    llm_calls += 1
+                    if usage:
+                        input_tokens += usage["input_tokens"]
+                        output_tokens += usage["output_tokens"]
+        n = len(queries)
+        results[mode] = {
+            "llm_calls_per_query": llm_calls / n,
+            "input_tokens_per_query": input_tokens / n,
+            "output_tokens_per_query": output_tokens / n,
+            **summarize(latencies),
+        }
+    return results
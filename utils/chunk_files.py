@@ -1,4 +1,9 @@
 from langchain_text_splitters import MarkdownHeaderTextSplitter
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from utils.tokens import estimate_tokens
+import statistics
+import re
 import os
 
 headers_to_split_on = [
@@ -7,34 +12,168 @@ headers_to_split_on = [
     ("###", "Header 3"),
 ]
 
-def md_chunker(md_file_path, headers_to_split_on=headers_to_split_on):
+# budget par chunk (en caractères, ~4 caractères par token) et recouvrement entre chunks consécutifs d'une même section
+MAX_CHUNK_CHARS = 1500
+CHUNK_OVERLAP_CHARS = 200
+
+# formules LaTeX : jamais coupées ($$...$$ avant $...$)
+latex_pattern = re.compile(r"\$\$.+?\$\$|\$[^$\n]+?\$", re.S)
+
+
+def split_units(text: str, max_chars: int) -> list[str]:
+    """
+    Découpe un texte en unités insécables : formules LaTeX entières, phrases, et mots pour les phrases trop longues.
+    """
+    units = []
+    position = 0
+    for match in list(latex_pattern.finditer(text)) + [None]:
+        end = match.start() if match else len(text)
+        plain = text[position:end]
+        for sentence in re.findall(r".+?(?:[.!?](?=\s)|\n|$)\s*", plain, re.S):
+            if len(sentence) > max_chars:
+                units.extend(re.findall(r"\S+\s*", sentence))
+            elif sentence:
+                units.append(sentence)
+        if match:
+            units.append(match.group(0))
+            position = match.end()
+    return units
+
+
+def split_with_budget(text: str, max_chars: int = MAX_CHUNK_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> list[str]:
+    """
+    Regroupe les unités en chunks d'au plus max_chars caractères (une formule plus longue que le budget reste entière),
+    chaque chunk reprenant la fin du précédent sur environ `overlap` caractères.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    chunks, current = [], []
+    for unit in split_units(text, max_chars):
+        if current and sum(len(u) for u in current) + len(unit) > max_chars:
+            chunks.append("".join(current).strip())
+            # recouvrement : dernières unités du chunk précédent
+            carried, size = [], 0
+            for u in reversed(current):
+                if size + len(u) > overlap:
+                    break
+                carried.insert(0, u)
+                size += len(u)
+            current = carried if size + len(unit) <= max_chars else []
+        current.append(unit)
+    if current:
+        chunks.append("".join(current).strip())
+    return [c for c in chunks if c]
+
+
+def md_chunker(md_file_path, headers_to_split_on=headers_to_split_on, max_chars=MAX_CHUNK_CHARS, overlap=CHUNK_OVERLAP_CHARS):
+    """
+    Découpe un markdown par titres, puis découpe les sections trop longues selon le budget de caractères.
+    return : liste de (contenu, métadonnées du splitter)
+    """
     # ouvre le markdown
     with open(md_file_path, "r", encoding="utf-8") as f:
         md_text = f.read()
     # split et chunk le md
     splitter = MarkdownHeaderTextSplitter(headers_to_split_on)
-    chunks = splitter.split_text(md_text)
-
+    chunks = []
+    for section in splitter.split_text(md_text):
+        for part in split_with_budget(section.page_content, max_chars, overlap) if max_chars else [section.page_content]:
+            chunks.append((part, dict(section.metadata)))
     return chunks
 
 
-def chunk_folder(folder_path: str):
+def _chunk_file(args):
+    # exécuté dans un process du pool
+    file_path, source, max_chars = args
+    return source, md_chunker(file_path, max_chars=max_chars)
+
+
+def iter_chunk_folder(folder_path: str, max_chars: int = MAX_CHUNK_CHARS, workers: int = None):
+    """
+    Générateur des (chunk, métadonnées) des fichiers markdown du dossier et de ses sous-dossiers.
+    Les fichiers sont découpés en parallèle sur un pool de process ; les chunks sont rendus fichier par fichier.
+    Au plus 2 fichiers par worker sont en cours : le découpage ne prend pas d'avance sur la vectorisation.
+    arg : max_chars (budget par chunk, None pour le découpage par titres seul)
+    """
+    def tasks():
+        for root, _, filenames in os.walk(folder_path):
+            for filename in sorted(filenames):
+                if filename.endswith(".md"):
+                    file_path = os.path.join(root, filename)
+                    yield file_path, os.path.relpath(file_path, folder_path), max_chars
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = tasks()
+        for task in remaining:
+            pending.append(pool.submit(_chunk_file, task))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            source, chunks = pending.popleft().result()
+            # un fichier rendu, un fichier soumis
+            task = next(remaining, None)
+            if task is not None:
+                pending.append(pool.submit(_chunk_file, task))
+            print(f"Chunking: {source}")
+            for i, (content, metadata) in enumerate(chunks):
+                yield content, {
+                    "source": source,
+                    "chunk_id": i,
+                    **metadata  # ajoute aussi les métadonnées du splitter, si existantes
+                }
+
+
+def chunk_folder(folder_path: str, max_chars: int = MAX_CHUNK_CHARS):
     all_chunks = []
     metadatas = []
+    for chunk, metadata in iter_chunk_folder(folder_path, max_chars=max_chars):
+        all_chunks.append(chunk)
+        metadatas.append(metadata)
+    return all_chunks, metadatas
+
+
+def chunk_size_stats(chunks: list[str]) -> dict:
+    """
+    return : distribution de la taille des chunks (en tokens estimés)
+    """
+    sizes = sorted(estimate_tokens(c) for c in chunks)
+    if not sizes:
+        return {"n": 0}
+    return {
+        "n": len(sizes),
+        "mean_tokens": round(statistics.fmean(sizes), 1),
+        "p50_tokens": sizes[len(sizes) // 2],
+        "p95_tokens": sizes[min(len(sizes) - 1, int(0.95 * len(sizes)))],
+        "max_tokens": sizes[-1],
+    }
+
+
+def benchmark_chunking(folder_path: str, queries: list[str], n_results: int = 1) -> dict:
+    """
+    Compare le découpage par titres seul et le découpage avec budget : distribution des tailles de chunks
+    et tokens de contexte injectés dans le prompt d'AssistantTeacher (n_results chunks par question),
+    mesurés sur une collection Chroma éphémère construite avec chaque découpage.
+    """
+    import chromadb
+    from utils.utils import embedding_function
+
+    results = {}
+    for mode, max_chars in [("headers_only", None), ("budget", MAX_CHUNK_CHARS)]:
+        chunks, _ = chunk_folder(folder_path, max_chars=max_chars)
+        collection = chromadb.EphemeralClient().get_or_create_collection(
+            name=f"bench_{mode}", embedding_function=embedding_function)
+        collection.add(documents=chunks, ids=[str(i) for i in range(len(chunks))])
+        contexts = collection.query(query_texts=queries, n_results=n_results)["documents"]
+        prompt_tokens = [sum(estimate_tokens(doc) for doc in docs) for docs in contexts]
+        results[mode] = {
+            "chunks": chunk_size_stats(chunks),
+            "context_tokens_per_query": round(statistics.fmean(prompt_tokens), 1),
+        }
+    return results
 
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".md"):
-            file_path = os.path.join(folder_path, filename)
-            print(f"Chunking: {file_path}")
-            chunks = md_chunker(file_path)
-
-            for i, chunk in enumerate(chunks):
-                # Si chunk est un Document (par ex. de langchain)
-                all_chunks.append(chunk.page_content)
-                metadatas.append({
-                    "source": filename,
-                    "chunk_id": i,
-                    **chunk.metadata  # ajoute aussi les métadonnées du splitter, si existantes
-                })
 
-    return all_chunks, metadatas
\ No newline at end of file
+# ---- TESTS ----
+# from Agent.AssistantTeacher.AssistantTeacher import queries
+# print(benchmark_chunking(r"Agent\Markdown_data", queries))
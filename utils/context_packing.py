@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from utils.tokens import estimate_tokens, CHARS_PER_TOKEN
+from utils import metrics
+import re
+
+# Sélection des contextes envoyés au LLM : on sur-échantillonne des candidats, on écarte ceux trop éloignés de la question
+# et les doublons, puis on garde les meilleurs tant qu'ils tiennent dans le budget de tokens de l'agent.
+
+
+@dataclass
+class PackingConfig:
+    agent: str
+    token_budget: int             # tokens de contexte par appel du tool
+    n_candidates: int = 10        # candidats demandés à la recherche hybride
+    max_distance: float = 0.5     # distance L2 au carré (embeddings normalisés : 2 - 2 * cosinus) ; None pour désactiver
+    min_contexts: int = 1         # contextes gardés même au-delà du seuil de distance
+
+
+def dedup_key(document: str, metadata: dict):
+    # même chunk ingéré deux fois (source et position identiques), ou même texte sous deux sources
+    metadata = metadata or {}
+    source = metadata.get("source") or metadata.get("url")
+    if source is not None and metadata.get("chunk_id") is not None:
+        return source, metadata["chunk_id"]
+    return re.sub(r"\s+", " ", document).strip().lower()
+
+
+def pack(documents: list[str], metadatas: list[dict], distances: list, config: PackingConfig, token_budget: int) -> list[int]:
+    """
+    Choisit les contextes d'une requête, dans l'ordre de pertinence.
+    arg : distances (None pour un résultat lexical seul, qui n'est pas filtré), token_budget (budget de cette requête)
+    return : les positions gardées
+    """
+    kept, keys, used = [], set(), 0
+    for i, (document, metadata, distance) in enumerate(zip(documents, metadatas, distances)):
+        key = dedup_key(document, metadata)
+        if key in keys:
+            metrics.incr(f"context.{config.agent}.dropped_duplicate")
+            continue
+        if (config.max_distance is not None and distance is not None and distance > config.max_distance
+                and len(kept) >= config.min_contexts):
+            metrics.incr(f"context.{config.agent}.dropped_distance")
+            continue
+        tokens = estimate_tokens(document)
+        if used + tokens > token_budget and kept:
+            # un contexte plus court, plus loin dans la liste, peut encore tenir
+            metrics.incr(f"context.{config.agent}.dropped_budget")
+            continue
+        keys.add(key)
+        kept.append(i)
+        used += tokens
+    return kept
+
+
+def pack_result(groups: list[list[str]], result: dict, config: PackingConfig) -> dict:
+    """
+    Applique pack à chaque requête d'un résultat groupé ; le budget d'un appel est partagé entre ses requêtes.
+    Un contexte seul plus long que le budget est tronqué.
+    return : le résultat filtré, au même format
+    """
+    packed = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    i = 0
+    for group in groups:
+        budget = max(1, config.token_budget // len(group)) if group else config.token_budget
+        for _ in group:
+            documents = result["documents"][i]
+            kept = pack(documents, result["metadatas"][i], result["distances"][i], config, budget)
+            packed["ids"].append([result["ids"][i][k] for k in kept])
+            packed["documents"].append([documents[k][:budget * CHARS_PER_TOKEN] for k in kept])
+            packed["metadatas"].append([result["metadatas"][i][k] for k in kept])
+            packed["distances"].append([result["distances"][i][k] for k in kept])
+            i += 1
+    return packed
+
+
+def record(config: PackingConfig, contexts: list[str], duration: float):
+    # tokens de contexte réellement envoyés au LLM et latence de la recherche (amortie sur les appels groupés), par agent
+    metrics.incr(f"context.{config.agent}.calls", len(contexts))
+    metrics.incr(f"context.{config.agent}.tokens", sum(estimate_tokens(c) for c in contexts))
+    metrics.incr(f"context.{config.agent}.retrieval_s", duration)
+
+
+def record_llm_call(agent: str, message, duration: float):
+    # tokens de prompt rapportés par Mistral (usage_metadata) et latence de l'appel
+    metrics.incr(f"llm.{agent}.calls")
+    metrics.incr(f"llm.{agent}.latency_s", duration)
+    usage = getattr(message, "usage_metadata", None) or {}
+    metrics.incr(f"llm.{agent}.input_tokens", usage.get("input_tokens", 0))
+
+
+def context_stats(agent: str) -> dict:
+    """
+    return : moyennes par appel du tool (tokens de contexte, latence de la recherche, contextes écartés)
+    et par appel au LLM (tokens de prompt, latence), pour régler le budget de l'agent
+    """
+    calls = metrics.get(f"context.{agent}.calls")
+    llm_calls = metrics.get(f"llm.{agent}.calls")
+    return {
+        "retrieval_calls": int(calls),
+        "context_tokens_per_call": round(metrics.ratio(f"context.{agent}.tokens", f"context.{agent}.calls"), 1),
+        "retrieval_ms_per_call": round(1000 * metrics.ratio(f"context.{agent}.retrieval_s", f"context.{agent}.calls"), 1),
+        "dropped": {reason: int(metrics.get(f"context.{agent}.dropped_{reason}"))
+                    for reason in ("distance", "duplicate", "budget")},
+        "llm_calls": int(llm_calls),
+        "prompt_tokens_per_llm_call": round(metrics.ratio(f"llm.{agent}.input_tokens", f"llm.{agent}.calls"), 1),
+        "llm_ms_per_call": round(1000 * metrics.ratio(f"llm.{agent}.latency_s", f"llm.{agent}.calls"), 1),
+    }
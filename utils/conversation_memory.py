@@ -0,0 +1,198 @@
+from collections import deque
+from dataclasses import dataclass
+from utils.tokens import estimate_tokens
+from utils.benchmark import timed
+import tracemalloc
+import random
+import sys
+import re
+
+# Mémoire de conversation bornée, une par session Chainlit :
+# - les derniers échanges en entier dans un tampon circulaire (max_turns)
+# - les échanges plus anciens compactés en une ligne chacun (début de la question et de la réponse) dans un résumé
+#   glissant, plafonné à summary_tokens : les lignes les plus anciennes en sortent
+# - chaque message est tronqué à max_message_chars à l'enregistrement (réponses longues, tableaux markdown)
+# La taille d'une session ne dépend donc plus du nombre d'échanges. Les agents reçoivent un contexte taillé à leur
+# budget de tokens : les échanges les plus récents d'abord, puis les lignes du résumé qui tiennent dans ce qui reste.
+
+MAX_TURNS = 6
+TOKEN_BUDGET = 1200
+SUMMARY_TOKENS = 400
+MAX_MESSAGE_CHARS = 2000
+TURN_OVERHEAD_TOKENS = 6            # "Étudiant : " / "Assistant : " autour de chaque échange
+HEADER_TOKENS = 16                  # titres des deux parties du contexte
+SUMMARY_QUESTION_CHARS = 80
+SUMMARY_ANSWER_CHARS = 120
+
+# questions qui ne se comprennent qu'avec l'échange précédent ("et demain ?", "plus de détails", "pareil jeudi ?")
+# seulement si elles sont courtes et sans sujet propre : "Il y a cours demain ?" ou "Comment ça marche l'inscription ?"
+# se comprennent seules et passent par le routeur
+FOLLOW_UP_MAX_WORDS = 6
+follow_up_pattern = re.compile(
+    r"^(et|mais|donc|ok|d'accord)\b|\b(celui-ci|celle-ci|celui-la|celle-la|ceux-ci|le meme|la meme|les memes|dessus"
+    r"|precedent\w*|plus de details|developpe|explique davantage|pareil)\b"
+)
+# mots qui donnent un sujet à la question (cours, emploi du temps, université) : la question n'est pas un suivi
+subject_pattern = re.compile(
+    r"\b(cours|cm|td|tp|partiels?|examens?|controles?|emploi du temps|edt|planning|salles?|inscriptions?|lois?"
+    r"|definitions?|theoremes?|formules?|estimateurs?|uvsq|crous|bourses?|bibliotheque|campus|logements?)\b"
+)
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    agent: str
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+
+def is_follow_up(question: str, normalize=str.lower) -> bool:
+    """
+    arg : normalize (mise en forme de la question avant les motifs : minuscules, sans accents)
+    """
+    text = normalize(question).strip()
+    if len(text.split()) > FOLLOW_UP_MAX_WORDS or subject_pattern.search(text):
+        return False
+    return bool(follow_up_pattern.search(text))
+
+
+class ConversationMemory:
+    def __init__(self, max_turns: int = MAX_TURNS, summary_tokens: int = SUMMARY_TOKENS,
+                 max_message_chars: int = MAX_MESSAGE_CHARS):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = deque()          # une ligne par échange sorti du tampon, de la plus ancienne à la plus récente
+        self.summary_tokens = summary_tokens
+        self._summary_size = 0          # tokens des lignes du résumé
+        self.max_message_chars = max_message_chars
+        self.n_turns = 0
+        self.last_agent = None
+
+    def add(self, question: str, answer: str, agent: str):
+        if len(self.turns) == self.turns.maxlen:
+            self._compact(self.turns[0])
+        self.turns.append(Turn(_truncate(question, self.max_message_chars), _truncate(answer, self.max_message_chars), agent))
+        self.n_turns += 1
+        self.last_agent = agent
+
+    def last_question(self, agent: str, normalize=str.lower):
+        """
+        return : la dernière question posée à `agent` qui n'est pas elle-même une question de suivi (sujet de la
+                 conversation avec cet agent), None s'il n'y en a pas dans le tampon
+        """
+        for turn in reversed(self.turns):
+            if turn.agent == agent and not is_follow_up(turn.question, normalize):
+                return turn.question
+        return None
+
+    def _compact(self, turn: Turn):
+        line = (f"- ({turn.agent}) {_truncate(turn.question, SUMMARY_QUESTION_CHARS)} → "
+                f"{_truncate(turn.answer, SUMMARY_ANSWER_CHARS)}")
+        self.summary.append(line)
+        self._summary_size += estimate_tokens(line)
+        while self._summary_size > self.summary_tokens and self.summary:
+            self._summary_size -= estimate_tokens(self.summary.popleft())
+
+    def budgeted_turns(self, token_budget: int = TOKEN_BUDGET, agent: str = None):
+        """
+        return : (lignes du résumé retenues, échanges récents retenus, du plus ancien au plus récent) dans token_budget
+        arg : agent (ne garder que les échanges récents avec cet agent)
+        """
+        turns, used = [], HEADER_TOKENS
+        for turn in reversed(self.turns):
+            if agent and turn.agent != agent:
+                continue
+            size = estimate_tokens(turn.question) + estimate_tokens(turn.answer) + TURN_OVERHEAD_TOKENS
+            if used + size > token_budget:
+                break
+            turns.append(turn)
+            used += size
+        summary = []
+        for line in reversed(self.summary):
+            if used + estimate_tokens(line) > token_budget:
+                break
+            summary.append(line)
+            used += estimate_tokens(line)
+        return summary[::-1], turns[::-1]
+
+    def context(self, token_budget: int = TOKEN_BUDGET, agent: str = None) -> str:
+        """
+        Historique en texte pour un prompt : résumé des anciens échanges puis derniers échanges, dans token_budget.
+        """
+        summary, turns = self.budgeted_turns(token_budget, agent)
+        parts = []
+        if summary:
+            parts.append("Résumé des échanges précédents :\n" + "\n".join(summary))
+        if turns:
+            parts.append("Derniers échanges :\n" + "\n".join(f"Étudiant : {t.question}\nAssistant : {t.answer}" for t in turns))
+        return "\n\n".join(parts)
+
+    def messages(self, token_budget: int = TOKEN_BUDGET, agent: str = None) -> list:
+        """
+        Historique en messages LangChain (résumé en SystemMessage, échanges en HumanMessage / AIMessage) dans token_budget.
+        """
+        from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+
+        summary, turns = self.budgeted_turns(token_budget, agent)
+        messages = [SystemMessage(content="Résumé des échanges précédents :\n" + "\n".join(summary))] if summary else []
+        for turn in turns:
+            messages += [HumanMessage(content=turn.question), AIMessage(content=turn.answer)]
+        return messages
+
+    def size_bytes(self) -> int:
+        # taille des chaînes gardées (tampon et résumé), hors structure de l'objet
+        strings = [s for t in self.turns for s in (t.question, t.answer)] + list(self.summary)
+        return sum(sys.getsizeof(s) for s in strings)
+
+
+def synthetic_turn(rng: random.Random, i: int) -> tuple:
+    subjects = ["mon emploi du temps", "la salle du TD", "les examens", "la bibliothèque", "le cours de statistique",
+                "les inscriptions", "la cantine", "les partiels de mars"]
+    question = f"Question {i} : peux-tu m'en dire plus sur {rng.choice(subjects)} ?" + " Merci." * rng.randint(0, 5)
+    answer = f"Réponse {i} : " + " ".join(rng.choice(["Voici", "les", "informations", "demandées", "sur", "ce", "point",
+                                                      "avec", "des", "détails", "utiles", "pour", "toi"])
+                                          for _ in range(rng.randint(40, 400)))
+    return question, answer, rng.choice(["SmartPlanner", "AssistantTeacher", "info_UVSQ", "none"])
+
+
+def benchmark_memory(n_turns: int = 1000, checkpoints=(10, 100, 1000), seed: int = 0) -> dict:
+    """
+    Mémoire d'une session synthétique de n_turns échanges : liste non bornée de tous les messages (ancien état)
+    contre ConversationMemory, mesurée avec tracemalloc aux checkpoints, et coût de add() et de context().
+    """
+    rng = random.Random(seed)
+    exchanges = [synthetic_turn(rng, i) for i in range(n_turns)]
+    results = {}
+    for mode in ("unbounded_list", "conversation_memory"):
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        store = [] if mode == "unbounded_list" else ConversationMemory()
+        sizes, add_s = {}, 0.0
+        for i, (question, answer, agent) in enumerate(exchanges, start=1):
+            # copies : les chaînes de la session ne sont pas partagées avec la liste d'échanges du benchmark
+            question, answer = "".join(list(question)), "".join(list(answer))
+            if mode == "unbounded_list":
+                _, duration = timed(store.extend, [question, answer])
+            else:
+                _, duration = timed(store.add, question, answer, agent)
+            add_s += duration
+            if i in checkpoints:
+                sizes[i] = round((tracemalloc.get_traced_memory()[0] - base) / 1024, 1)
+        tracemalloc.stop()
+        results[mode] = {"kib_at_turn": sizes, "add_us": round(1e6 * add_s / n_turns, 2)}
+        if mode == "conversation_memory":
+            context, duration = timed(store.context)
+            results[mode].update(context_tokens=estimate_tokens(context), context_ms=round(1000 * duration, 3),
+                                 summary_lines=len(store.summary))
+        else:
+            history = "\n".join(store)
+            results[mode]["history_tokens"] = estimate_tokens(history)
+    return results
+
+
+# ---- TESTS ----
+# print(benchmark_memory(1000))
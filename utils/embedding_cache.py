@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils import metrics
+import unicodedata
+import threading
+import queue
+import time
+import re
+
+# Encodage des requêtes (côté recherche) :
+# - cache LRU des embeddings, indexé par le texte normalisé de la requête
+# - encodeur en micro-batchs : les requêtes concurrentes arrivées en quelques ms partagent un seul appel au modèle
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class MicroBatchEncoder:
+    """
+    Regroupe les textes soumis par plusieurs threads en un seul appel à encode_fn.
+    Un lot part dès qu'il atteint max_batch textes ou max_wait_ms après l'arrivée du premier.
+    """
+
+    def __init__(self, encode_fn, max_wait_ms: float = 5, max_batch: int = 32):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, texts: list[str]) -> list:
+        futures = [self.submit(t) for t in texts]
+        return [f.result() for f in futures]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            texts = [t for t, _ in batch]
+            metrics.incr("embedding_cache.batches")
+            metrics.incr("embedding_cache.batched_texts", len(texts))
+            try:
+                vectors = self.encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class CachedEmbeddingFunction:
+    """
+    Se place devant une fonction d'embedding Chroma (même interface : liste de textes -> liste de vecteurs).
+    """
+
+    def __init__(self, embedding_function, max_size: int = 4096, max_wait_ms: float = 5, max_batch: int = 32):
+        self.embedding_function = embedding_function
+        self.max_size = max_size
+        self.encoder = MicroBatchEncoder(embedding_function, max_wait_ms, max_batch)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, input: list[str]) -> list:
+        keys = [normalize_text(t) for t in input]
+        vectors, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    vectors[key] = self._cache[key]
+                elif key not in missing:
+                    missing.append(key)
+        metrics.incr("embedding_cache.hits", len(keys) - len(missing))
+        metrics.incr("embedding_cache.misses", len(missing))
+        if missing:
+            for key, vector in zip(missing, self.encoder.encode(missing)):
+                vectors[key] = vector
+            with self._lock:
+                for key in missing:
+                    self._cache[key] = vectors[key]
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def stats() -> dict:
+        batches = metrics.get("embedding_cache.batches")
+        hits, misses = metrics.get("embedding_cache.hits"), metrics.get("embedding_cache.misses")
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "mean_batch_size": metrics.get("embedding_cache.batched_texts") / batches if batches else 0.0,
+        }
+
+
+def benchmark_throughput(embedding_function, queries: list[str], n_concurrent: int = 50) -> dict:
+    """
+    Requêtes par seconde avec n_concurrent threads qui encodent chacun une requête :
+    - direct : un appel au modèle par requête
+    - batched : micro-batchs, sans cache (requêtes toutes différentes)
+    - cached : micro-batchs et cache, requêtes répétées (second passage)
+    """
+    def run(encode, texts):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_concurrent) as pool:
+            list(pool.map(lambda t: encode([t]), texts))
+        return round(len(texts) / (time.perf_counter() - start), 1)
+
+    texts = [f"{queries[i % len(queries)]} ({i})" for i in range(n_concurrent)]
+    cached = CachedEmbeddingFunction(embedding_function)
+    results = {
+        "direct_qps": run(embedding_function, texts),
+        "batched_qps": run(cached, texts),
+    }
+    results["cached_qps"] = run(cached, texts)
+    return results
@@ -1,4 +1,5 @@
 from typing import Any
+import asyncio
 
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableLambda, RunnableWithFallbacks
@@ -26,4 +27,64 @@ def handle_tool_error(state) -> dict:
             )
             for tc in tool_calls
         ]
-    }
\ No newline at end of file
+    }
+
+
+def create_batched_retrieval_node(retrieve_groups):
+    """
+    Noeud de tools qui regroupe les appels parallèles au tool de retrieval du dernier message en une seule recherche.
+    arg : retrieve_groups (fonction synchrone : liste des requêtes de chaque appel -> contextes de chaque appel)
+    return : un noeud asynchrone qui renvoie une ToolMessage par tool_call_id
+    """
+    async def batched_retrieval(state) -> dict:
+        tool_calls = state["messages"][-1].tool_calls
+        groups = []
+        for tc in tool_calls:
+            queries = tc["args"].get("queries") or []
+            groups.append([queries] if isinstance(queries, str) else list(queries))
+        try:
+            # encodage et requête Chroma synchrones : exécutés dans un thread
+            contexts = await asyncio.to_thread(retrieve_groups, groups)
+        except Exception as error:
+            return handle_tool_error({"error": error, "messages": state["messages"]})
+        return {
+            "messages": [
+                ToolMessage(content=text, tool_call_id=tc["id"], name=tc["name"])
+                for tc, text in zip(tool_calls, contexts)
+            ]
+        }
+    return batched_retrieval
+
+
+async def stream_graph_answer(graph, inputs: dict, nodes: tuple, final_answer, tool_nodes: tuple = ()):
+    """
+    Stream les réponses produites par les LLM des noeuds `nodes` du graphe, sans les appels de tools.
+    Les noeuds sans tools sont streamés directement. Pour ceux de `tool_nodes` (LLM avec bind_tools), chaque appel
+    au LLM est tranché sur son premier morceau non vide : un appel de tool -> l'appel n'est pas montré, du texte ->
+    l'appel est streamé au fil de l'eau (et arrêté s'il émet ensuite un appel de tool).
+    Si rien n'a été envoyé (ex: noeud final sans LLM), renvoie la réponse extraite de l'état final.
+    arg : graph (graphe LangGraph compilé), inputs (état initial), nodes (noeuds dont la sortie est montrée à l'utilisateur),
+          final_answer (fonction qui extrait la réponse de l'état final), tool_nodes (noeuds de `nodes` dont le LLM peut appeler des tools)
+    """
+    streamed = False
+    runs = {}   # run_id d'un appel au LLM d'un noeud de tool_nodes -> True (streamé) / False (appel de tool)
+    async for event in graph.astream_events(inputs, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") in nodes:
+            chunk = event["data"]["chunk"]
+            if event["metadata"].get("langgraph_node") in tool_nodes:
+                run_id = event["run_id"]
+                if chunk.tool_call_chunks:
+                    runs[run_id] = False
+                elif chunk.content:
+                    runs.setdefault(run_id, True)
+                if not runs.get(run_id):
+                    continue
+            if chunk.content:
+                streamed = True
+                yield chunk.content
+        elif kind == "on_chat_model_end":
+            runs.pop(event["run_id"], None)
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            if not streamed:
+                yield final_answer(event["data"]["output"])
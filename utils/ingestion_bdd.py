@@ -1,26 +1,258 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import numpy as np
 import chromadb
+import tempfile
+import hashlib
 import logging
+import sqlite3
+import json
+import time
+import sys
 import os
-from utils.chunk_files import chunk_folder
+from utils.chunk_files import iter_chunk_folder
 from utils.utils import embedding_function
+from utils.lexical_index import BM25Writer, index_path
+from utils.quantized_index import build_from_chroma, current_path
+from utils.retrieval import invalidate_collection
+from utils.benchmark import peak_rss
 
-def embed_chunks_to_chroma(chunks: list[str], metadatas: list[dict], collection_name: str, collection_path: str):    
+# Pipeline d'ingestion en flux : lecture -> chunking -> vectorisation par lots sur un pool de workers -> écriture
+# dans Chroma par lots bornés. Le manifeste (ids déjà vectorisés, table SQLite) est complété après chaque lot écrit :
+# il sert de checkpoint, une ingestion interrompue reprend là où elle s'est arrêtée, et ré-ingérer un corpus inchangé
+# ne vectorise rien. Les ids vus, le manifeste et l'index BM25 sont sur disque : la mémoire de l'ingestion ne dépend
+# que de la taille des lots, pas de celle du corpus.
+
+
+def chunk_hash_id(chunk: str, metadata: dict) -> str:
+    """
+    Id stable d'un chunk : hash de sa source et de son contenu (le même chunk garde le même id d'une ingestion à l'autre).
+    """
+    source = (metadata or {}).get("source", "")
+    return hashlib.sha256(f"{source}\x00{chunk}".encode("utf-8")).hexdigest()[:32]
+
+
+def metadata_hash(metadata: dict) -> str:
+    return hashlib.sha256(json.dumps(metadata or {}, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def manifest_path(collection_path: str, collection_name: str) -> str:
+    return os.path.join(collection_path, f"{collection_name}_manifest.sqlite")
+
+
+def open_manifest(collection_path: str, collection_name: str, collection=None) -> sqlite3.Connection:
+    """
+    Manifeste des chunks déjà vectorisés : table manifest(id, hash des métadonnées) dans un fichier SQLite à côté
+    de la collection, lue et écrite ligne à ligne (la mémoire ne dépend pas de la taille du corpus).
+    Reprend l'ancien journal "id<TAB>hash" s'il existe ; sans manifeste (collection créée avant les ids par hash),
+    les ids présents dans la collection sont repris pour que les anciens "doc_{i}" soient supprimés.
+    La table temporaire seen (sur disque) reçoit les ids rencontrés pendant l'ingestion en cours, la table meta
+    garde l'état de l'ingestion (dirty : une ingestion a écrit dans la collection sans aller jusqu'au bout).
+    """
+    os.makedirs(collection_path, exist_ok=True)
+    path = manifest_path(collection_path, collection_name)
+    exists = os.path.exists(path)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA temp_store = FILE")
+    connection.execute("CREATE TABLE IF NOT EXISTS manifest (id TEXT PRIMARY KEY, meta TEXT) WITHOUT ROWID")
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur TEXT)")
+    connection.execute("CREATE TEMP TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+    if not exists:
+        legacy = path[:-len(".sqlite")] + ".tsv"
+        with connection:
+            if os.path.exists(legacy):
+                # la dernière ligne d'un id fait foi
+                with open(legacy, "r", encoding="utf-8") as f:
+                    rows = (line.rstrip("\n").partition("\t")[::2] for line in f)
+                    connection.executemany("INSERT OR REPLACE INTO manifest VALUES (?, ?)", rows)
+            elif collection is not None:
+                ids = collection.get(include=[])["ids"]
+                connection.executemany("INSERT OR IGNORE INTO manifest VALUES (?, NULL)", ((i,) for i in ids))
+    return connection
+
+
+def batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_stream(items, collection_name: str, collection_path: str, batch_size: int = 256, workers: int = 2,
+                  dry_run: bool = False, embed_fn=embedding_function, lexical_index: bool = True):
+    """
+    Ingestion incrémentale en flux d'un itérable de (chunk, métadonnées).
+    - seuls les chunks nouveaux sont vectorisés (par lots de batch_size, sur `workers` threads) et écrits par upsert
+    - les chunks dont seules les métadonnées ont changé sont mis à jour sans ré-encodage
+    - les chunks disparus du corpus sont supprimés, une fois le corpus entièrement parcouru
+    - une ingestion interrompue est marquée dans le manifeste (dirty) : la suivante reconstruit les index dérivés
+      (BM25, index compact) même si elle ne trouve plus rien à vectoriser
+    arg : dry_run (n'écrit rien, rapporte seulement ce qui changerait),
+          lexical_index (réécrit l'index BM25 de la recherche hybride au fil du parcours, remplacé s'il a changé)
+    return : le rapport des changements
+    """
     client = chromadb.PersistentClient(path=collection_path)
     collection = client.get_or_create_collection(name=collection_name, embedding_function=embedding_function)
-       # Ajout à la collection (ajustement des ids si nécessaire)
-    collection.add(
-        documents=chunks,
-        metadatas=metadatas,
-        ids=[f"doc_{i}" for i in range(len(chunks))]
-    )
+    manifest = open_manifest(collection_path, collection_name, collection)
+    report = {"add": 0, "update": 0, "delete": 0, "unchanged": 0}
+    lexical = BM25Writer(index_path(collection_path, collection_name)) if lexical_index and not dry_run else None
+    start = time.perf_counter()
+    complete = False
+    # index dérivés en retard sur la collection : ingestion précédente interrompue après des écritures
+    dirty = manifest.execute("SELECT valeur FROM meta WHERE cle = 'dirty'").fetchone() is not None
+    if dirty and not dry_run:
+        print(f"{collection_name} : ingestion précédente interrompue, index BM25 et compact reconstruits")
+    if not dry_run:
+        with manifest:
+            manifest.execute("INSERT OR REPLACE INTO meta VALUES ('dirty', '1')")
+
+    def changes():
+        for chunk, metadata in items:
+            doc_id = chunk_hash_id(chunk, metadata)
+            if manifest.execute("INSERT OR IGNORE INTO seen VALUES (?)", (doc_id,)).rowcount == 0:
+                continue    # doublon exact dans le corpus
+            if lexical is not None:
+                lexical.add(doc_id, chunk, metadata)
+            meta = metadata_hash(metadata)
+            row = manifest.execute("SELECT meta FROM manifest WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                report["add"] += 1
+                yield "add", doc_id, chunk, metadata, meta
+            elif row[0] != meta:
+                report["update"] += 1
+                yield "update", doc_id, chunk, metadata, meta
+            else:
+                report["unchanged"] += 1
+
+    def embed(batch):
+        documents = [chunk for kind, _, chunk, _, _ in batch if kind == "add"]
+        return embed_fn(documents) if documents else []
+
+    def write(batch, embeddings):
+        adds = [b for b in batch if b[0] == "add"]
+        updates = [b for b in batch if b[0] == "update"]
+        if adds:
+            collection.upsert(
+                ids=[b[1] for b in adds],
+                embeddings=embeddings,
+                documents=[b[2] for b in adds],
+                metadatas=[b[3] for b in adds]
+            )
+        if updates:
+            collection.update(ids=[b[1] for b in updates], metadatas=[b[3] for b in updates])
+        # checkpoint : le manifeste est validé après chaque lot écrit dans Chroma
+        with manifest:
+            manifest.executemany("INSERT OR REPLACE INTO manifest VALUES (?, ?)", [(b[1], b[4]) for b in batch])
+        done = report["add"] + report["update"] + report["unchanged"]
+        print(f"{collection_name} : {done} chunks parcourus, {report['add']} vectorisés "
+              f"({done / (time.perf_counter() - start):.0f} chunks/s)")
+
+    try:
+        if dry_run:
+            for _ in changes():
+                pass
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for batch in batched(changes(), batch_size):
+                    pending.append((batch, pool.submit(embed, batch)))
+                    # nombre de lots en vol borné : la lecture ne prend pas d'avance sur l'écriture
+                    while len(pending) > workers:
+                        batch, future = pending.popleft()
+                        write(batch, future.result())
+                while pending:
+                    batch, future = pending.popleft()
+                    write(batch, future.result())
+
+        # suppression des chunks disparus, seulement si le corpus a été entièrement parcouru
+        deleted_query = "SELECT id FROM manifest WHERE id NOT IN (SELECT id FROM temp.seen)"
+        report["delete"] = manifest.execute(f"SELECT count(*) FROM ({deleted_query})").fetchone()[0]
+        print(f"{collection_name} : {report}" + (" (dry run)" if dry_run else ""))
+        if dry_run:
+            return report
+        while True:
+            batch = [row[0] for row in manifest.execute(f"{deleted_query} LIMIT ?", (batch_size,))]
+            if not batch:
+                break
+            collection.delete(ids=batch)
+            with manifest:
+                manifest.executemany("DELETE FROM manifest WHERE id = ?", ((doc_id,) for doc_id in batch))
+        complete = True
+    finally:
+        changed = bool(report["add"] or report["update"] or report["delete"]) or dirty
+        if lexical is not None:
+            # index lexical BM25 sur les mêmes chunks et ids (recherche hybride), remplacé seulement s'il a changé
+            # et si le corpus a été entièrement parcouru
+            lexical.close(keep=complete and (changed or not os.path.exists(lexical.path)))
+        if not complete:
+            manifest.close()
+
+    try:
+        # index compact reconstruit s'il est utilisé pour cette collection
+        quantized = current_path(collection_path, collection_name)
+        if changed and quantized:
+            with open(os.path.join(quantized, "docs.json"), "r", encoding="utf-8") as f:
+                build_from_chroma(collection_path, collection_name, kind=json.load(f)["kind"])
+        # index dérivés à jour : le marqueur n'est levé qu'ici
+        with manifest:
+            manifest.execute("DELETE FROM meta WHERE cle = 'dirty'")
+    finally:
+        manifest.close()
+    if changed:
+        # collection et index du pool de retrieval rouverts au prochain appel (ingestion dans le processus de l'app)
+        invalidate_collection(collection_path, collection_name)
+    logging.info(f"[INGESTION] {collection_name} : {report} en {time.perf_counter() - start:.1f}s")
+    return report
+
+
+def embed_chunks_to_chroma(chunks: list[str], metadatas: list[dict], collection_name: str, collection_path: str, dry_run: bool = False):
+    return ingest_stream(zip(chunks, metadatas), collection_name, collection_path, dry_run=dry_run)
+
+def ingest_to_chroma(folder_path, collection_name, collection_path, dry_run=False):
+    return ingest_stream(iter_chunk_folder(folder_path), collection_name, collection_path, dry_run=dry_run)
+
+
+def benchmark_ingestion(n_chunks: int = 100_000, batch_size: int = 512, dim: int = 1024) -> dict:
+    """
+    Ingestion d'un corpus synthétique de n_chunks dans une collection temporaire, dans la configuration par défaut
+    (index BM25 compris) : durée, débit et mémoire résidente (RSS) du pipeline en flux, puis ré-ingestion du même
+    corpus (rien à vectoriser). Les embeddings sont aléatoires pour mesurer le pipeline lui-même et non le modèle.
+    Pour comparaison, RSS de la simple matérialisation du corpus en listes (ancien chemin).
+    """
+    rng = np.random.default_rng(0)
+
+    def synthetic_corpus():
+        for i in range(n_chunks):
+            yield (f"Chunk {i} : " + "contenu de cours synthétique " * 20,
+                   {"source": f"cours_{i // 100}.md", "chunk_id": i % 100})
+
+    def fake_embed(documents):
+        return rng.random((len(documents), dim), dtype=np.float32)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as collection_path:
+        for run in ("full", "rerun"):
+            _, duration, rss = peak_rss(ingest_stream, synthetic_corpus(), "BENCH", collection_path,
+                                        batch_size=batch_size, embed_fn=fake_embed)
+            results[run] = {"duration_s": round(duration, 1), "chunks_per_s": round(n_chunks / duration),
+                            "rss_growth_mb": round(rss["rss_peak_mb"] - rss["rss_before_mb"], 1), **rss}
+
+    def materialize():
+        return list(map(list, zip(*synthetic_corpus())))
 
-def ingest_to_chroma(folder_path, collection_name, collection_path):
-    chunks, metadatas = chunk_folder(folder_path)
-    embed_chunks_to_chroma(chunks, metadatas, collection_name, collection_path)
+    corpus, _, rss = peak_rss(materialize)
+    results["lists_only_rss_growth_mb"] = round(rss["rss_peak_mb"] - rss["rss_before_mb"], 1)
+    del corpus
+    return results
 
-folder_path = r"Agent\Markdown_data"
-collection_name = "STAT_NON_PARAM_v"
-collection_path = r"Agent\DBv"
 
-ingest_to_chroma(folder_path, collection_name, collection_path)
+if __name__ == "__main__":
+    folder_path = r"Agent\Markdown_data"
+    collection_name = "STAT_NON_PARAM_v"
+    collection_path = r"Agent\DBv"
 
+    ingest_to_chroma(folder_path, collection_name, collection_path, dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,160 @@
+from collections import Counter, defaultdict
+import unicodedata
+import math
+import json
+import os
+import re
+
+# Index lexical BM25 construit à l'ingestion, à côté de la collection Chroma, sur les mêmes chunks et les mêmes ids.
+# Il retrouve les tokens exacts que la similarité dense manque (codes de cours, noms de salles, "CWUR 2024",
+# "Marta Pan", commandes LaTeX) et sert seul quand le modèle d'embedding n'est pas encore chaud.
+
+stopwords = {
+    "le", "la", "les", "l", "un", "une", "des", "de", "du", "d", "et", "ou", "a", "au", "aux", "en", "dans",
+    "sur", "pour", "par", "avec", "que", "qui", "quoi", "quel", "quelle", "quels", "quelles", "est", "sont",
+    "ce", "ces", "se", "sa", "son", "ses", "il", "elle", "on", "je", "tu", "nous", "vous", "ils", "y",
+    "ne", "pas", "plus", "t", "s", "qu", "c", "j", "n", "m", "comment", "pourquoi",
+}
+token_pattern = re.compile(r"\\[a-zA-Z]+|[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Minuscules, sans accents ; garde les nombres, les codes (ex: "mat-101") et les commandes LaTeX (ex: "\\hat").
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [w for w in token_pattern.findall(text.lower()) if w not in stopwords]
+
+
+def index_path(collection_path: str, collection_name: str) -> str:
+    return os.path.join(collection_path, f"{collection_name}_bm25.json")
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.lengths = []
+        self.total_length = 0
+        self.postings = defaultdict(dict)   # terme -> {position du document: fréquence}
+
+    def add(self, doc_id: str, document: str, metadata: dict = None):
+        position = len(self.ids)
+        terms = Counter(tokenize(document))
+        self.ids.append(doc_id)
+        self.documents.append(document)
+        self.metadatas.append(metadata or {})
+        self.lengths.append(sum(terms.values()))
+        self.total_length += self.lengths[-1]
+        for term, tf in terms.items():
+            self.postings[term][position] = tf
+
+    def remove(self, doc_ids):
+        """
+        Retire des documents (ré-ingestion) ; l'index est reconstruit sans eux.
+        """
+        doc_ids = set(doc_ids)
+        kept = [(i, d, m) for i, d, m in zip(self.ids, self.documents, self.metadatas) if i not in doc_ids]
+        self.__init__(self.k1, self.b)
+        for doc_id, document, metadata in kept:
+            self.add(doc_id, document, metadata)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[int, float]]:
+        """
+        return : les k meilleures positions de documents et leur score BM25
+        """
+        n = len(self.ids)
+        if n == 0:
+            return []
+        avg_length = self.total_length / n
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+    def save(self, path: str):
+        with BM25Writer(path, self.k1, self.b) as writer:
+            for doc_id, document, metadata in zip(self.ids, self.documents, self.metadatas):
+                writer.add(doc_id, document, metadata)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            index = cls(header["k1"], header["b"])
+            if "ids" in header:
+                # ancien format : un seul objet JSON avec les listes ids / documents / metadatas
+                for doc_id, document, metadata in zip(header["ids"], header["documents"], header["metadatas"]):
+                    index.add(doc_id, document, metadata)
+                return index
+            for line in f:
+                doc_id, document, metadata = json.loads(line)
+                index.add(doc_id, document, metadata)
+        return index
+
+
+class BM25Writer:
+    """
+    Écrit un index BM25 au fil de l'eau (une ligne JSON par document, après une ligne d'en-tête), sans garder
+    les textes en mémoire. Le fichier est écrit à côté puis remplace l'ancien à la fermeture : un lecteur ne voit
+    jamais d'index à moitié écrit, et close(keep=False) abandonne l'écriture sans toucher à l'index existant.
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(self.tmp_path, "w", encoding="utf-8")
+        self.file.write(json.dumps({"k1": k1, "b": b}) + "\n")
+        self.n = 0
+
+    def add(self, doc_id: str, document: str, metadata: dict = None):
+        self.file.write(json.dumps([doc_id, document, metadata or {}], ensure_ascii=False) + "\n")
+        self.n += 1
+
+    def close(self, keep: bool = True):
+        if self.file.closed:
+            return
+        self.file.close()
+        if keep:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(keep=exc_type is None)
+
+
+def build_lexical_index(chunks: list[str], metadatas: list[dict], ids: list[str], collection_path: str, collection_name: str):
+    """
+    Construit et sauvegarde l'index BM25 d'une collection (appelé à l'ingestion, avec les ids de Chroma).
+    """
+    index = BM25Index()
+    for doc_id, chunk, metadata in zip(ids, chunks, metadatas):
+        index.add(doc_id, chunk, metadata)
+    os.makedirs(collection_path, exist_ok=True)
+    index.save(index_path(collection_path, collection_name))
+    return index
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """
+    Fusionne plusieurs classements d'ids : score(d) = somme des 1 / (k + rang de d).
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,34 @@
+from collections import defaultdict
+import threading
+
+# Compteurs en mémoire du processus (taux de hit des caches, latence économisée, tokens de prompt, ...)
+_counters = defaultdict(float)
+_lock = threading.Lock()
+
+
+def incr(name: str, value: float = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def ratio(numerator: str, denominator: str) -> float:
+    total = get(denominator)
+    return get(numerator) / total if total else 0.0
+
+
+def snapshot(prefix: str = "") -> dict:
+    """
+    return : une copie des compteurs dont le nom commence par prefix
+    """
+    with _lock:
+        return {k: v for k, v in _counters.items() if k.startswith(prefix)}
+
+
+def reset(prefix: str = ""):
+    with _lock:
+        for k in [k for k in _counters if k.startswith(prefix)]:
+            del _counters[k]
@@ -0,0 +1,243 @@
+from utils.benchmark import summarize, timed, peak_rss
+import numpy as np
+import chromadb
+import shutil
+import json
+import time
+import os
+
+# Index vectoriel compact, alternative au HNSW de Chroma :
+# - embeddings quantifiés (int8 avec une échelle par vecteur, ou binaires 1 bit/dimension) dans un fichier .npy mappé en mémoire
+# - premier passage rapide sur les vecteurs quantifiés, puis rescoring exact (float16) des meilleurs candidats
+# Les vecteurs sont normalisés : le score est la similarité cosinus.
+# Chaque construction écrit une nouvelle version dans un sous-dossier, puis le fichier CURRENT (remplacé
+# atomiquement) la désigne : un lecteur qui a encore l'ancienne version mappée n'est jamais réécrit sous lui.
+
+BLOCK_ROWS = 4096
+# nombre de bits à 1 de chaque octet (distance de Hamming sur les vecteurs binaires)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def index_dir(collection_path: str, collection_name: str) -> str:
+    return os.path.join(collection_path, f"{collection_name}_quantized")
+
+
+def current_path(collection_path: str, collection_name: str):
+    """
+    return : le dossier de la version courante de l'index compact, None s'il n'a jamais été construit
+    """
+    root = index_dir(collection_path, collection_name)
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            path = os.path.join(root, f.read().strip())
+    except OSError:
+        path = root     # index construit avant les versions : fichiers directement dans le dossier
+    return path if os.path.exists(os.path.join(path, "docs.json")) else None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def build_from_chroma(collection_path: str, collection_name: str, kind: str = "int8", page_size: int = 1000):
+    """
+    Construit l'index compact d'une collection Chroma existante, page par page, dans une nouvelle version.
+    arg : kind ("int8" ou "binary")
+    """
+    collection = chromadb.PersistentClient(path=collection_path).get_collection(name=collection_name)
+    n = collection.count()
+    root = index_dir(collection_path, collection_name)
+    version = f"v{time.time_ns()}"
+    out = os.path.join(root, version)
+    os.makedirs(out)
+
+    codes = scales = vectors = None
+    ids, documents, metadatas = [], [], []
+    for offset in range(0, n, page_size):
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        batch = _normalize(page["embeddings"])
+        if vectors is None:
+            dim = batch.shape[1]
+            vectors = np.lib.format.open_memmap(os.path.join(out, "vectors.f16.npy"), mode="w+", dtype=np.float16, shape=(n, dim))
+            if kind == "int8":
+                codes = np.lib.format.open_memmap(os.path.join(out, "codes.npy"), mode="w+", dtype=np.int8, shape=(n, dim))
+                scales = np.lib.format.open_memmap(os.path.join(out, "scales.npy"), mode="w+", dtype=np.float32, shape=(n,))
+            else:
+                codes = np.lib.format.open_memmap(os.path.join(out, "codes.npy"), mode="w+", dtype=np.uint8, shape=(n, (dim + 7) // 8))
+        rows = slice(offset, offset + len(batch))
+        vectors[rows] = batch.astype(np.float16)
+        if kind == "int8":
+            scale = np.maximum(np.abs(batch).max(axis=1), 1e-12) / 127
+            codes[rows] = np.round(batch / scale[:, None]).astype(np.int8)
+            scales[rows] = scale
+        else:
+            codes[rows] = np.packbits(batch > 0, axis=1)
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+
+    if vectors is None:
+        # collection vide : fichiers vides pour que la version se charge normalement
+        vectors = np.zeros((0, 0), dtype=np.float16)
+        codes = np.zeros((0, 0), dtype=np.int8 if kind == "int8" else np.uint8)
+        scales = np.zeros(0, dtype=np.float32) if kind == "int8" else None
+        for name, array in (("vectors.f16.npy", vectors), ("codes.npy", codes), ("scales.npy", scales)):
+            if array is not None:
+                np.save(os.path.join(out, name), array)
+    for array in (codes, scales, vectors):
+        if isinstance(array, np.memmap):
+            array.flush()
+    del codes, scales, vectors
+    with open(os.path.join(out, "docs.json"), "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+
+    # bascule vers la nouvelle version, puis suppression des anciennes (un lecteur qui les a mappées les garde
+    # ouvertes ; là où un fichier ouvert ne peut pas être supprimé, il le sera à la prochaine construction)
+    with open(os.path.join(root, "CURRENT.tmp"), "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(os.path.join(root, "CURRENT.tmp"), os.path.join(root, "CURRENT"))
+    for name in os.listdir(root):
+        if name not in (version, "CURRENT"):
+            old = os.path.join(root, name)
+            if os.path.isdir(old):
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+    return QuantizedIndex(out)
+
+
+class QuantizedIndex:
+    def __init__(self, path: str):
+        with open(os.path.join(path, "docs.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.path = path
+        self.kind = data["kind"]
+        self.ids, self.documents, self.metadatas = data["ids"], data["documents"], data["metadatas"]
+        # mappés en mémoire : seules les pages lues sont chargées
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.f16.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.kind == "int8" else None
+
+    def _first_pass(self, query: np.ndarray) -> np.ndarray:
+        """
+        return : scores approchés de tous les documents (plus grand = plus proche)
+        """
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        if self.kind == "int8":
+            # par blocs convertis en float32 (produit matriciel BLAS) : la mémoire temporaire reste bornée
+            for start in range(0, len(scores), BLOCK_ROWS):
+                block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+                scores[start:start + BLOCK_ROWS] = (block @ query) * self.scales[start:start + BLOCK_ROWS]
+        else:
+            q = np.packbits(query > 0)
+            for start in range(0, len(scores), BLOCK_ROWS):
+                block = self.codes[start:start + BLOCK_ROWS]
+                scores[start:start + BLOCK_ROWS] = -POPCOUNT[np.bitwise_xor(block, q)].sum(axis=1, dtype=np.int32)
+        return scores
+
+    def search(self, query_vector, k: int, n_candidates: int = 100) -> list[tuple[int, float]]:
+        """
+        return : les k meilleures positions et leur similarité cosinus exacte (rescoring des n_candidates premiers)
+        """
+        if not self.ids:
+            return []
+        query = _normalize(query_vector)
+        scores = self._first_pass(query)
+        n_candidates = min(max(n_candidates, k), len(scores))
+        # positions triées : lecture séquentielle du fichier mappé
+        candidates = np.sort(np.argpartition(-scores, n_candidates - 1)[:n_candidates])
+        exact = self.vectors[candidates].astype(np.float32) @ query
+        order = np.argsort(-exact)[:k]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
+
+    def query(self, query_embeddings, n_results: int, n_candidates: int = 100) -> dict:
+        """
+        return : un résultat au format de collection.query ; distances en L2 au carré (2 - 2 * cosinus, vecteurs normalisés)
+                 comme l'espace par défaut des collections Chroma
+        """
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_vector in query_embeddings:
+            hits = self.search(query_vector, n_results, n_candidates)
+            result["ids"].append([self.ids[p] for p, _ in hits])
+            result["documents"].append([self.documents[p] for p, _ in hits])
+            result["metadatas"].append([self.metadatas[p] for p, _ in hits])
+            result["distances"].append([2 - 2 * s for _, s in hits])
+        return result
+
+
+def _dir_size(path: str, names=None) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path)
+               for f in files if names is None or f in names)
+
+
+def index_files_mb(path: str) -> dict:
+    """
+    return : taille de chaque fichier d'une version de l'index compact, en Mo
+    """
+    return {name: round(os.path.getsize(os.path.join(path, name)) / 2**20, 2) for name in sorted(os.listdir(path))}
+
+
+def benchmark_quantized(collection_path: str, collection_name: str, queries: list[str], k: int = 3) -> dict:
+    """
+    Compare Chroma (HNSW) et les index compacts int8 / binaire : taille de tous les fichiers de chaque index,
+    mémoire résidente (RSS) gagnée au chargement et pendant les requêtes, latence et recall@k,
+    la vérité terrain étant la recherche exacte (cosinus en float32) sur tous les embeddings de la collection.
+    """
+    from utils.utils import query_embedding_function
+
+    query_vectors = query_embedding_function(queries)
+
+    def evaluate(search, truth):
+        found, latencies = 0, []
+        for q, expected in zip(query_vectors, truth):
+            ids, duration = timed(search, q)
+            found += len(expected & set(ids))
+            latencies.append(duration)
+        return {f"recall@{k}": round(found / (k * len(queries)), 3), **summarize(latencies)}
+
+    def chroma_run():
+        collection = chromadb.PersistentClient(path=collection_path).get_collection(name=collection_name)
+        return collection, [collection.query(query_embeddings=[q], n_results=k)["ids"][0] for q in query_vectors]
+
+    # Chroma d'abord : sa mémoire (HNSW chargé à la première requête) est mesurée avant le calcul de la vérité terrain
+    (collection, _), _, rss = peak_rss(chroma_run)
+    # fichiers HNSW de Chroma (header.bin, link_lists.bin, ...) : chargés en mémoire avec les vecteurs
+    hnsw_files = {"header.bin", "link_lists.bin", "length.bin", "data_level0.bin", "index_metadata.pickle"}
+    chroma = {"index_mb": round(_dir_size(collection_path, hnsw_files) / 2**20, 2),
+              "rss_growth_mb": round(rss["rss_peak_mb"] - rss["rss_before_mb"], 1)}
+
+    everything = collection.get(include=["embeddings"])
+    all_ids, all_vectors = everything["ids"], _normalize(everything["embeddings"])
+    truth = [set(all_ids[i] for i in np.argsort(-(all_vectors @ _normalize(q)))[:k]) for q in query_vectors]
+    del everything, all_vectors
+    results = {"chroma_hnsw": {**chroma,
+                               **evaluate(lambda q: collection.query(query_embeddings=[q], n_results=k)["ids"][0], truth)}}
+
+    for kind in ("int8", "binary"):
+        path = build_from_chroma(collection_path, collection_name, kind=kind).path
+
+        def load_and_query():
+            # chargement (docs.json en mémoire, fichiers .npy mappés) et requêtes : pages des codes et des candidats lues
+            index = QuantizedIndex(path)
+            for q in query_vectors:
+                index.search(q, k)
+            return index
+
+        index, _, rss = peak_rss(load_and_query)
+        files = index_files_mb(path)
+        results[kind] = {
+            "files_mb": files,
+            "index_mb": round(sum(files.values()), 2),
+            "rss_growth_mb": round(rss["rss_peak_mb"] - rss["rss_before_mb"], 1),
+            **evaluate(lambda q: [index.ids[p] for p, _ in index.search(q, k)], truth),
+        }
+    return results
+
+
+# ---- TESTS ----
+# from Agent.info_UVSQ.info_UVSQ import queries
+# print(benchmark_quantized("Agent/info_UVSQ/DBv", "UVSQ_DOCS", queries, k=3))
@@ -0,0 +1,357 @@
+import chromadb
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from utils.utils import embedding_function, query_embedding_function
+from utils.lexical_index import BM25Index, index_path, reciprocal_rank_fusion
+from utils.quantized_index import QuantizedIndex, current_path
+from utils.context_packing import PackingConfig, pack_result, record
+from utils.benchmark import summarize, timed
+from utils.tokens import estimate_tokens
+import threading
+import random
+import time
+import os
+
+# Couche de retrieval partagée par les agents :
+# - un seul modèle d'embedding chaud par processus (utils.utils.embedding_function)
+# - un pool de collections Chroma ouvertes, indexé par (path, name), rouvertes quand la collection est ré-ingérée
+# - un verrou par collection pour sérialiser les requêtes sur un même index
+# - l'index lexical BM25 de chaque collection, fusionné aux résultats denses (hybrid_query)
+# - RETRIEVAL_BACKEND=quantized : recherche dense sur l'index compact (utils.quantized_index) plutôt que le HNSW de Chroma
+
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "chroma")
+
+_clients = {}
+_collections = {}          # (path, name) -> (version, collection, verrou de ses requêtes)
+_lexical_indexes = {}
+_quantized_indexes = {}
+_pool_lock = threading.Lock()
+_embedding_warm = threading.Event()
+
+
+def _key(collection_path: str, collection_name: str):
+    # les chemins sont écrits avec des "\" ou des "/" selon les modules
+    return os.path.normpath(collection_path.replace("\\", "/")), collection_name
+
+
+def _pooled(collection_path: str, collection_name: str):
+    """
+    return : (collection, verrou de ses requêtes), lus ensemble sous _pool_lock ; la collection est rouverte (avec
+             un nouveau verrou) quand sa version a changé, ex: ré-ingestion par un autre processus
+    """
+    key = _key(collection_path, collection_name)
+    version = collection_version(collection_path, collection_name)
+    with _pool_lock:
+        entry = _collections.get(key)
+        if entry is None or entry[0] != version:
+            path, name = key
+            client = _clients.get(path)
+            if client is None:
+                client = chromadb.PersistentClient(path=path)
+                _clients[path] = client
+            collection = client.get_collection(name=name, embedding_function=embedding_function)
+            entry = (version, collection, threading.Lock())
+            _collections[key] = entry
+    return entry[1], entry[2]
+
+
+def get_collection(collection_path: str, collection_name: str):
+    """
+    return : la collection Chroma ouverte, partagée par tous les appels (ouverte au premier appel)
+    """
+    return _pooled(collection_path, collection_name)[0]
+
+
+def query_collection(collection_path: str, collection_name: str, query_texts: list[str], n_results: int) -> dict:
+    """
+    Interroge une collection du pool. Thread-safe : les requêtes sur une même collection sont sérialisées.
+    return : le résultat brut de collection.query
+    """
+    if RETRIEVAL_BACKEND == "quantized":
+        index = get_quantized_index(collection_path, collection_name)
+        if index is not None:
+            result = index.query(query_embedding_function(query_texts), n_results)
+            _embedding_warm.set()
+            return result
+    collection, lock = _pooled(collection_path, collection_name)
+    with lock:
+        # les requêtes sont encodées par le cache d'embeddings (micro-batchs), pas par la collection
+        result = collection.query(query_embeddings=query_embedding_function(query_texts), n_results=n_results)
+    _embedding_warm.set()
+    return result
+
+
+def warm_up_embeddings():
+    """
+    Premier encodage (chargement des poids, initialisation de torch) ; à lancer en tâche de fond au démarrage.
+    Tant qu'il n'est pas terminé, hybrid_query répond avec l'index lexical seul.
+    """
+    embedding_function(["warm up"])
+    _embedding_warm.set()
+
+
+def is_embedding_warm() -> bool:
+    return _embedding_warm.is_set()
+
+
+def get_lexical_index(collection_path: str, collection_name: str):
+    """
+    return : l'index BM25 construit à l'ingestion pour cette collection, None s'il n'existe pas
+    """
+    key = _key(collection_path, collection_name)
+    # rechargé quand la collection a été ré-ingérée (l'index est réécrit à chaque ingestion qui modifie la collection)
+    version = collection_version(collection_path, collection_name)
+    cached = _lexical_indexes.get(key)
+    if cached is None or cached[0] != version:
+        with _pool_lock:
+            cached = _lexical_indexes.get(key)
+            if cached is None or cached[0] != version:
+                path = index_path(*key)
+                cached = (version, BM25Index.load(path) if os.path.exists(path) else None)
+                _lexical_indexes[key] = cached
+    return cached[1]
+
+
+def get_quantized_index(collection_path: str, collection_name: str):
+    """
+    return : l'index compact de la collection (construit par utils.quantized_index.build_from_chroma), None s'il n'existe pas
+    """
+    key = _key(collection_path, collection_name)
+    # version courante désignée par le fichier CURRENT : une reconstruction est vue dès sa bascule
+    path = current_path(*key)
+    cached = _quantized_indexes.get(key)
+    if cached is None or cached[0] != path:
+        with _pool_lock:
+            cached = _quantized_indexes.get(key)
+            if cached is None or cached[0] != path:
+                cached = (path, QuantizedIndex(path) if path else None)
+                _quantized_indexes[key] = cached
+    return cached[1]
+
+
+def hybrid_query(collection_path: str, collection_name: str, query: str, n_results: int,
+                 n_candidates: int = 20, mode: str = "hybrid") -> dict:
+    """
+    Recherche hybride : résultats denses (Chroma) et lexicaux (BM25) fusionnés par reciprocal rank fusion.
+    arg : mode ("hybrid", "dense" ou "lexical") ; "hybrid" passe en lexical seul si le modèle d'embedding n'est pas chaud,
+          et en dense seul si la collection n'a pas d'index lexical
+    return : un résultat au format de collection.query (ids, documents, metadatas, distances) pour une seule requête
+    """
+    return hybrid_query_batch(collection_path, collection_name, [query], n_results, n_candidates, mode)
+
+
+def hybrid_query_batch(collection_path: str, collection_name: str, queries: list[str], n_results: int,
+                       n_candidates: int = 20, mode: str = "hybrid") -> dict:
+    """
+    Recherche hybride de plusieurs requêtes : un seul encodage par lot et une seule requête dense pour toutes,
+    puis fusion (reciprocal rank fusion) avec les résultats lexicaux requête par requête.
+    return : un résultat au format de collection.query, une liste par requête ;
+             la distance d'un document trouvé seulement par BM25 est None
+    """
+    index = get_lexical_index(collection_path, collection_name)
+    if index is None:
+        mode = "dense"
+    elif mode == "hybrid" and not is_embedding_warm():
+        mode = "lexical"
+
+    dense = None
+    if mode in ("hybrid", "dense"):
+        dense = query_collection(collection_path, collection_name, queries,
+                                 n_results=n_results if mode == "dense" else n_candidates)
+
+    result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    for i, query in enumerate(queries):
+        rankings, documents, metadatas, distances = [], {}, {}, {}
+        if dense is not None:
+            rankings.append(dense["ids"][i])
+            documents.update(zip(dense["ids"][i], dense["documents"][i]))
+            metadatas.update(zip(dense["ids"][i], dense["metadatas"][i]))
+            distances.update(zip(dense["ids"][i], dense["distances"][i]))
+        if mode in ("hybrid", "lexical"):
+            hits = index.search(query, k=n_candidates)
+            rankings.append([index.ids[position] for position, _ in hits])
+            for position, _ in hits:
+                documents.setdefault(index.ids[position], index.documents[position])
+                metadatas.setdefault(index.ids[position], index.metadatas[position])
+        ids = reciprocal_rank_fusion(rankings)[:n_results]
+        result["ids"].append(ids)
+        result["documents"].append([documents[d] for d in ids])
+        result["metadatas"].append([metadatas[d] for d in ids])
+        result["distances"].append([distances.get(d) for d in ids])
+    return result
+
+
+def format_contexts(context_list: list[str]) -> str:
+    # Ajoute les entêtes "Contexte 1:", etc.
+    return "\n\n".join(
+        f"Contexte {i + 1} :\n{doc}" for i, doc in enumerate(context_list)
+    )
+
+
+def format_batched_contexts(groups: list[list[str]], result: dict) -> list[str]:
+    """
+    Met en forme les résultats d'une recherche groupée, en dédupliquant les contextes communs à plusieurs requêtes :
+    un contexte déjà cité (par une autre requête ou un autre appel) est remplacé par un renvoi à son numéro.
+    arg : groups (requêtes de chaque appel du tool, dans l'ordre de la recherche), result (résultat de hybrid_query_batch)
+    return : le texte de chaque appel
+    """
+    single = sum(len(group) for group in groups) == 1
+    seen = {}
+    texts, i = [], 0
+    for group in groups:
+        parts = []
+        for query in group:
+            lines = []
+            for doc_id, doc in zip(result["ids"][i], result["documents"][i]):
+                if doc_id in seen:
+                    lines.append(f"(voir Contexte {seen[doc_id]})")
+                else:
+                    seen[doc_id] = len(seen) + 1
+                    lines.append(f"Contexte {seen[doc_id]} :\n{doc}")
+            # une seule requête : même format que format_contexts
+            parts.append("\n\n".join(lines) if single else f"Question : {query}\n\n" + "\n\n".join(lines))
+            i += 1
+        texts.append("\n\n".join(parts))
+    return texts
+
+
+def retrieve_groups(collection_path: str, collection_name: str, groups: list[list[str]], packing: PackingConfig) -> list[str]:
+    """
+    Une seule recherche groupée pour les requêtes de plusieurs appels du tool retrieve_context :
+    packing.n_candidates candidats par requête, filtrés et réduits au budget de tokens de l'agent (utils.context_packing).
+    return : les contextes mis en forme (et dédupliqués) de chaque appel
+    """
+    queries = [query for group in groups for query in group]
+    if not queries:
+        return ["" for _ in groups]
+    start = time.perf_counter()
+    result = hybrid_query_batch(collection_path, collection_name, queries, packing.n_candidates)
+    contexts = format_batched_contexts(groups, pack_result(groups, result, packing))
+    record(packing, contexts, time.perf_counter() - start)
+    return contexts
+
+
+def invalidate_collection(collection_path: str, collection_name: str):
+    """
+    Retire une collection et ses index du pool (appelé par l'ingestion après une ré-ingestion dans le même processus) ;
+    ils seront rouverts au prochain appel.
+    """
+    with _pool_lock:
+        key = _key(collection_path, collection_name)
+        _collections.pop(key, None)
+        _lexical_indexes.pop(key, None)
+        _quantized_indexes.pop(key, None)
+
+
+def collection_version(collection_path: str, collection_name: str) -> str:
+    """
+    Version de la collection, qui change à chaque ré-ingestion (date de modification de la base Chroma).
+    Sert à invalider les caches construits sur d'anciens contextes.
+    """
+    path, name = _key(collection_path, collection_name)
+    try:
+        mtime = os.path.getmtime(os.path.join(path, "chroma.sqlite3"))
+    except OSError:
+        mtime = 0
+    return f"{name}@{mtime}"
+
+
+def benchmark_warm_query(collection_path: str, collection_name: str, query: str, n_runs: int = 10) -> dict:
+    """
+    Latence d'une requête avant (modèle d'embedding et client Chroma recréés à chaque appel)
+    et après (modèle chaud et collection du pool).
+    """
+    def query_cold():
+        ef = SentenceTransformerEmbeddingFunction(model_name="intfloat/multilingual-e5-large")
+        client = chromadb.PersistentClient(path=collection_path)
+        collection = client.get_collection(name=collection_name, embedding_function=ef)
+        return collection.query(query_texts=[query], n_results=3)
+
+    before = [timed(query_cold)[1] for _ in range(min(n_runs, 3))]
+    query_collection(collection_path, collection_name, [query], 3)   # chauffe le pool
+    after = [timed(query_collection, collection_path, collection_name, [query], 3)[1] for _ in range(n_runs)]
+    return {"before": summarize(before), "after": summarize(after)}
+
+
+def benchmark_hybrid(collection_path: str, collection_name: str, n_queries: int = 50, k: int = 3, seed: int = 0) -> dict:
+    """
+    Recall@k et latence des modes dense, lexical et hybride.
+    Les requêtes sont des extraits de 6 mots tirés des chunks eux-mêmes (le chunk d'origine est la bonne réponse) :
+    elles imitent les questions contenant des termes exacts (noms propres, codes, chiffres).
+    """
+    index = get_lexical_index(collection_path, collection_name)
+    rng = random.Random(seed)
+    samples = []
+    for position in rng.sample(range(len(index.ids)), min(n_queries, len(index.ids))):
+        words = index.documents[position].split()
+        start = rng.randrange(max(1, len(words) - 6))
+        samples.append((" ".join(words[start:start + 6]), index.ids[position]))
+
+    warm_up_embeddings()
+    results = {}
+    for mode in ("dense", "lexical", "hybrid"):
+        found, latencies = 0, []
+        for query, expected in samples:
+            result, duration = timed(hybrid_query, collection_path, collection_name, query, k, mode=mode)
+            found += expected in result["ids"][0]
+            latencies.append(duration)
+        results[mode] = {f"recall@{k}": found / len(samples), **summarize(latencies)}
+    return results
+
+
+def benchmark_multi_query(collection_path: str, collection_name: str, queries: list[str], n_results: int = 3,
+                          sizes=(1, 3, 5), n_runs: int = 5) -> dict:
+    """
+    Latence de la recherche pour une question décomposée en 1, 3 ou 5 sous-questions :
+    un appel par sous-question lancé en parallèle (comme ToolNode) vs un seul appel groupé (hybrid_query_batch).
+    Le cache d'embeddings est contourné (requêtes suffixées à chaque passage) pour mesurer l'encodage.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    warm_up_embeddings()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(sizes)) as pool:
+        for size in sizes:
+            separate, batched = [], []
+            for run in range(n_runs):
+                subqueries = [f"{q} ({run})" for q in random.Random(run).sample(queries, size)]
+                separate.append(timed(lambda: list(pool.map(
+                    lambda q: hybrid_query(collection_path, collection_name, q, n_results), subqueries)))[1])
+                subqueries = [f"{q} [{run}]" for q in subqueries]
+                batched.append(timed(hybrid_query_batch, collection_path, collection_name, subqueries, n_results)[1])
+            results[size] = {"separate": summarize(separate), "batched": summarize(batched)}
+    return results
+
+
+def benchmark_packing(collection_path: str, collection_name: str, queries: list[str], n_results: int,
+                      packing: PackingConfig) -> dict:
+    """
+    Compare un nombre fixe de contextes (n_results) et la sélection par budget (packing) :
+    tokens de contexte par question (distribution) et latence de la recherche.
+    """
+    warm_up_embeddings()
+    results = {}
+    for mode in ("fixed", "packed"):
+        tokens, latencies = [], []
+        for query in queries:
+            if mode == "fixed":
+                result, duration = timed(hybrid_query, collection_path, collection_name, query, n_results)
+                text = format_contexts(result["documents"][0])
+            else:
+                (text,), duration = timed(retrieve_groups, collection_path, collection_name, [[query]], packing)
+            tokens.append(estimate_tokens(text))
+            latencies.append(duration)
+        tokens.sort()
+        results[mode] = {"mean_tokens": round(sum(tokens) / len(tokens), 1), "p95_tokens": tokens[int(0.95 * (len(tokens) - 1))],
+                         "max_tokens": tokens[-1], **summarize(latencies)}
+    return results
+
+
+# ---- TESTS ----
+# print(benchmark_hybrid("Agent/info_UVSQ/DBv", "UVSQ_DOCS", n_queries=100, k=3))
+# from utils.embedding_cache import benchmark_throughput
+# print(benchmark_throughput(embedding_function, ["Quels services de restauration sont disponibles sur le campus de Mantes ?"], n_concurrent=50))
+# from Agent.info_UVSQ.info_UVSQ import queries
+# print(benchmark_multi_query("Agent/info_UVSQ/DBv", "UVSQ_DOCS", queries, n_results=3))
+# from utils.context_packing import PackingConfig
+# print(benchmark_packing("Agent/info_UVSQ/DBv", "UVSQ_DOCS", queries, 3, PackingConfig("info_UVSQ", token_budget=1200)))
+# print(benchmark_warm_query("Agent/info_UVSQ/DBv", "UVSQ_DOCS", "Quand peut-on faire une demande de logement via le CROUS ?"))
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from utils.utils import query_embedding_function
+from utils import metrics
+import numpy as np
+import threading
+import asyncio
+import logging
+import time
+import itertools
+
+
+@dataclass
+class CacheEntry:
+    agent: str
+    query: str
+    vector: np.ndarray
+    answer: str
+    version: str
+    created: float
+    latency: float   # durée de la génération initiale, économisée à chaque hit
+
+
+class SemanticCache:
+    """
+    Cache de réponses partagé entre les sessions, indexé par l'embedding de la question et le nom de l'agent.
+    Une question dont la similarité cosinus avec une question en cache dépasse `threshold` reçoit la réponse en cache.
+    Les entrées expirent après `ttl` secondes, les moins récemment utilisées sont évincées au-delà de `max_size`,
+    et celles calculées sur une autre version de la collection Chroma (ré-ingestion) sont ignorées puis supprimées.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 24 * 3600, max_size: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def embed(query: str) -> np.ndarray:
+        vector = np.asarray(query_embedding_function([query])[0], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, agent: str, vector: np.ndarray, version: str):
+        """
+        return : la réponse en cache la plus proche si elle dépasse le seuil de similarité, None sinon
+        """
+        now = time.time()
+        with self._lock:
+            stale = [k for k, e in self.entries.items()
+                     if now - e.created > self.ttl or (e.agent == agent and e.version != version)]
+            for k in stale:
+                del self.entries[k]
+            candidates = [(k, e) for k, e in self.entries.items() if e.agent == agent]
+            if candidates:
+                similarities = np.vstack([e.vector for _, e in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self.entries.move_to_end(key)
+                    metrics.incr(f"semantic_cache.{agent}.hits")
+                    metrics.incr(f"semantic_cache.{agent}.latency_saved_s", entry.latency)
+                    logging.info(f"[CACHE] hit pour '{agent}' (similarité={similarities[best]:.3f}) : '{entry.query}'")
+                    return entry.answer
+        metrics.incr(f"semantic_cache.{agent}.misses")
+        return None
+
+    def store(self, agent: str, query: str, vector: np.ndarray, answer: str, version: str, latency: float):
+        if not answer:
+            return
+        with self._lock:
+            self.entries[next(self._ids)] = CacheEntry(agent, query, vector, answer, version, time.time(), latency)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, agent: str = None):
+        with self._lock:
+            for k in [k for k, e in self.entries.items() if agent is None or e.agent == agent]:
+                del self.entries[k]
+
+    @staticmethod
+    def stats(agent: str) -> dict:
+        hits, misses = metrics.get(f"semantic_cache.{agent}.hits"), metrics.get(f"semantic_cache.{agent}.misses")
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "latency_saved_s": round(metrics.get(f"semantic_cache.{agent}.latency_saved_s"), 3),
+        }
+
+
+# instance partagée par tout le processus
+answer_cache = SemanticCache()
+
+
+async def stream_with_cache(agent: str, query: str, version: str, tokens):
+    """
+    Enveloppe le stream de réponse d'un agent : renvoie la réponse en cache si une question proche a déjà été traitée,
+    sinon streame la réponse et la met en cache.
+    arg : agent (nom de l'agent), version (version de la collection interrogée), tokens (générateur asynchrone de tokens)
+    """
+    start = time.perf_counter()
+    vector = await asyncio.to_thread(answer_cache.embed, query)
+    cached = answer_cache.lookup(agent, vector, version)
+    if cached is not None:
+        await tokens.aclose()
+        yield cached
+        return
+    answer = ""
+    async for token in tokens:
+        answer += token
+        yield token
+    answer_cache.store(agent, query, vector, answer, version, time.perf_counter() - start)
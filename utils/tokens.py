@@ -0,0 +1,6 @@
+# Estimation du nombre de tokens d'un texte, sans tokenizer : ~4 caractères par token pour le français avec Mistral.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -1,5 +1,6 @@
 from langchain_mistralai import ChatMistralAI
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from utils.embedding_cache import CachedEmbeddingFunction
 from dotenv import load_dotenv
 load_dotenv()
 import os
@@ -11,5 +12,7 @@ llm = ChatMistralAI(
             temperature=0,
             max_retries=5
         )
-# modèle d'embedding
+# modèle d'embedding : instance unique partagée par le processus (routage, retrieval, ingestion)
 embedding_function = SentenceTransformerEmbeddingFunction(model_name="intfloat/multilingual-e5-large")
+# encodage des requêtes : cache LRU + micro-batchs devant le modèle d'embedding (les documents ingérés passent par embedding_function)
+query_embedding_function = CachedEmbeddingFunction(embedding_function)